@@ -1,13 +1,282 @@
-from typing import List, Union, Generator, Iterator, Optional, Dict, Any
+from typing import (
+    List,
+    Union,
+    Generator,
+    Iterator,
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Optional,
+    Dict,
+    Any,
+    Iterable,
+    Tuple,
+)
 from pprint import pprint
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed
+from concurrent.futures import wait as wait_futures
+from contextvars import ContextVar, copy_context
+from email.utils import parsedate_to_datetime
+import asyncio
 import time
 from datetime import datetime
+import hashlib
 import json
+import os
+import random
 import re
+import sqlite3
+import threading
+import uuid
+import weakref
+import zlib
 
-from openai import OpenAI
+from openai import APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI, OpenAI
+import httpx
 import requests
 
+try:
+    import tiktoken
+except ImportError:  # без tiktoken токены оцениваются по длине текста
+    tiktoken = None
+
+# Состояние текущего запуска pipe/apipe (бюджет времени и т. п.). Передаётся
+# в потоки пулов через copy_context, в задачи asyncio — автоматически.
+_run_state: ContextVar[Optional[Dict[str, Any]]] = ContextVar("skai_run_state", default=None)
+
+# Клиенты API, HTTP-сессии и токенизатор общие для всех экземпляров Pipeline в процессе:
+# создаются при первом обращении и переиспользуются (пулы соединений, TLS-сессии).
+# Асинхронные клиенты привязаны к циклу событий — свой набор на каждый живой цикл
+_shared_clients: Dict[Tuple[Any, ...], Any] = {}
+_loop_clients: "weakref.WeakKeyDictionary[Any, Dict[Tuple[Any, ...], Any]]" = (
+    weakref.WeakKeyDictionary()
+)
+_clients_lock = threading.Lock()
+
+# Лимиты провайдеров общие для всех экземпляров Pipeline в процессе: корзины запросов
+# и токенов на пару (провайдер, модель), уточняемые по заголовкам x-ratelimit-*
+_rate_buckets: Dict[Tuple[str, str], Dict[str, float]] = {}
+_rate_lock = threading.Lock()
+# Длительность сброса лимита в заголовках OpenAI: «20ms», «1s», «6m0s», «1h30m»
+_RESET_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_RESET_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+# Структура повестки: строка пункта «N. ...» и пункт целиком до следующего номера
+_NUMBERED_LINE_RE = re.compile(r"^(\d+)\.\s+", re.MULTILINE)
+_AGENDA_ITEM_RE = re.compile(r"(\d+)\.\s*([^\n]+(?:\n(?!\d+\.)[^\n]*)*)", re.MULTILINE)
+# Структурированный вывод (JSON Schema) для препроцессинга и запросов подагентов
+_QUERIES_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "vnd_query": {"type": "string"},
+        "legal_query": {"type": "string"},
+        "web_query": {"type": "string"},
+    },
+    "required": ["vnd_query", "legal_query", "web_query"],
+    "additionalProperties": False,
+}
+_QUERIES_FORMAT: Dict[str, Any] = {
+    "type": "json_schema",
+    "name": "agent_queries",
+    "schema": _QUERIES_SCHEMA,
+    "strict": True,
+}
+_AGENDA_ITEMS_SCHEMA: Dict[str, Any] = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string"},
+            "details": {"type": "string"},
+        },
+        "required": ["title", "details"],
+        "additionalProperties": False,
+    },
+}
+_PREPROCESS_FORMAT: Dict[str, Any] = {
+    "type": "json_schema",
+    "name": "agenda_preprocess",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "items": _AGENDA_ITEMS_SCHEMA,
+            **_QUERIES_SCHEMA["properties"],
+        },
+        "required": ["items", *_QUERIES_SCHEMA["required"]],
+        "additionalProperties": False,
+    },
+    "strict": True,
+}
+# Фрагмент большой повестки: только пункты, запросы строятся по итоговому тексту
+_PREPROCESS_CHUNK_FORMAT: Dict[str, Any] = {
+    "type": "json_schema",
+    "name": "agenda_preprocess_chunk",
+    "schema": {
+        "type": "object",
+        "properties": {"items": _AGENDA_ITEMS_SCHEMA},
+        "required": ["items"],
+        "additionalProperties": False,
+    },
+    "strict": True,
+}
+# Граница пункта в «сыром» документе: «N.» или «N)» в начале строки
+_ITEM_BOUNDARY_RE = re.compile(r"^[ \t]*\d+[.)][ \t]+", re.MULTILINE)
+# Грубая оценка без токенизатора: символов кириллицы на токен
+_CHARS_PER_TOKEN = 3
+# Разделитель общего запроса агента и текста пункта в полезной нагрузке
+_PAYLOAD_CONTEXT_SEP = "\n\nКонтекст:\n"
+# Глобальный контекст повестки: компании в кавычках, суммы в тенге, темы
+_COMPANY_RE = re.compile(r'[«"]([^"»]{3,})[»"]')
+_AMOUNT_RE = re.compile(
+    r"(\d{1,3}(?:[\s,]\d{3})*(?:[.,]\d+)?\s*(?:млрд|млн|тыс)?\s*тенге)", re.IGNORECASE
+)
+_TOPIC_KEYWORDS = (
+    "бюджет",
+    "крупная сделка",
+    "приобретение",
+    "назначение",
+    "дивиденды",
+    "займ",
+    "кредит",
+    "облигации",
+    "капзатраты",
+    "закуп",
+    "реорганизация",
+    "аудит",
+    "стратегия",
+)
+# Перекрытие фрагментов: ключевое слово может оказаться разрезанным на стыке
+_TOPIC_OVERLAP = max(len(keyword) for keyword in _TOPIC_KEYWORDS) - 1
+# Сколько символов у конца фрагмента регулярки просматривают повторно со следующим
+_CONTEXT_SCAN_GUARD = 256
+# Реестр промптов. Статические инструкции байт-в-байт одинаковы от запуска к запуску
+# (без подстановок и отступов тройных кавычек), а переменное содержимое — повестка,
+# анализы, запросы — всегда идёт после них: так префикс запроса попадает в кэш
+# промптов OpenAI. prompt_cache_key запроса — "skai-<имя промпта>".
+_PROMPTS: Dict[str, str] = {
+    "preprocess": (
+        "Вы — редактор повесток дня и помощник виртуального директора. "
+        "1) Преобразуйте входной документ в чистый список пунктов: для каждого пункта — "
+        "краткий заголовок (title) и последующие строки с деталями (details, пустая строка "
+        "при их отсутствии). Удалите нерелевантные блоки (шапки, подписи, приложения, "
+        "служебные таблицы). Сохраните существенные формулировки."
+    ),
+    "preprocess_queries": (
+        " 2) На основе ПОЛНОГО текста повестки сформируйте три самодостаточных запроса для "
+        "подагентов: vnd_query (внутренние документы), legal_query (законодательство РК), "
+        "web_query (новости и реакция)."
+    ),
+    "preprocess_input": "Преобразуйте исходный текст повестки согласно требованиям.",
+    "queries": (
+        "Вы — помощник виртуального директора. На основе ПОЛНОГО текста повестки дня "
+        "сформируйте три самодостаточных запроса для подагентов: vnd_query, legal_query, "
+        "web_query. Ответ СТРОГО JSON."
+    ),
+    "queries_input": (
+        "Используйте полный текст повестки целиком для формирования ТРЁХ запросов."
+    ),
+    "synthesis": """Вы — виртуальный директор, член Совета директоров АО «Самрук-Казына».
+Ваша задача — принять взвешенное решение по пункту повестки дня на основе
+предоставленных анализов.
+
+ПРИНЦИПЫ ПРИНЯТИЯ РЕШЕНИЙ:
+1. Соблюдение законодательства — приоритет №1
+2. Соответствие внутренним политикам компании
+3. Минимизация репутационных рисков
+4. Экономическая целесообразность
+5. Прозрачность и подотчетность
+
+ФОРМАТ ОТВЕТА:
+Решение: ЗА/ПРОТИВ
+Обоснование: [детальное обоснование с ссылками на источники]
+Риски: [выявленные риски]
+Рекомендации: [рекомендации по реализации или доработке]
+
+Будьте объективны, консервативны в оценке рисков, и всегда ссылайтесь
+на конкретные источники информации.""",
+    "synthesis_input": (
+        "Проанализируйте следующую информацию и примите решение ЗА или ПРОТИВ данного "
+        "пункта повестки, дав подробное обоснование."
+    ),
+    "late_synthesis": """Вы — виртуальный директор, член Совета директоров АО «Самрук-Казына».
+Предварительное решение по пункту повестки принято до поступления части
+анализов. Проверьте, меняют ли поступившие позже данные решение, и
+пересмотрите его только если они этого требуют.
+
+ФОРМАТ ОТВЕТА:
+Решение: ЗА/ПРОТИВ
+Обоснование: [обоснование с учётом новых данных и ссылками на источники]
+Риски: [выявленные риски]
+Рекомендации: [рекомендации по реализации или доработке]""",
+    "internal_compliance": """Проанализируйте пункт повестки дня, приведённый ниже, на соответствие
+внутренним документам компании.
+
+Необходимо проверить:
+- Соответствие внутренним политикам и процедурам
+- Требования к процессу принятия решений
+- Полномочия органов управления
+- Возможные ограничения или требования
+
+Пункт повестки дня:""",
+    "legal_compliance": """Проведите правовой анализ пункта повестки дня, приведённого ниже.
+
+Необходимо проверить:
+- Соответствие действующему законодательству РК
+- Требования к процедуре принятия решения
+- Необходимые согласования и разрешения
+- Правовые риски и ограничения
+- Ответственность за нарушения
+
+Пункт повестки дня:""",
+    "public_reaction": """Проанализируйте возможную общественную и медийную реакцию на решение,
+приведённое ниже.
+
+Найдите:
+- Похожие случаи и реакцию на них
+- Мнения экспертов по подобным вопросам
+- Потенциальные репутационные риски
+- Общественное мнение по теме
+- Рекомендации по коммуникации
+
+Решение:""",
+    "web_search": """Найдите актуальную информацию по запросу, приведённому ниже.
+
+Сосредоточьтесь на:
+- Новостях и событиях в Казахстане
+- Официальных заявлениях и документах
+- Экономических и финансовых данных
+- Репутационных аспектах
+- Мнениях экспертов и аналитиков
+
+Предоставьте структурированный ответ с указанием источников.
+
+Запрос:""",
+    "web_fallback": """Найдите актуальную информацию в интернете по запросу, приведённому ниже.
+
+Особое внимание уделите:
+- Казахстанским источникам и контексту
+- Новостям за последние месяцы
+- Официальным заявлениям
+- Репутационным рискам или возможностям
+- Экспертным оценкам
+
+Сосредоточьтесь на поиске информации с казахстанских сайтов:""",
+}
+# Предложения для экстрактивного сжатия разделов промпта синтеза
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?…;])\s+|\n+")
+# Признаки «содержательного» предложения: числа, названия в кавычках, нормы и риски
+_SALIENT_RE = re.compile(
+    r"\d|[«\"]|стать|пункт|п\.\s|риск|наруш|запрещ|требова|обязан|тенге|штраф|санкци",
+    re.IGNORECASE,
+)
+# Служебные строки (приложения, подписи, таблицы), которые должен вычищать препроцессинг
+_SERVICE_LINE_RE = re.compile(r"^(?:приложени[еяй]|подпис|исп\.|тел\.|\||```)", re.IGNORECASE)
+# Повторное подключение к задаче из чата: «задача <id>» или «job <id>»
+_JOB_REFERENCE_RE = re.compile(r"^\s*(?:job|задача)\s*[:#№]?\s*([0-9a-f]{32})\s*$", re.IGNORECASE)
+
 
 class Pipeline:
     """Пайплайн анализа повестки без вспомогательных классов."""
@@ -22,13 +291,9 @@ class Pipeline:
         self.author = "Aubakirov Arman"
 
         # Конфигурация API (ключи берём из переменных окружения)
-        import os
+        # (наличие проверяется в on_startup)
         self._openai_api_key = os.getenv("OPENAI_API_KEY", "")
         self._perplexity_api_key = os.getenv("PERPLEXITY_API_KEY", "")
-        if not self._openai_api_key:
-            print("[WARN] OPENAI_API_KEY не установлен в окружении.")
-        if not self._perplexity_api_key:
-            print("[WARN] PERPLEXITY_API_KEY не установлен в окружении.")
         self._vnd_vector_store_id = "vs_68ca35e446f88191b4aaf4101e259c37"
         self._legal_vector_store_id = "vs_68ca362ea4208191b5724a0e7bb83b21"
         self._kz_sites = [
@@ -46,12 +311,205 @@ class Pipeline:
             "informburo.kz",
             "kapital.kz",
         ]
+        # Минимальный интервал между событиями для UI (сек); 0 — без искусственных пауз.
+        # В pipe пауза — time.sleep в потоке сервера, занимающая его на время ожидания;
+        # если пауза нужна, используйте apipe: там она не блокирует event loop
+        self.status_pacing_seconds = 0.0
+        # HTTP-клиент Perplexity: общая сессия с пулом соединений и keep-alive
+        self._perplexity_url = os.getenv(
+            "PERPLEXITY_API_URL", "https://api.perplexity.ai/chat/completions"
+        )
+        self.http_pool_size = 16
+        self.http_connect_timeout = 5.0
+        self.http_read_timeout = 30.0
+        # При старте сервера клиенты создаются заранее и открывают соединения
+        # с OpenAI и Perplexity, чтобы первая повестка не платила за холодный старт
+        self.warm_up_on_startup = True
+        # Устойчивость к сбоям: экспоненциальная задержка с jitter (с учётом Retry-After),
+        # общий бюджет времени на запуск и размыкатель цепи для каждого бэкенда
+        self.retry_attempts = {"openai": 4, "perplexity": 2}
+        self.retry_base_delay = 0.5
+        self.retry_max_delay = 20.0
+        self.openai_timeout = 120.0
+        self.request_deadline_seconds = 600.0
+        self.breaker_failure_threshold = 5
+        self.breaker_cooldown_seconds = 60.0
+        self._breakers: Dict[str, Dict[str, float]] = {}
+        self._breaker_lock = threading.Lock()
+        # Ограничения на провайдера: одновременных запросов, запросов и токенов в минуту.
+        # Ключ — "openai" или "openai/<модель>" (точнее); нет ключа — лимит берётся
+        # из заголовков x-ratelimit-limit-* ответов провайдера, если они есть
+        self.provider_concurrency: Dict[str, int] = {}
+        self.provider_requests_per_minute: Dict[str, int] = {}
+        self.provider_tokens_per_minute: Dict[str, int] = {}
+        self._provider_slots: Dict[Any, Any] = {}
+        self._provider_lock = threading.Lock()
+        # Метрики: длительность этапов, агентов и вызовов бэкендов, расход токенов.
+        # Каждое событие уходит во внутренний агрегатор и во все подключённые приёмники.
+        self.metrics_sinks: List[Callable[[Dict[str, Any]], None]] = []
+        self._metrics: Dict[str, Dict[str, Dict[str, float]]] = {
+            "stage": {},
+            "agent": {},
+            "call": {},
+            "tokens": {},
+            "prompt": {},
+        }
+        self._metrics_lock = threading.Lock()
+        # Подагенты ВНД, правовой и веб-анализ независимы — запускаем их параллельно
+        self.max_agent_workers = 3
+        # Бюджет задержки подагентов. Агенты из speculative_agents (веб) обязательными
+        # не считаются: когда ВНД и правовой анализ готовы, их ждут лишь до
+        # agent_soft_deadline_seconds от старта агентов (0 — ждать всех), и синтез
+        # начинается по неполным данным. Поздний результат, пришедший в течение
+        # agent_late_wait_seconds после синтеза, по late_agent_policy либо даёт
+        # дешёвый пересинтез ("resynthesize"), либо прикладывается дополнением
+        # ("addendum"); не пришедший — отмечается в отчёте как отсутствующий
+        self.speculative_agents = ("web_search",)
+        self.agent_soft_deadline_seconds = 20.0
+        self.agent_late_wait_seconds = 30.0
+        self.late_agent_policy = "resynthesize"
+        self.late_synthesis_model = "gpt-4o-mini"
+        # Бюджет токенов на контекст синтеза (пункт + анализы агентов). Разделы,
+        # не влезающие в бюджет, сжимаются экстрактивно, начиная с самых длинных;
+        # 0 — без ограничения
+        self.synthesis_context_tokens = 20000
+        # Режим анализа: "global" — один сводный проход по всей повестке,
+        # "per_item" — подагенты и синтез решения для каждого пункта отдельно
+        self.analysis_mode = "global"
+        # Сколько пунктов повестки анализируется одновременно в режиме per_item
+        self.max_item_workers = 4
+        # Инкрементальный режим (для per_item): пункты, не изменившиеся с прошлого
+        # запуска, берутся из сохранённых анализов без повторного вызова агентов
+        self.incremental_analysis = False
+        # Потоковая выдача: текст решения и разделы отчёта отдаются по мере готовности
+        self.stream_output = False
+        # Формат результата: "text" — читаемый отчёт; "json" — один компактный документ;
+        # "ndjson" — события агентов, решений по пунктам и сводки строка за строкой
+        # по мере готовности. Тексты агентов и повестки в обоих машинных форматах
+        # хранятся один раз и указываются по ссылке (*_ref)
+        self.output_format = "text"
+        # Повестка, уже размеченная как «1. ... 2. ...», нормализуется локально без gpt-4o;
+        # препроцессинг через модель остаётся только для «грязных» документов
+        self.local_preprocess = True
+        # Большие повестки препроцессируются по фрагментам параллельно (map-reduce).
+        # Ответ модели по объёму близок к фрагменту, поэтому предел — ниже лимита вывода gpt-4o
+        self.preprocess_chunk_tokens = 6000
+        self.max_preprocess_workers = 4
+        # Одинаковые повестки, запрошенные одновременно (несколько членов совета открыли
+        # один пакет материалов), анализируются один раз: остальные запросы подписываются
+        # на те же события статуса и отчёт. Ключ — хэш нормализованного текста повестки
+        self.coalesce_identical_requests = True
+        self._flights: Dict[str, Dict[str, Any]] = {}
+        self._flights_lock = threading.Lock()
+        self._flight_stats = {"leader": 0, "follower": 0}
+        # Режим задач: повестка ставится в очередь SQLite и анализируется фоновыми
+        # воркерами, а pipe лишь показывает события задачи. Отключение клиента не
+        # прерывает анализ; сообщение «задача <id>» заново показывает все события
+        # задачи с начала и продолжает следить за ней. Зависшая задача (воркер
+        # упал вместе с процессом) возвращается в очередь через job_stale_seconds
+        # без событий и перезапускается не более job_max_attempts раз
+        self.job_mode = False
+        self.job_workers = 2
+        self.jobs_path = os.getenv(
+            "SKAI_JOBS_PATH",
+            os.path.join(os.path.expanduser("~"), ".cache", "skai", "jobs.sqlite3"),
+        )
+        self.job_poll_seconds = 1.0
+        self.job_stale_seconds = 900.0
+        self.job_max_attempts = 2
+        self.job_ttl_seconds = 7 * 24 * 3600
+        self._jobs_db: Optional[sqlite3.Connection] = None
+        self._jobs_disk_failed = False
+        self._jobs_lock = threading.Lock()
+        self._jobs_cond = threading.Condition()
+        self._job_threads: List[threading.Thread] = []
+        self._jobs_stopping = threading.Event()
+
+        # Кэш ответов gpt-4o и Perplexity: LRU в памяти + SQLite на диске
+        self.cache_enabled = True
+        self.cache_max_entries = 512
+        self.cache_path = os.getenv(
+            "SKAI_CACHE_PATH",
+            os.path.join(os.path.expanduser("~"), ".cache", "skai", "responses.sqlite3"),
+        )
+        # Время жизни записей по источникам (сек): веб устаревает быстрее ВНД и права
+        self.cache_ttl = {
+            "preprocess": 7 * 24 * 3600,
+            "queries": 7 * 24 * 3600,
+            "internal_documents": 24 * 3600,
+            "legal_documents": 24 * 3600,
+            "synthesis": 24 * 3600,
+            "web_search": 3600,
+            "item_analysis": 7 * 24 * 3600,
+        }
+        self._cache_memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_db: Optional[sqlite3.Connection] = None
+        self._cache_disk_failed = False
+        self._cache_stats: Dict[str, Dict[str, int]] = {}
+        # Семантический кэш file_search (ВНД и законодательство): близкий по смыслу вопрос
+        # к тому же хранилищу отвечается локально по сходству векторов n-грамм.
+        # Числа и названия в кавычках обязаны совпадать точно (другая компания или сумма — промах)
+        self.semantic_cache_enabled = True
+        self.semantic_cache_threshold = 0.85
+        self.semantic_cache_max_entries = 256
+        # Раз в столько секунд сверяется состояние хранилища (файлы, объём);
+        # при изменении его записи сбрасываются. 0 — только ручной invalidate_vector_store
+        self.vector_store_check_seconds = 0.0
+        self._semantic_index: Dict[str, "OrderedDict[str, Dict[str, Any]]"] = {}
+        self._vector_store_state: Dict[str, Dict[str, Any]] = {}
+        self._semantic_lock = threading.Lock()
 
-        self._openai_client = OpenAI(api_key=self._openai_api_key)
+        # Клиенты берутся из общих реестров процесса (_openai, _http, _async_*);
+        # заданный здесь клиент экземпляра имеет приоритет над общим
+        self._openai_client: Optional[OpenAI] = None
+        self._async_openai_client: Optional[AsyncOpenAI] = None
+        self._async_http_client: Optional[httpx.AsyncClient] = None
+
+    async def on_startup(self):
+        # This function is called when the server is started.
+        print(f"on_startup: {__name__}")
+        if not self._openai_api_key:
+            print("[WARN] OPENAI_API_KEY не установлен в окружении.")
+        if not self._perplexity_api_key:
+            print("[WARN] PERPLEXITY_API_KEY не установлен в окружении.")
+        if self.warm_up_on_startup:
+            # pipe работает в потоках, apipe — в этом цикле событий: греем оба набора
+            await asyncio.gather(asyncio.to_thread(self.warm_up), self.awarm_up())
+        if self.job_mode:
+            # Задачи, оставшиеся в очереди с прошлого запуска, продолжаются сразу
+            self.start_job_workers()
 
     async def on_shutdown(self):
         # This function is called when the server is shutdown.
         print(f"on_shutdown: {__name__}")
+        self.stop_job_workers()
+        with _clients_lock:
+            shared = list(_shared_clients.items())
+            _shared_clients.clear()
+            loop_clients = _loop_clients.pop(asyncio.get_running_loop(), {})
+        for key, client in shared:
+            if key[0] in ("openai", "http"):
+                client.close()
+        for client in loop_clients.values():
+            if isinstance(client, httpx.AsyncClient):
+                await client.aclose()
+            else:
+                await client.close()
+        if self._async_http_client is not None:
+            await self._async_http_client.aclose()
+            self._async_http_client = None
+        if self._async_openai_client is not None:
+            await self._async_openai_client.close()
+            self._async_openai_client = None
+        with self._cache_lock:
+            if self._cache_db is not None:
+                self._cache_db.close()
+                self._cache_db = None
+        with self._jobs_lock:
+            if self._jobs_db is not None:
+                self._jobs_db.close()
+                self._jobs_db = None
 
     async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
         # This function is called before the OpenAI API request is made.
@@ -80,247 +538,2803 @@ class Pipeline:
         messages: List[dict],
         body: dict,
     ) -> Union[str, Generator, Iterator]:
-        agenda_text = ""
+        if self.job_mode:
+            return self._paced(self._job_events(user_message, body))
+        return self._paced(self._coalesced(body))
+
+    def apipe(
+        self,
+        user_message: str,
+        model_id: str,
+        messages: List[dict],
+        body: dict,
+    ) -> AsyncGenerator[Any, None]:
+        # Асинхронный вариант pipe: те же события статуса и отчёта, но без
+        # блокирующих вызовов — одна корутина на повестку вместо потока.
+        if self.job_mode:
+            return self._apaced(self._ajob_events(user_message, body))
+        return self._apaced(self._acoalesced(body))
+
+    def _run_pipe(
+        self, body: dict, outcome: Optional[Dict[str, Any]] = None
+    ) -> Generator[Any, None, None]:
+        # outcome (если передан) получает analysis_result или текст ошибки —
+        # для вызывающих без разбора событий, например skai_batch.py
+        agenda_text, contexts_count = self._extract_agenda_text(body)
+        for _ in range(contexts_count):
+            yield self._status_event("Context received")
+
+        # 1. Инициализация
+        yield self._status_event("Инициализация аналитического пайплайна...")
+
+        try:
+            # 2. Препроцессинг
+            yield self._status_event("Препроцессинг повестки дня...")
+            with self._timed("stage", "preprocess"):
+                # Запросы агентов приходят вместе с очищенным текстом, если
+                # повестку пришлось чистить через gpt-4o
+                summary_text, global_queries = self._preprocess_agenda_text(agenda_text)
+
+            # 3. Глобальный контекст и запросы
+            yield self._status_event("Извлекаем глобальный контекст...")
+            with self._timed("stage", "global_context"):
+                # Разбор пунктов выполняется один раз: и для подсчёта, и для per_item
+                agenda_items = self._parse_agenda(summary_text)
+                global_context = self._extract_global_context(summary_text, agenda_items)
+
+            yield self._status_event("Формируем запросы для агентов...")
+            if global_queries is None:
+                with self._timed("stage", "queries"):
+                    global_queries = self._generate_global_agent_queries(
+                        summary_text, global_context
+                    )
+
+            items = agenda_items if self.analysis_mode == "per_item" else []
+            timestamp = datetime.now().isoformat()
+            if items:
+                # 4-7. Анализ и синтез по каждому пункту на ограниченном пуле
+                yield self._status_event(self._items_started_status(items))
+                if self._stream_text_report():
+                    yield self._report_chunk(self._report_title_lines(timestamp, len(items)))
+                with self._timed("stage", "items"):
+                    if self.incremental_analysis:
+                        results = yield from self._analyze_items_incrementally(
+                            items, global_queries, self._item_scope(body, global_context)
+                        )
+                    else:
+                        results = yield from self._analyze_items_concurrently(
+                            items, global_queries
+                        )
+                global_analyses: Dict[str, Any] = {}
+            else:
+                # 4-6. Параллельный запуск подагентов (ВНД, право, веб)
+                yield self._status_event(
+                    "Запускаем подагентов: ВНД, правовой анализ, веб-поиск..."
+                )
+                payloads = self._agent_payloads(global_queries, summary_text)
+                with self._timed("stage", "agents"):
+                    analyses, late = yield from self._run_agents_concurrently(payloads)
+
+                # 7. Синтез решения (при опоздавших агентах — предварительный)
+                yield self._status_event(self._synthesis_status(late))
+                overall_item = self._overall_item(summary_text)
+                with self._timed("stage", "synthesis"):
+                    if self._stream_text_report():
+                        yield self._report_chunk(
+                            self._report_title_lines(timestamp, 1)
+                            + self._report_item_heading_lines(overall_item)
+                        )
+                        decision_result = yield from self._synthesize_decision_stream(
+                            overall_item, analyses
+                        )
+                    else:
+                        decision_result = self._synthesize_decision(overall_item, analyses)
+                    if late:
+                        decision_result = self._finish_late_agents(
+                            overall_item, analyses, decision_result, late
+                        )
+                        yield self._status_event(self._late_agents_status(decision_result))
+                    if self._stream_text_report():
+                        yield self._report_chunk(
+                            self._streamed_late_lines(decision_result) + ["", "", "=" * 80]
+                        )
+                results = [self._build_result_entry(overall_item, analyses, decision_result)]
+                global_analyses = analyses
+
+            analysis_result = self._build_analysis_result(
+                timestamp, results, global_analyses, summary_text, global_queries
+            )
+            if outcome is not None:
+                outcome["analysis_result"] = analysis_result
+
+            # 8. Формирование отчета
+            yield from self._report_events(analysis_result)
+        except Exception as exc:
+            if outcome is not None:
+                outcome["error"] = str(exc)
+            error_message = f"Ошибка анализа повестки: {exc}"
+            yield self._status_event(error_message)
+            yield self._error_output(error_message)
+        finally:
+            yield self._status_event("")
+
+    def _new_run_state(self) -> Dict[str, Any]:
+        started_at = time.monotonic()
+        budget = float(self.request_deadline_seconds or 0.0)
+        return {
+            "started_at": started_at,
+            "deadline": started_at + budget if budget > 0 else None,
+            "metrics": {"stage": {}, "agent": {}, "call": {}, "tokens": {}, "prompt": {}},
+        }
+
+    def _in_run_context(self, events: Iterator[Any]) -> Generator[Any, None, None]:
+        # Состояние запуска выставляется только на время шага генератора, чтобы
+        # не протекать в другие запросы, обслуживаемые тем же потоком сервера.
+        state = self._new_run_state()
+        while True:
+            token = _run_state.set(state)
+            try:
+                event = next(events)
+            except StopIteration:
+                return
+            finally:
+                _run_state.reset(token)
+            yield event
+
+    async def _ain_run_context(self, events: AsyncIterator[Any]) -> AsyncGenerator[Any, None]:
+        state = self._new_run_state()
+        while True:
+            token = _run_state.set(state)
+            try:
+                event = await events.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                _run_state.reset(token)
+            yield event
+
+    def _flight_key(self, body: dict) -> Optional[str]:
+        # Препроцессинг и разбор пунктов построчные, поэтому границы строк сохраняются:
+        # нормализуются только пробелы по краям строк, пустые строки и переводы строк
+        # (\r\n, \r). Число блоков <context> входит в ключ, так как от него зависят
+        # события "Context received"
+        agenda_text, contexts_count = self._extract_agenda_text(body)
+        lines = agenda_text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        normalized = "\n".join(line.strip() for line in lines if line.strip())
+        if not normalized:
+            return None
+        return hashlib.sha256(f"{contexts_count}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def _join_flight(self, key: str) -> Tuple[Dict[str, Any], bool]:
+        # Возвращает запуск по ключу и признак того, что его нужно начать
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._flight_stats["follower"] += 1
+                return flight, False
+            flight = self._flights[key] = self._new_flight()
+            self._flight_stats["leader"] += 1
+            return flight, True
+
+    def _new_flight(self, events: Optional[List[Any]] = None, done: bool = False) -> Dict[str, Any]:
+        return {
+            "events": events or [],
+            "done": done,
+            "cond": threading.Condition(),
+            "waiters": set(),
+        }
+
+    def _publish_flight(self, flight: Dict[str, Any], event: Any) -> None:
+        with flight["cond"]:
+            flight["events"].append(event)
+            flight["cond"].notify_all()
+            waiters = list(flight["waiters"])
+        self._wake_waiters(waiters)
+
+    def _wake_waiters(self, waiters: List[Tuple[Any, asyncio.Event]]) -> None:
+        for loop, ready in waiters:
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                # Цикл подписчика уже закрыт: он дочитал события и отключился
+                pass
+
+    def _finish_flight(self, key: str, flight: Dict[str, Any]) -> None:
+        # Сначала убираем из реестра: следующий такой же запрос начнёт новый анализ
+        # (повтор ответов бэкендов возьмёт кэш), а подписчики дочитают этот
+        with self._flights_lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        with flight["cond"]:
+            flight["done"] = True
+            flight["cond"].notify_all()
+            waiters = list(flight["waiters"])
+        self._wake_waiters(waiters)
+
+    def _run_flight(self, key: str, flight: Dict[str, Any], body: dict) -> None:
+        try:
+            for event in self._in_run_context(self._run_pipe(body)):
+                self._publish_flight(flight, event)
+        finally:
+            self._finish_flight(key, flight)
+
+    async def _arun_flight(self, key: str, flight: Dict[str, Any], body: dict) -> None:
+        try:
+            async for event in self._ain_run_context(self._arun_pipe(body)):
+                self._publish_flight(flight, event)
+        finally:
+            self._finish_flight(key, flight)
+
+    def _follow_flight(self, flight: Dict[str, Any]) -> Generator[Any, None, None]:
+        index = 0
+        while True:
+            with flight["cond"]:
+                while index >= len(flight["events"]) and not flight["done"]:
+                    flight["cond"].wait()
+                batch = flight["events"][index:]
+                done = flight["done"]
+            index += len(batch)
+            yield from batch
+            if done:
+                return
+
+    async def _afollow_flight(self, flight: Dict[str, Any]) -> AsyncGenerator[Any, None]:
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with flight["cond"]:
+            flight["waiters"].add(waiter)
+        try:
+            index = 0
+            while True:
+                # Сброс до чтения: публикация после чтения снова выставит флаг
+                waiter[1].clear()
+                with flight["cond"]:
+                    batch = flight["events"][index:]
+                    done = flight["done"]
+                index += len(batch)
+                for event in batch:
+                    yield event
+                if done:
+                    return
+                if not batch:
+                    await waiter[1].wait()
+        finally:
+            with flight["cond"]:
+                flight["waiters"].discard(waiter)
+
+    def _coalesced(self, body: dict) -> Generator[Any, None, None]:
+        # Анализ идёт в отдельном потоке, а все одинаковые запросы, включая первый,
+        # читают его события: отключение первого клиента не обрывает остальных
+        key = self._flight_key(body) if self.coalesce_identical_requests else None
+        if key is None:
+            yield from self._in_run_context(self._run_pipe(body))
+            return
+        flight, leader = self._join_flight(key)
+        if leader:
+            threading.Thread(
+                target=self._run_flight, args=(key, flight, body), daemon=True
+            ).start()
+        elif self.debug:
+            print(f"[DEBUG] Повестка уже анализируется, подписываемся: {key[:12]}")
+        yield from self._follow_flight(flight)
+
+    async def _acoalesced(self, body: dict) -> AsyncGenerator[Any, None]:
+        key = self._flight_key(body) if self.coalesce_identical_requests else None
+        if key is None:
+            async for event in self._ain_run_context(self._arun_pipe(body)):
+                yield event
+            return
+        flight, leader = self._join_flight(key)
+        if leader:
+            # Ссылка на задачу хранится в запуске, иначе её может собрать GC
+            flight["task"] = asyncio.create_task(self._arun_flight(key, flight, body))
+        elif self.debug:
+            print(f"[DEBUG] Повестка уже анализируется, подписываемся: {key[:12]}")
+        async for event in self._afollow_flight(flight):
+            yield event
+
+    def _jobs_connection(self) -> Optional[sqlite3.Connection]:
+        # Вызывается под self._jobs_lock. Без диска режим задач недоступен —
+        # pipe анализирует повестку в рамках запроса, как обычно
+        if self._jobs_db is not None or self._jobs_disk_failed or not self.jobs_path:
+            return self._jobs_db
+        try:
+            jobs_dir = os.path.dirname(self.jobs_path)
+            if jobs_dir:
+                os.makedirs(jobs_dir, exist_ok=True)
+            # Транзакции открываются явно (BEGIN IMMEDIATE), чтобы захват задачи был
+            # атомарным и между процессами, работающими с одним файлом
+            connection = sqlite3.connect(
+                self.jobs_path, check_same_thread=False, isolation_level=None, timeout=30.0
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, pipeline TEXT NOT NULL, agenda_key TEXT, "
+                "body TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                "error TEXT, result TEXT, created_at REAL NOT NULL, started_at REAL, "
+                "updated_at REAL NOT NULL, finished_at REAL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (pipeline, status, created_at)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS job_events ("
+                "job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, "
+                "PRIMARY KEY (job_id, seq))"
+            )
+            expired = time.time() - self.job_ttl_seconds
+            connection.execute(
+                "DELETE FROM job_events WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE finished_at < ?)",
+                (expired,),
+            )
+            connection.execute("DELETE FROM jobs WHERE finished_at < ?", (expired,))
+            self._jobs_db = connection
+        except Exception as exc:
+            print(f"[WARN] Очередь задач недоступна ({self.jobs_path}): {exc}")
+            self._jobs_disk_failed = True
+        return self._jobs_db
+
+    def _job_agenda_key(self, body: dict) -> Optional[str]:
+        # Та же повестка с теми же настройками вывода — та же задача
+        flight_key = self._flight_key(body)
+        if flight_key is None:
+            return None
+        raw = json.dumps(
+            [flight_key, self.analysis_mode, self.output_format, self.stream_output]
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def submit_job(self, body: dict) -> Optional[str]:
+        # Возвращает id задачи. Такая же повестка, ещё стоящая в очереди или в работе,
+        # получает id существующей задачи. None — очередь недоступна
+        agenda_key = self._job_agenda_key(body)
+        now = time.time()
+        with self._jobs_lock:
+            connection = self._jobs_connection()
+            if connection is None:
+                return None
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = None
+                if agenda_key is not None:
+                    row = connection.execute(
+                        "SELECT id FROM jobs WHERE pipeline = ? AND agenda_key = ? "
+                        "AND status IN ('queued', 'running') ORDER BY created_at LIMIT 1",
+                        (self.name, agenda_key),
+                    ).fetchone()
+                if row is not None:
+                    job_id = row[0]
+                else:
+                    job_id = uuid.uuid4().hex
+                    # Пайплайну нужны только сообщения и agenda_id — прочие поля запроса не храним
+                    connection.execute(
+                        "INSERT INTO jobs (id, pipeline, agenda_key, body, status, "
+                        "created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                        (
+                            job_id,
+                            self.name,
+                            agenda_key,
+                            json.dumps(
+                                {
+                                    "messages": body.get("messages", []),
+                                    "agenda_id": body.get("agenda_id"),
+                                },
+                                ensure_ascii=False,
+                                default=str,
+                            ),
+                            now,
+                            now,
+                        ),
+                    )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        self.start_job_workers()
+        with self._jobs_cond:
+            self._jobs_cond.notify_all()
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._jobs_lock:
+            connection = self._jobs_connection()
+            if connection is None:
+                return None
+            row = connection.execute(
+                "SELECT status, attempts, error, result, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row[0] == "queued":
+                position = connection.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE pipeline = ? AND status = 'queued' "
+                    "AND created_at <= ?",
+                    (self.name, row[4]),
+                ).fetchone()[0]
+        status, attempts, error, result, created_at, started_at, finished_at = row
+        return {
+            "id": job_id,
+            "status": status,
+            "attempts": attempts,
+            "queue_position": position,
+            "error": error,
+            "result": json.loads(result) if result else None,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+
+    def _job_events_since(self, job_id: str, index: int) -> Tuple[List[Any], bool]:
+        # Статус читается до событий: у завершённой задачи список событий уже полный
+        with self._jobs_lock:
+            connection = self._jobs_connection()
+            if connection is None:
+                return [], True
+            row = connection.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            rows = connection.execute(
+                "SELECT event FROM job_events WHERE job_id = ? AND seq >= ? ORDER BY seq",
+                (job_id, index),
+            ).fetchall()
+        finished = row is None or row[0] in ("done", "failed")
+        return [json.loads(event) for (event,) in rows], finished
+
+    def _claim_job(self) -> Optional[Tuple[str, dict]]:
+        now = time.time()
+        with self._jobs_lock:
+            connection = self._jobs_connection()
+            if connection is None:
+                return None
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Задача «в работе» без новых событий дольше job_stale_seconds осталась
+                # от упавшего процесса: возвращаем в очередь или, если попытки
+                # исчерпаны, завершаем с ошибкой
+                stale = connection.execute(
+                    "SELECT id, attempts FROM jobs WHERE pipeline = ? AND status = 'running' "
+                    "AND updated_at < ?",
+                    (self.name, now - self.job_stale_seconds),
+                ).fetchall()
+                for job_id, attempts in stale:
+                    if attempts >= self.job_max_attempts:
+                        connection.execute(
+                            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, "
+                            "updated_at = ? WHERE id = ?",
+                            ("воркер не завершил задачу", now, now, job_id),
+                        )
+                    else:
+                        connection.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+                        connection.execute(
+                            "UPDATE jobs SET status = 'queued', updated_at = ? WHERE id = ?",
+                            (now, job_id),
+                        )
+                row = connection.execute(
+                    "SELECT id, body FROM jobs WHERE pipeline = ? AND status = 'queued' "
+                    "ORDER BY created_at LIMIT 1",
+                    (self.name,),
+                ).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                        "started_at = ?, updated_at = ? WHERE id = ?",
+                        (now, now, row[0]),
+                    )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _store_job_event(self, job_id: str, seq: int, event: Any) -> None:
+        with self._jobs_lock:
+            connection = self._jobs_connection()
+            if connection is None:
+                return
+            connection.execute("BEGIN")
+            try:
+                connection.execute(
+                    "INSERT OR REPLACE INTO job_events (job_id, seq, event) VALUES (?, ?, ?)",
+                    (job_id, seq, json.dumps(event, ensure_ascii=False, default=str)),
+                )
+                connection.execute(
+                    "UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id)
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+    def _finish_job(self, job_id: str, outcome: Dict[str, Any]) -> None:
+        now = time.time()
+        if "analysis_result" in outcome:
+            status, error = "done", None
+            result = json.dumps(outcome["analysis_result"], ensure_ascii=False, default=str)
+        else:
+            status, error, result = "failed", outcome.get("error") or "анализ не завершён", None
+        with self._jobs_lock:
+            connection = self._jobs_connection()
+            if connection is None:
+                return
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, result = ?, finished_at = ?, "
+                "updated_at = ? WHERE id = ?",
+                (status, error, result, now, now, job_id),
+            )
+
+    def start_job_workers(self) -> None:
+        with self._jobs_cond:
+            self._jobs_stopping.clear()
+            self._job_threads = [thread for thread in self._job_threads if thread.is_alive()]
+            for index in range(len(self._job_threads), max(1, self.job_workers)):
+                thread = threading.Thread(
+                    target=self._job_worker, name=f"skai-job-{index}", daemon=True
+                )
+                thread.start()
+                self._job_threads.append(thread)
+
+    def stop_job_workers(self) -> None:
+        # Воркеры останавливаются после текущей задачи; прерванная выходом
+        # процесса вернётся в очередь через job_stale_seconds
+        self._jobs_stopping.set()
+        with self._jobs_cond:
+            self._jobs_cond.notify_all()
+
+    def _job_worker(self) -> None:
+        while not self._jobs_stopping.is_set():
+            try:
+                job = self._claim_job()
+            except Exception as exc:
+                print(f"[WARN] Очередь задач: {exc}")
+                job = None
+            if job is None:
+                with self._jobs_cond:
+                    self._jobs_cond.wait(self.job_poll_seconds)
+                continue
+            self._run_job(*job)
+
+    def _run_job(self, job_id: str, body: dict) -> None:
+        # События пишутся в базу (для повторного подключения) и в живой запуск,
+        # чтобы подписчики в этом процессе получали их без опроса
+        key = f"job:{job_id}"
+        flight = self._new_flight()
+        with self._flights_lock:
+            self._flights[key] = flight
+        with self._jobs_cond:
+            self._jobs_cond.notify_all()
+        outcome: Dict[str, Any] = {}
+        try:
+            for seq, event in enumerate(self._in_run_context(self._run_pipe(body, outcome))):
+                self._store_job_event(job_id, seq, event)
+                self._publish_flight(flight, event)
+        finally:
+            self._finish_job(job_id, outcome)
+            self._finish_flight(key, flight)
+
+    def _follow_job(self, job_id: str) -> Generator[Any, None, None]:
+        # Все события задачи с начала; задача другого процесса — опросом базы
+        index = 0
+        while True:
+            events, finished = self._job_events_since(job_id, index)
+            index += len(events)
+            yield from events
+            if finished:
+                return
+            flight = self._flights.get(f"job:{job_id}")
+            if flight is None:
+                with self._jobs_cond:
+                    self._jobs_cond.wait(self.job_poll_seconds)
+                continue
+            with flight["cond"]:
+                if len(flight["events"]) <= index and not flight["done"]:
+                    flight["cond"].wait(self.job_poll_seconds)
+
+    async def _afollow_job(self, job_id: str) -> AsyncGenerator[Any, None]:
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        flight: Optional[Dict[str, Any]] = None
+        try:
+            index = 0
+            while True:
+                waiter[1].clear()
+                events, finished = self._job_events_since(job_id, index)
+                index += len(events)
+                for event in events:
+                    yield event
+                if finished:
+                    return
+                if flight is None:
+                    flight = self._flights.get(f"job:{job_id}")
+                    if flight is not None:
+                        with flight["cond"]:
+                            flight["waiters"].add(waiter)
+                        # Перечитываем: событие могло прийти до подписки
+                        continue
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), self.job_poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if flight is not None:
+                with flight["cond"]:
+                    flight["waiters"].discard(waiter)
+
+    def _attach_job(self, user_message: str, body: dict) -> Tuple[Optional[str], Optional[str]]:
+        # (id задачи, статус для UI). Статус None — очередь недоступна;
+        # id None при статусе — задача не найдена
+        match = _JOB_REFERENCE_RE.match(user_message or "")
+        job_id = body.get("job_id") or (match.group(1).lower() if match else None)
+        if job_id is None:
+            job_id = self.submit_job(body)
+            if job_id is None:
+                return None, None
+        job = self.get_job(job_id)
+        if job is None:
+            return None, f"Задача {job_id} не найдена"
+        if job["status"] == "queued":
+            return job_id, f"Задача {job_id}: в очереди, позиция {job['queue_position']}"
+        states = {"running": "выполняется", "done": "завершена", "failed": "завершена с ошибкой"}
+        return job_id, f"Задача {job_id}: {states[job['status']]}"
+
+    def _job_events(self, user_message: str, body: dict) -> Generator[Any, None, None]:
+        job_id, status = self._attach_job(user_message, body)
+        if status is None:
+            yield from self._coalesced(body)
+            return
+        yield self._status_event(status)
+        if job_id is None:
+            yield self._error_output(status)
+            return
+        yield from self._follow_job(job_id)
+
+    async def _ajob_events(self, user_message: str, body: dict) -> AsyncGenerator[Any, None]:
+        job_id, status = self._attach_job(user_message, body)
+        if status is None:
+            async for event in self._acoalesced(body):
+                yield event
+            return
+        yield self._status_event(status)
+        if job_id is None:
+            yield self._error_output(status)
+            return
+        async for event in self._afollow_job(job_id):
+            yield event
+
+    def _submit(self, executor: ThreadPoolExecutor, fn: Callable[..., Any], *args: Any) -> Future:
+        # Задачи пула выполняются в копии контекста, чтобы видеть состояние запуска
+        return executor.submit(copy_context().run, fn, *args)
+
+    def _extract_agenda_text(self, body: dict) -> Tuple[str, int]:
+        # Части собираются в список и склеиваются один раз — без квадратичной конкатенации
+        parts: List[str] = []
+        contexts_count = 0
         for message in body.get("messages", []):
             content = str(message.get("content", ""))
             if "<context>" in content and "</context>" in content:
-                agenda_text += content.split("<context>")[1].split("</context>")[0] + "\n"
-                yield self._status_event("Context received")
+                start = content.index("<context>") + len("<context>")
+                end = content.find("</context>", start)
+                parts.append(content[start:end if end != -1 else len(content)])
+                parts.append("\n")
+                contexts_count += 1
             else:
-                agenda_text += content
+                parts.append(content)
+        return "".join(parts), contexts_count
+
+    def _overall_item(self, summary_text: str) -> Dict[str, str]:
+        return {
+            "number": "-",
+            "title": "Итоговый анализ повестки",
+            "full_text": summary_text,
+        }
+
+    def _items_started_status(self, items: List[Dict[str, str]]) -> str:
+        return (
+            f"Анализируем пункты повестки: {len(items)} "
+            f"(до {max(1, self.max_item_workers)} одновременно)..."
+        )
+
+    def _build_analysis_result(
+        self,
+        timestamp: str,
+        results: List[Dict[str, Any]],
+        global_analyses: Dict[str, Any],
+        summary_text: str,
+        global_queries: Dict[str, str],
+    ) -> Dict[str, Any]:
+        return {
+            "timestamp": timestamp,
+            "agenda_items_count": len(results),
+            "results": results,
+            "summary": self._generate_summary(results),
+            "global_analyses": global_analyses,
+            "summary_text": summary_text,
+            "global_queries": global_queries,
+            "timings": self._run_metrics_snapshot(),
+        }
+
+    def _report_events(self, analysis_result: Dict[str, Any]) -> List[Any]:
+        events: List[Any] = [self._status_event("Анализ завершен. Формируем отчет...")]
+        if self.output_format == "ndjson":
+            events.append("".join(self._ndjson_final_lines(analysis_result)))
+            events.append(self._status_event("Отчет сформирован успешно."))
+        elif self.output_format == "json":
+            events.append(self._status_event("Отчет сформирован успешно."))
+            events.append(self._compact_json(self._compact_analysis_result(analysis_result)))
+        elif self.stream_output:
+            # Разделы пунктов уже отданы — дописываем сводку решений
+            events.append(self._report_chunk(self._report_summary_lines(analysis_result)))
+            events.append(self._status_event("Отчет сформирован успешно."))
+        else:
+            report = self._generate_readable_report(analysis_result)
+            events.append(self._status_event("Отчет сформирован успешно."))
+            events.append(report)
+        return events
+
+    def _stream_text_report(self) -> bool:
+        # Разделы читаемого отчёта по ходу анализа; в машинных форматах их нет
+        return self.stream_output and self.output_format == "text"
+
+    def _error_output(self, error_message: str) -> str:
+        if self.output_format == "text":
+            return error_message
+        return self._compact_json({"type": "error", "message": error_message})
+
+    def _compact_json(self, payload: Dict[str, Any]) -> str:
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+
+    def _store_text(self, texts: Dict[str, str], text: str) -> Optional[str]:
+        # Ссылка на текст — по содержимому: одинаковые ответы агентов (глобальный
+        # анализ и итоговый пункт, общий веб-поиск разных пунктов) хранятся один раз
+        if not text:
+            return None
+        ref = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+        texts.setdefault(ref, text)
+        return ref
+
+    def _compact_analysis(self, analysis: Dict[str, Any], texts: Dict[str, str]) -> Dict[str, Any]:
+        compact = {key: value for key, value in analysis.items() if key != "response"}
+        compact["response_ref"] = self._store_text(texts, str(analysis.get("response") or ""))
+        return compact
+
+    def _compact_item(self, item: Dict[str, str], texts: Dict[str, str]) -> Dict[str, Any]:
+        return {
+            "number": item["number"],
+            "title": item["title"],
+            "full_text_ref": self._store_text(texts, item.get("full_text", "")),
+        }
+
+    def _compact_decision(self, result: Dict[str, Any], texts: Dict[str, str]) -> Dict[str, Any]:
+        decision = {
+            key: value for key, value in result.items() if key not in ("item", "analyses")
+        }
+        decision["item"] = self._compact_item(result["item"], texts)
+        return decision
+
+    def _compact_analysis_result(self, analysis_result: Dict[str, Any]) -> Dict[str, Any]:
+        texts: Dict[str, str] = {}
+        results = []
+        for result in analysis_result["results"]:
+            compact = self._compact_decision(result, texts)
+            compact["analyses"] = {
+                key: self._compact_analysis(analysis, texts)
+                for key, analysis in result["analyses"].items()
+            }
+            results.append(compact)
+        return {
+            "timestamp": analysis_result["timestamp"],
+            "agenda_items_count": analysis_result["agenda_items_count"],
+            "summary": analysis_result["summary"],
+            "global_queries": analysis_result["global_queries"],
+            "timings": analysis_result["timings"],
+            "summary_text_ref": self._store_text(texts, analysis_result["summary_text"]),
+            "global_analyses": {
+                key: self._compact_analysis(analysis, texts)
+                for key, analysis in analysis_result["global_analyses"].items()
+            },
+            "results": results,
+            "texts": texts,
+        }
+
+    def _ndjson_state(self) -> Dict[str, Any]:
+        # Что уже отдано в этом запуске: тексты по ссылке и число пунктов
+        state = _run_state.get()
+        if state is None:
+            state = {}
+        state.setdefault("emitted_texts", set())
+        state.setdefault("emitted_results", 0)
+        return state
+
+    def _ndjson_text_lines(self, texts: Dict[str, str]) -> List[str]:
+        emitted = self._ndjson_state()["emitted_texts"]
+        lines = []
+        for ref, text in texts.items():
+            if ref not in emitted:
+                emitted.add(ref)
+                lines.append(self._compact_json({"type": "text", "id": ref, "text": text}))
+        return lines
+
+    def _ndjson_result_lines(self, result: Dict[str, Any]) -> List[str]:
+        # Тексты идут раньше ссылающихся на них событий агентов и решения
+        texts: Dict[str, str] = {}
+        number = result["item"]["number"]
+        events = [
+            {"type": "agent", "item": number, "key": key, **self._compact_analysis(analysis, texts)}
+            for key, analysis in result["analyses"].items()
+        ]
+        events.append({"type": "decision", **self._compact_decision(result, texts)})
+        self._ndjson_state()["emitted_results"] += 1
+        return self._ndjson_text_lines(texts) + [self._compact_json(event) for event in events]
+
+    def _ndjson_final_lines(self, analysis_result: Dict[str, Any]) -> List[str]:
+        # Пункты, ещё не отданные по ходу анализа (режим global), и сводка
+        lines: List[str] = []
+        for result in analysis_result["results"][self._ndjson_state()["emitted_results"]:]:
+            lines.extend(self._ndjson_result_lines(result))
+        texts: Dict[str, str] = {}
+        summary = {
+            "type": "summary",
+            "timestamp": analysis_result["timestamp"],
+            "agenda_items_count": analysis_result["agenda_items_count"],
+            "summary": analysis_result["summary"],
+            "global_queries": analysis_result["global_queries"],
+            "timings": analysis_result["timings"],
+            "summary_text_ref": self._store_text(texts, analysis_result["summary_text"]),
+        }
+        return lines + self._ndjson_text_lines(texts) + [self._compact_json(summary)]
+
+    async def _arun_pipe(
+        self, body: dict, outcome: Optional[Dict[str, Any]] = None
+    ) -> AsyncGenerator[Any, None]:
+        agenda_text, contexts_count = self._extract_agenda_text(body)
+        for _ in range(contexts_count):
+            yield self._status_event("Context received")
 
         # 1. Инициализация
         yield self._status_event("Инициализация аналитического пайплайна...")
-        time.sleep(1)
 
         try:
-            # 2. Препроцессинг
-            yield self._status_event("Препроцессинг повестки дня...")
-            summary_text = self._preprocess_agenda_text(agenda_text)
-            time.sleep(1)
+            # 2. Препроцессинг
+            yield self._status_event("Препроцессинг повестки дня...")
+            with self._timed("stage", "preprocess"):
+                # Запросы агентов приходят вместе с очищенным текстом, если
+                # повестку пришлось чистить через gpt-4o
+                summary_text, global_queries = await self._apreprocess_agenda_text(agenda_text)
+
+            # 3. Глобальный контекст и запросы
+            yield self._status_event("Извлекаем глобальный контекст...")
+            with self._timed("stage", "global_context"):
+                # Разбор пунктов выполняется один раз: и для подсчёта, и для per_item
+                agenda_items = self._parse_agenda(summary_text)
+                global_context = self._extract_global_context(summary_text, agenda_items)
+
+            yield self._status_event("Формируем запросы для агентов...")
+            if global_queries is None:
+                with self._timed("stage", "queries"):
+                    global_queries = await self._agenerate_global_agent_queries(
+                        summary_text, global_context
+                    )
+
+            items = agenda_items if self.analysis_mode == "per_item" else []
+            timestamp = datetime.now().isoformat()
+            if items:
+                # 4-7. Анализ и синтез по каждому пункту с ограничением параллелизма
+                yield self._status_event(self._items_started_status(items))
+                if self._stream_text_report():
+                    yield self._report_chunk(self._report_title_lines(timestamp, len(items)))
+                results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+                fingerprints: List[str] = []
+                if self.incremental_analysis:
+                    results, fingerprints = self._load_previous_results(
+                        items, self._item_scope(body, global_context)
+                    )
+                changed_indexes = [
+                    index for index, result in enumerate(results) if result is None
+                ]
+                if len(changed_indexes) < len(items):
+                    yield self._status_event(self._reused_status(items, changed_indexes))
+                analyzed_at = datetime.now().isoformat()
+                with self._timed("stage", "items"):
+                    async for event in self._aanalyze_items_concurrently(
+                        items, global_queries, results
+                    ):
+                        yield event
+                if self.incremental_analysis:
+                    self._store_item_results(
+                        results, fingerprints, changed_indexes, analyzed_at
+                    )
+                global_analyses: Dict[str, Any] = {}
+            else:
+                # 4-6. Параллельный запуск подагентов (ВНД, право, веб)
+                yield self._status_event(
+                    "Запускаем подагентов: ВНД, правовой анализ, веб-поиск..."
+                )
+                payloads = self._agent_payloads(global_queries, summary_text)
+                stage_outcome: Dict[str, Any] = {}
+                with self._timed("stage", "agents"):
+                    async for event in self._arun_agents_concurrently(payloads, stage_outcome):
+                        yield event
+                analyses, late = stage_outcome["analyses"], stage_outcome["late"]
+
+                # 7. Синтез решения (при опоздавших агентах — предварительный)
+                yield self._status_event(self._synthesis_status(late))
+                overall_item = self._overall_item(summary_text)
+                with self._timed("stage", "synthesis"):
+                    if self._stream_text_report():
+                        yield self._report_chunk(
+                            self._report_title_lines(timestamp, 1)
+                            + self._report_item_heading_lines(overall_item)
+                        )
+                        async for delta in self._asynthesize_decision_stream(
+                            overall_item, analyses, stage_outcome
+                        ):
+                            yield delta
+                        decision_result = stage_outcome["decision_result"]
+                    else:
+                        decision_result = await self._asynthesize_decision(
+                            overall_item, analyses
+                        )
+                    if late:
+                        decision_result = await self._afinish_late_agents(
+                            overall_item, analyses, decision_result, late
+                        )
+                        yield self._status_event(self._late_agents_status(decision_result))
+                    if self._stream_text_report():
+                        yield self._report_chunk(
+                            self._streamed_late_lines(decision_result) + ["", "", "=" * 80]
+                        )
+                results = [self._build_result_entry(overall_item, analyses, decision_result)]
+                global_analyses = analyses
+
+            analysis_result = self._build_analysis_result(
+                timestamp, results, global_analyses, summary_text, global_queries
+            )
+            if outcome is not None:
+                outcome["analysis_result"] = analysis_result
+
+            # 8. Формирование отчета
+            for event in self._report_events(analysis_result):
+                yield event
+        except Exception as exc:
+            if outcome is not None:
+                outcome["error"] = str(exc)
+            error_message = f"Ошибка анализа повестки: {exc}"
+            yield self._status_event(error_message)
+            yield self._error_output(error_message)
+        finally:
+            yield self._status_event("")
+
+    async def _apaced(self, events: AsyncIterator[Any]) -> AsyncGenerator[Any, None]:
+        # Та же логика интервалов, что и в _paced, но ожидание не блокирует event loop
+        interval = max(0.0, float(self.status_pacing_seconds or 0.0))
+        last_emit: Optional[float] = None
+        async for event in events:
+            if interval > 0 and last_emit is not None:
+                remaining = interval - (time.monotonic() - last_emit)
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+            yield event
+            last_emit = time.monotonic()
+
+    async def _arun_agent(self, key: str, payload: str) -> Dict[str, Any]:
+        spec = self._agent_specs()[key]
+        try:
+            with self._timed("agent", key):
+                return await spec["async_handler"](payload)
+        except Exception as exc:
+            return self._agent_error(payload, exc, spec["source"], spec["agent"])
+
+    async def _arun_agents_concurrently(
+        self,
+        payloads: Dict[str, str],
+        outcome: Dict[str, Any],
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        # Асинхронный аналог _run_agents_concurrently; итоговые анализы
+        # (в порядке ключей payloads) кладутся в outcome["analyses"],
+        # задачи опоздавших агентов — в outcome["late"].
+        tasks = {
+            asyncio.ensure_future(self._arun_agent(key, payload)): key
+            for key, payload in payloads.items()
+        }
+        analyses: Dict[str, Any] = {}
+        async for key in self._acollect_agents(tasks, analyses):
+            yield self._status_event(self._agent_status(key, analyses[key]))
+        outcome["late"] = {key: task for task, key in tasks.items() if key not in analyses}
+        outcome["analyses"] = self._speculative_analyses(payloads, analyses)
+
+    async def _acollect_agents(
+        self,
+        tasks: Dict["asyncio.Future[Dict[str, Any]]", str],
+        analyses: Dict[str, Any],
+    ) -> AsyncGenerator[str, None]:
+        # Асинхронный аналог _collect_agents
+        started = time.monotonic()
+        pending = dict(tasks)
+        while pending:
+            done, _ = await asyncio.wait(
+                pending,
+                timeout=self._soft_wait_timeout(started, pending.values()),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                return
+            for task in done:
+                key = pending.pop(task)
+                analyses[key] = task.result()
+                yield key
+
+    async def _afinish_late_agents(
+        self,
+        item: Dict[str, str],
+        analyses: Dict[str, Any],
+        decision_result: Dict[str, Any],
+        late: Dict[str, "asyncio.Future[Dict[str, Any]]"],
+    ) -> Dict[str, Any]:
+        done, not_done = await asyncio.wait(late.values(), timeout=self._late_wait_timeout())
+        for task in not_done:
+            task.cancel()
+        arrived = {key: task.result() for key, task in late.items() if task in done}
+        request = self._merge_late_results(item, analyses, decision_result, arrived)
+        if request is None:
+            return decision_result
+        try:
+            response_text = await self._acached_response_text("synthesis", request)
+        except Exception:
+            # Предварительное решение остаётся в силе
+            return decision_result
+        return self._revised_decision(decision_result, response_text)
+
+    async def _aanalyze_agenda_item(
+        self,
+        item: Dict[str, str],
+        global_queries: Dict[str, str],
+    ) -> Dict[str, Any]:
+        payloads = self._agent_payloads(global_queries, item["full_text"])
+        tasks = {
+            asyncio.ensure_future(self._arun_agent(key, payload)): key
+            for key, payload in payloads.items()
+        }
+        analyses: Dict[str, Any] = {}
+        async for _ in self._acollect_agents(tasks, analyses):
+            pass
+        late = {key: task for task, key in tasks.items() if key not in analyses}
+        analyses = self._speculative_analyses(payloads, analyses)
+        decision_result = await self._asynthesize_decision(item, analyses)
+        if late:
+            decision_result = await self._afinish_late_agents(
+                item, analyses, decision_result, late
+            )
+        return self._build_result_entry(item, analyses, decision_result)
+
+    async def _aanalyze_items_concurrently(
+        self,
+        items: List[Dict[str, str]],
+        global_queries: Dict[str, str],
+        results: List[Optional[Dict[str, Any]]],
+    ) -> AsyncGenerator[Any, None]:
+        # Асинхронный аналог _analyze_items_concurrently: список results
+        # заполняется на месте, параллелизм ограничен семафором.
+        semaphore = asyncio.Semaphore(max(1, self.max_item_workers))
+
+        async def run(index: int) -> Tuple[int, Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    return index, await self._aanalyze_agenda_item(items[index], global_queries)
+                except Exception as exc:
+                    return index, self._build_result_entry(
+                        items[index], {}, self._failed_decision(exc)
+                    )
+
+        pending = [index for index, result in enumerate(results) if result is None]
+        chunks, next_section = self._ready_report_sections(results, 0)
+        for chunk in chunks:
+            yield chunk
+        for done_count, next_done in enumerate(
+            asyncio.as_completed([run(index) for index in pending]), 1
+        ):
+            index, results[index] = await next_done
+            yield self._status_event(
+                self._item_status(results[index], done_count, len(pending))
+            )
+            chunks, next_section = self._ready_report_sections(results, next_section)
+            for chunk in chunks:
+                yield chunk
+
+    def _paced(self, events: Iterator[Any]) -> Generator[Any, None, None]:
+        # Выдерживаем минимальный интервал между событиями, досыпая только остаток:
+        # если реальная работа заняла больше интервала, пауза не добавляется.
+        # Ограничение: генератор синхронный, поэтому остаток досыпается time.sleep
+        # в потоке сервера; неблокирующая пауза — в _apaced (apipe).
+        interval = max(0.0, float(self.status_pacing_seconds or 0.0))
+        if interval <= 0:
+            yield from events
+            return
+        last_emit: Optional[float] = None
+        for event in events:
+            if last_emit is not None:
+                remaining = interval - (time.monotonic() - last_emit)
+                if remaining > 0:
+                    time.sleep(remaining)
+            yield event
+            last_emit = time.monotonic()
+
+    def _shared_client(self, key: Tuple[Any, ...], factory: Callable[[], Any]) -> Any:
+        # Повторные обращения идут без блокировки: чтение dict атомарно
+        client = _shared_clients.get(key)
+        if client is not None:
+            return client
+        with _clients_lock:
+            client = _shared_clients.get(key)
+            if client is None:
+                client = _shared_clients[key] = factory()
+            return client
+
+    def _loop_client(self, key: Tuple[Any, ...], factory: Callable[[], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        with _clients_lock:
+            clients = _loop_clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None:
+                client = clients[key] = factory()
+            return client
+
+    def _openai(self) -> OpenAI:
+        if self._openai_client is not None:
+            return self._openai_client
+        # Повторы выполняет _resilient_call, встроенные повторы SDK отключены
+        return self._shared_client(
+            ("openai", self._openai_api_key, os.getenv("OPENAI_BASE_URL", "")),
+            lambda: OpenAI(api_key=self._openai_api_key, max_retries=0),
+        )
+
+    def _http_key(self) -> Tuple[Any, ...]:
+        return ("http", self.http_pool_size)
+
+    def _http(self) -> requests.Session:
+        # Сессия создаётся лениво и переиспользуется всеми вызовами и экземплярами,
+        # чтобы не открывать новое TLS-соединение на каждый запрос.
+        return self._shared_client(self._http_key(), self._new_http_session)
+
+    def _new_http_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=max(1, self.http_pool_size),
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({"Connection": "keep-alive"})
+        return session
+
+    def _async_openai(self) -> AsyncOpenAI:
+        if self._async_openai_client is not None:
+            return self._async_openai_client
+        return self._loop_client(
+            ("openai", self._openai_api_key, os.getenv("OPENAI_BASE_URL", "")),
+            lambda: AsyncOpenAI(api_key=self._openai_api_key, max_retries=0),
+        )
+
+    def _async_http(self) -> httpx.AsyncClient:
+        # Асинхронный аналог _http: общий пул keep-alive соединений для apipe
+        if self._async_http_client is not None:
+            return self._async_http_client
+        return self._loop_client(
+            ("http", self.http_pool_size, self.http_connect_timeout, self.http_read_timeout),
+            lambda: httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=max(1, self.http_pool_size),
+                    max_keepalive_connections=max(1, self.http_pool_size),
+                ),
+                timeout=httpx.Timeout(
+                    self.http_read_timeout, connect=self.http_connect_timeout
+                ),
+            ),
+        )
+
+    def warm_up(self) -> None:
+        # Прогрев для pipe: клиенты, токенизатор и по одному соединению к каждому API.
+        # Ошибки не критичны — тогда соединение откроет первый настоящий запрос
+        self._estimate_tokens("прогрев")
+        warm_calls = [lambda: self._http().head(self._perplexity_url, timeout=self.http_connect_timeout)]
+        if self._openai_api_key:
+            warm_calls.append(
+                lambda: self._openai().models.list(timeout=self.http_connect_timeout)
+            )
+        for call in warm_calls:
+            try:
+                call()
+            except Exception as exc:
+                if self.debug:
+                    print(f"[WARN] Прогрев соединения не удался: {exc}")
+
+    async def awarm_up(self) -> None:
+        # Прогрев для apipe: клиенты этого цикла событий и их соединения
+        warm_calls = [self._async_http().head(self._perplexity_url, timeout=self.http_connect_timeout)]
+        if self._openai_api_key:
+            warm_calls.append(self._async_openai().models.list(timeout=self.http_connect_timeout))
+        for result in await asyncio.gather(*warm_calls, return_exceptions=True):
+            if isinstance(result, Exception) and self.debug:
+                print(f"[WARN] Прогрев соединения не удался: {result}")
+
+    def http_pool_stats(self) -> Dict[str, Any]:
+        # Метрики переиспользования соединений по данным пулов urllib3
+        session = _shared_clients.get(self._http_key())
+        requests_sent = 0
+        connections_opened = 0
+        if session is not None:
+            adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+            for adapter in adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    requests_sent += pool.num_requests
+                    connections_opened += pool.num_connections
+        reused = max(0, requests_sent - connections_opened)
+        return {
+            "requests": requests_sent,
+            "connections_opened": connections_opened,
+            "reused_requests": reused,
+            "reuse_ratio": reused / requests_sent if requests_sent else 0.0,
+        }
+
+    def _status_event(self, description: str) -> Dict[str, Any]:
+        return {
+            "event": {
+                "type": "status",
+                "data": {
+                    "description": description,
+                    "done": True,
+                },
+            }
+        }
+
+    def _agent_specs(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            "internal_docs": {
+                "handler": self._analyze_internal_compliance,
+                "async_handler": self._aanalyze_internal_compliance,
+                "label": "Анализ внутренних документов (ВНД)",
+                "source": "internal_documents",
+                "agent": "VND",
+            },
+            "legal": {
+                "handler": self._analyze_legal_compliance,
+                "async_handler": self._aanalyze_legal_compliance,
+                "label": "Правовой анализ (законодательство РК)",
+                "source": "legal_documents",
+                "agent": "Legal",
+            },
+            "web_search": {
+                "handler": self._analyze_public_reaction,
+                "async_handler": self._aanalyze_public_reaction,
+                "label": "Веб-поиск и репутационный анализ",
+                "source": "web_search",
+                "agent": "WebSearch",
+            },
+        }
+
+    def _agent_payloads(self, global_queries: Dict[str, str], text: str) -> Dict[str, str]:
+        return {
+            "internal_docs": f"{global_queries['vnd_query']}{_PAYLOAD_CONTEXT_SEP}{text}",
+            "legal": f"{global_queries['legal_query']}{_PAYLOAD_CONTEXT_SEP}{text}",
+            "web_search": f"{global_queries['web_query']} {text[:500]}",
+        }
+
+    def _submit_agents(
+        self,
+        executor: ThreadPoolExecutor,
+        payloads: Dict[str, str],
+    ) -> Dict[Future, str]:
+        return {
+            self._submit(executor, self._run_agent, key, payload): key
+            for key, payload in payloads.items()
+        }
+
+    def _run_agent(self, key: str, payload: str) -> Dict[str, Any]:
+        with self._timed("agent", key):
+            return self._agent_specs()[key]["handler"](payload)
+
+    def _agent_result(self, key: str, future: Future, payload: str) -> Dict[str, Any]:
+        try:
+            return future.result()
+        except Exception as exc:
+            spec = self._agent_specs()[key]
+            return self._agent_error(payload, exc, spec["source"], spec["agent"])
+
+    def _agent_status(self, key: str, analysis: Dict[str, Any]) -> str:
+        label = self._agent_specs()[key]["label"]
+        if analysis.get("status") == "error":
+            return f"{label}: ошибка — {analysis.get('error', 'неизвестная ошибка')}"
+        return f"{label}: завершен"
+
+    def _run_agents_concurrently(
+        self,
+        payloads: Dict[str, str],
+    ) -> Generator[Dict[str, Any], None, Tuple[Dict[str, Any], Dict[str, Future]]]:
+        # Запускаем всех подагентов сразу и отдаём статус по мере завершения каждого.
+        # Возвращает словарь анализов в исходном порядке ключей payloads и
+        # future опоздавших агентов (их место в анализах занимает заглушка).
+        analyses: Dict[str, Any] = {}
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, self.max_agent_workers),
+            thread_name_prefix="skai-agent",
+        )
+        try:
+            futures = self._submit_agents(executor, payloads)
+            for key in self._collect_agents(futures, payloads, analyses):
+                yield self._status_event(self._agent_status(key, analyses[key]))
+        finally:
+            executor.shutdown(wait=False)
+        late = {key: future for future, key in futures.items() if key not in analyses}
+        return self._speculative_analyses(payloads, analyses), late
+
+    def _collect_agents(
+        self,
+        futures: Dict[Future, str],
+        payloads: Dict[str, str],
+        analyses: Dict[str, Any],
+    ) -> Iterator[str]:
+        # Отдаёт ключи агентов по мере завершения. Когда остались только агенты из
+        # speculative_agents, ждём их до мягкого дедлайна и выходим — остальные опоздали
+        started = time.monotonic()
+        pending = dict(futures)
+        while pending:
+            done, _ = wait_futures(
+                pending,
+                timeout=self._soft_wait_timeout(started, pending.values()),
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                return
+            for future in done:
+                key = pending.pop(future)
+                analyses[key] = self._agent_result(key, future, payloads[key])
+                yield key
+
+    def _soft_wait_timeout(self, started: float, pending_keys: Iterable[str]) -> Optional[float]:
+        soft_deadline = float(self.agent_soft_deadline_seconds or 0.0)
+        if soft_deadline <= 0 or any(
+            key not in self.speculative_agents for key in pending_keys
+        ):
+            return None
+        return max(0.0, started + soft_deadline - time.monotonic())
+
+    def _late_wait_timeout(self) -> float:
+        timeout = max(0.0, float(self.agent_late_wait_seconds or 0.0))
+        remaining = self._deadline_remaining()
+        return timeout if remaining is None else max(0.0, min(timeout, remaining))
+
+    def _speculative_analyses(
+        self, payloads: Dict[str, str], analyses: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        # Исходный порядок ключей; вместо опоздавших агентов — заглушки "pending"
+        speculative: Dict[str, Any] = {}
+        for key, payload in payloads.items():
+            if key in analyses:
+                speculative[key] = analyses[key]
+                continue
+            spec = self._agent_specs()[key]
+            speculative[key] = {
+                "status": "pending",
+                "query": payload,
+                "source": spec["source"],
+                "agent": spec["agent"],
+            }
+        return speculative
+
+    def _finish_late_agents(
+        self,
+        item: Dict[str, str],
+        analyses: Dict[str, Any],
+        decision_result: Dict[str, Any],
+        late: Dict[str, Future],
+    ) -> Dict[str, Any]:
+        # Предварительное решение уже принято; ждём опоздавших ограниченное время
+        done, _ = wait_futures(late.values(), timeout=self._late_wait_timeout())
+        arrived = {
+            key: self._agent_result(key, future, analyses[key]["query"])
+            for key, future in late.items()
+            if future in done
+        }
+        request = self._merge_late_results(item, analyses, decision_result, arrived)
+        if request is None:
+            return decision_result
+        try:
+            response_text = self._cached_response_text("synthesis", request)
+        except Exception:
+            # Предварительное решение остаётся в силе
+            return decision_result
+        return self._revised_decision(decision_result, response_text)
+
+    def _merge_late_results(
+        self,
+        item: Dict[str, str],
+        analyses: Dict[str, Any],
+        decision_result: Dict[str, Any],
+        arrived: Dict[str, Dict[str, Any]],
+    ) -> Optional[Dict[str, Any]]:
+        # Поздние результаты встают на место заглушек. Возвращает запрос пересинтеза
+        # или None, если решение остаётся прежним (дополнение, ошибка, нет данных)
+        decision_result["partial_inputs"] = [
+            key for key, analysis in analyses.items() if analysis.get("status") == "pending"
+        ]
+        analyses.update(arrived)
+        useful = {
+            key: analysis for key, analysis in arrived.items() if analysis.get("status") == "success"
+        }
+        if not useful or decision_result.get("error"):
+            return None
+        decision_result["late_inputs"] = list(useful)
+        if self.late_agent_policy == "addendum":
+            decision_result["addendum"] = "\n\n".join(
+                f"{self._agent_specs()[key]['label']}:\n{analysis['response']}"
+                for key, analysis in useful.items()
+            )
+            return None
+        return self._late_synthesis_request(item, decision_result, useful)
+
+    def _late_synthesis_request(
+        self,
+        item: Dict[str, str],
+        decision_result: Dict[str, Any],
+        late_analyses: Dict[str, Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        # Дешёвый пересинтез: вместо всего контекста — предварительное решение и
+        # только поздние данные, модель меньше основной
+        late_context = "\n\n".join(
+            f"{self._agent_specs()[key]['label'].upper()}:\n{analysis['response']}"
+            for key, analysis in late_analyses.items()
+        )
+        return {
+            "model": self.late_synthesis_model,
+            "instructions": _PROMPTS["late_synthesis"],
+            "input": (
+                f"ПУНКТ ПОВЕСТКИ ДНЯ: {item['title']}\n\n"
+                f"ПРЕДВАРИТЕЛЬНОЕ РЕШЕНИЕ:\n{decision_result['full_response']}\n\n"
+                f"ДАННЫЕ, ПОСТУПИВШИЕ ПОСЛЕ РЕШЕНИЯ:\n{late_context}"
+            ),
+            "prompt_cache_key": "skai-late_synthesis",
+        }
+
+    def _revised_decision(
+        self, decision_result: Dict[str, Any], response_text: str
+    ) -> Dict[str, Any]:
+        revised = self._parse_decision(response_text)
+        revised["late_inputs"] = decision_result["late_inputs"]
+        revised["partial_inputs"] = [
+            key
+            for key in decision_result["partial_inputs"]
+            if key not in decision_result["late_inputs"]
+        ]
+        revised["revised"] = True
+        return revised
+
+    def _synthesis_status(self, late: Dict[str, Any]) -> str:
+        if not late:
+            return "Синтезируем решение виртуального директора..."
+        missing = ", ".join(self._agent_specs()[key]["label"] for key in late)
+        return f"Синтезируем предварительное решение (ещё не готово: {missing})..."
+
+    def _late_agents_status(self, decision_result: Dict[str, Any]) -> str:
+        if decision_result.get("revised"):
+            return "Решение пересмотрено с учётом поздних результатов агентов"
+        if decision_result.get("addendum"):
+            return "Поздние результаты агентов добавлены к решению"
+        return "Поздние результаты агентов не получены — решение по неполным данным"
+
+    def _analyze_agenda_item(
+        self,
+        item: Dict[str, str],
+        global_queries: Dict[str, str],
+        agent_executor: ThreadPoolExecutor,
+    ) -> Dict[str, Any]:
+        payloads = self._agent_payloads(global_queries, item["full_text"])
+        futures = self._submit_agents(agent_executor, payloads)
+        analyses: Dict[str, Any] = {}
+        for _ in self._collect_agents(futures, payloads, analyses):
+            pass
+        late = {key: future for future, key in futures.items() if key not in analyses}
+        analyses = self._speculative_analyses(payloads, analyses)
+        decision_result = self._synthesize_decision(item, analyses)
+        if late:
+            decision_result = self._finish_late_agents(item, analyses, decision_result, late)
+        return self._build_result_entry(item, analyses, decision_result)
+
+    def _analyze_items_concurrently(
+        self,
+        items: List[Dict[str, str]],
+        global_queries: Dict[str, str],
+        results: Optional[List[Optional[Dict[str, Any]]]] = None,
+    ) -> Generator[Any, None, List[Dict[str, Any]]]:
+        # Пункты обрабатываются на ограниченном пуле; подагенты каждого пункта
+        # идут в отдельный пул, чтобы задачи пунктов не блокировали друг друга.
+        # Уже заполненные элементы results (например, из инкрементального режима)
+        # повторно не анализируются.
+        if results is None:
+            results = [None] * len(items)
+        pending = [index for index, result in enumerate(results) if result is None]
+        chunks, next_section = self._ready_report_sections(results, 0)
+        yield from chunks
+        item_workers = max(1, self.max_item_workers)
+        agent_executor = ThreadPoolExecutor(
+            max_workers=item_workers * max(1, self.max_agent_workers),
+            thread_name_prefix="skai-agent",
+        )
+        try:
+            with ThreadPoolExecutor(
+                max_workers=item_workers,
+                thread_name_prefix="skai-item",
+            ) as item_executor:
+                futures = {
+                    self._submit(
+                        item_executor,
+                        self._analyze_agenda_item,
+                        items[index],
+                        global_queries,
+                        agent_executor,
+                    ): index
+                    for index in pending
+                }
+                for done_count, future in enumerate(as_completed(futures), 1):
+                    index = futures[future]
+                    try:
+                        results[index] = future.result()
+                    except Exception as exc:
+                        results[index] = self._build_result_entry(
+                            items[index], {}, self._failed_decision(exc)
+                        )
+                    yield self._status_event(
+                        self._item_status(results[index], done_count, len(pending))
+                    )
+                    chunks, next_section = self._ready_report_sections(results, next_section)
+                    yield from chunks
+        finally:
+            # Агенты, брошенные после мягкого дедлайна, дорабатывают в фоне — не ждём их
+            agent_executor.shutdown(wait=False)
+        return [result for result in results if result is not None]
+
+    def _item_status(self, result: Dict[str, Any], done_count: int, total: int) -> str:
+        return (
+            f"Пункт {result['item']['number']}: решение {result['decision']} "
+            f"({done_count}/{total})"
+        )
+
+    def _ready_report_sections(
+        self,
+        results: List[Optional[Dict[str, Any]]],
+        next_section: int,
+    ) -> Tuple[List[str], int]:
+        # В потоковом режиме разделы отчёта отдаются по порядку пунктов,
+        # как только готов очередной непрерывный префикс результатов.
+        chunks: List[str] = []
+        while next_section < len(results) and results[next_section] is not None:
+            if self.output_format == "ndjson":
+                chunks.append("".join(self._ndjson_result_lines(results[next_section])))
+            elif self._stream_text_report():
+                chunks.append(self._report_chunk(self._report_item_lines(results[next_section])))
+            next_section += 1
+        return chunks, next_section
+
+    def _item_scope(self, body: dict, global_context: Dict[str, Any]) -> str:
+        # Область повторного использования: явный agenda_id запроса или компании
+        # повестки, найденные локально. Запросы агентов сюда не входят — LLM
+        # переписывает их при любой правке повестки, и совпадений бы не осталось
+        if body.get("agenda_id"):
+            return f"id:{body['agenda_id']}"
+        companies = sorted({company.lower() for company in global_context.get("companies", [])})
+        return json.dumps(companies, ensure_ascii=False)
+
+    def _item_fingerprint(self, item: Dict[str, str], scope: str) -> str:
+        # Номер пункта в отпечаток не входит: перенумерация не считается изменением.
+        # Типовой пункт («Разное») чужой повестки не совпадёт — у неё другая область
+        normalized = re.sub(r"\s+", " ", item["full_text"]).strip().lower()
+        raw = json.dumps([normalized, scope], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _analyze_items_incrementally(
+        self,
+        items: List[Dict[str, str]],
+        global_queries: Dict[str, str],
+        scope: str,
+    ) -> Generator[Any, None, List[Dict[str, Any]]]:
+        results, fingerprints = self._load_previous_results(items, scope)
+        changed_indexes = [index for index, result in enumerate(results) if result is None]
+        if len(changed_indexes) < len(items):
+            yield self._status_event(self._reused_status(items, changed_indexes))
+        analyzed_at = datetime.now().isoformat()
+        results = yield from self._analyze_items_concurrently(items, global_queries, results)
+        self._store_item_results(results, fingerprints, changed_indexes, analyzed_at)
+        return results
+
+    def _load_previous_results(
+        self,
+        items: List[Dict[str, str]],
+        scope: str,
+    ) -> Tuple[List[Optional[Dict[str, Any]]], List[str]]:
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        fingerprints = [self._item_fingerprint(item, scope) for item in items]
+        for index, (item, fingerprint) in enumerate(zip(items, fingerprints)):
+            stored = self._cache_get("item_analysis", fingerprint)
+            if stored is None:
+                continue
+            previous = json.loads(stored)
+            results[index] = self._build_result_entry(item, previous["analyses"], previous)
+            results[index]["reused"] = True
+            results[index]["analyzed_at"] = previous.get("analyzed_at", "")
+        return results, fingerprints
+
+    def _reused_status(self, items: List[Dict[str, str]], changed_indexes: List[int]) -> str:
+        reused_count = len(items) - len(changed_indexes)
+        return f"Без изменений с предыдущего запуска: {reused_count} из {len(items)} пунктов"
+
+    def _result_complete(self, result: Dict[str, Any]) -> bool:
+        # Решение принято по ответам всех агентов без ошибок и без опоздавших
+        return "error" not in result and not result.get("partial_inputs") and all(
+            analysis.get("status") == "success" for analysis in result["analyses"].values()
+        )
+
+    def _store_item_results(
+        self,
+        results: List[Dict[str, Any]],
+        fingerprints: List[str],
+        changed_indexes: List[int],
+        analyzed_at: str,
+    ) -> None:
+        for index in changed_indexes:
+            result = results[index]
+            result["analyzed_at"] = analyzed_at
+            # Ошибочные анализы не сохраняем, чтобы следующий запуск их повторил
+            if self._result_complete(result):
+                stored_entry = {key: value for key, value in result.items() if key != "item"}
+                self._cache_put(
+                    "item_analysis",
+                    fingerprints[index],
+                    json.dumps(stored_entry, ensure_ascii=False),
+                )
+
+    def _build_result_entry(
+        self,
+        item: Dict[str, str],
+        analyses: Dict[str, Any],
+        decision_result: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        entry = {
+            "item": item,
+            "analyses": analyses,
+            "decision": decision_result["decision"],
+            "reasoning": decision_result["reasoning"],
+            "risks": decision_result["risks"],
+            "recommendations": decision_result["recommendations"],
+        }
+        # Бюджет задержки: каких данных не хватило решению и что пришло после синтеза
+        for key in ("partial_inputs", "late_inputs", "revised", "addendum", "error"):
+            if decision_result.get(key):
+                entry[key] = decision_result[key]
+        return entry
+
+    def _deadline_remaining(self) -> Optional[float]:
+        state = _run_state.get()
+        if not state or state.get("deadline") is None:
+            return None
+        return state["deadline"] - time.monotonic()
+
+    def _call_timeout(self, limit: float) -> float:
+        # Таймаут отдельного вызова не выходит за пределы оставшегося бюджета запуска
+        remaining = self._deadline_remaining()
+        if remaining is None:
+            return limit
+        return max(0.001, min(limit, remaining))
+
+    def _error_status(self, exc: Exception) -> Optional[int]:
+        if isinstance(exc, APIStatusError):
+            return exc.status_code
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+        return status if isinstance(status, int) else None
+
+    def _retry_after(self, exc: Exception) -> Optional[float]:
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+        if not headers:
+            return None
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            try:
+                return float(retry_after_ms) / 1000.0
+            except ValueError:
+                pass
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def _is_retryable(self, exc: Exception) -> bool:
+        if isinstance(
+            exc,
+            (
+                APIConnectionError,
+                APITimeoutError,
+                requests.ConnectionError,
+                requests.Timeout,
+                httpx.TransportError,
+            ),
+        ):
+            return True
+        status = self._error_status(exc)
+        return status is not None and (status in (408, 409, 429) or status >= 500)
+
+    def _retry_delay(self, attempt: int, exc: Exception) -> float:
+        # Полный jitter поверх экспоненты; Retry-After от провайдера — нижняя граница
+        backoff = min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt))
+        delay = random.uniform(0, backoff)
+        retry_after = self._retry_after(exc)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.retry_max_delay))
+        return delay
+
+    def _breaker_allows(self, backend: str) -> bool:
+        # После cooldown цепь полуоткрыта: пропускается ровно один пробный вызов.
+        # Если проба не вернула ни успеха, ни ошибки (отмена, сбой вне запроса),
+        # следующий пробный вызов допускается ещё через cooldown.
+        now = time.monotonic()
+        with self._breaker_lock:
+            breaker = self._breakers.get(backend)
+            if breaker is None or not breaker["opened_until"]:
+                return True
+            if now < breaker["opened_until"] or now < breaker["probe_until"]:
+                return False
+            breaker["probe_until"] = now + self.breaker_cooldown_seconds
+            return True
+
+    def _breaker_record(self, backend: str, success: bool) -> None:
+        # Успех замыкает цепь; ошибка пробного вызова снова размыкает её
+        # (счётчик ошибок при этом не сбрасывается).
+        with self._breaker_lock:
+            breaker = self._breakers.setdefault(
+                backend, {"failures": 0, "opened_until": 0.0, "probe_until": 0.0}
+            )
+            breaker["probe_until"] = 0.0
+            if success:
+                breaker["failures"] = 0
+                breaker["opened_until"] = 0.0
+                return
+            breaker["failures"] += 1
+            if breaker["failures"] >= max(1, self.breaker_failure_threshold):
+                breaker["opened_until"] = time.monotonic() + self.breaker_cooldown_seconds
+
+    def _before_attempt(self, backend: str) -> None:
+        if not self._breaker_allows(backend):
+            raise RuntimeError(
+                f"Бэкенд {backend} временно отключён размыкателем цепи после серии ошибок"
+            )
+        remaining = self._deadline_remaining()
+        if remaining is not None and remaining <= 0:
+            raise TimeoutError("Исчерпан общий бюджет времени на анализ повестки")
+
+    def _after_failure(self, backend: str, attempt: int, exc: Exception) -> Optional[float]:
+        # Возвращает паузу перед следующей попыткой или None, если повторять не нужно.
+        # Размыкатель считает только сбои бэкенда (транспорт, 408/409/429/5xx).
+        # Ответ 400/401/404/422 — ошибка самого запроса: бэкенд доступен
+        retryable = self._is_retryable(exc)
+        if retryable:
+            self._breaker_record(backend, success=False)
+        elif self._error_status(exc) is not None:
+            self._breaker_record(backend, success=True)
+        attempts = max(1, self.retry_attempts.get(backend, 1))
+        if not retryable or attempt + 1 >= attempts:
+            return None
+        delay = self._retry_delay(attempt, exc)
+        remaining = self._deadline_remaining()
+        if remaining is not None and delay >= remaining:
+            return None
+        return delay
+
+    def _resilient_call(
+        self,
+        backend: str,
+        call: Callable[[], Any],
+        tokens: int = 0,
+        model: str = "",
+        acquire_slot: bool = True,
+    ) -> Any:
+        # acquire_slot=False — слот провайдера уже занят вызывающим (потоковый ответ)
+        attempt = 0
+        while True:
+            self._before_attempt(backend)
+            charged = self._take_tokens(backend, model, tokens)
+            try:
+                with self._provider_slot(backend) if acquire_slot else nullcontext():
+                    result = call()
+            except Exception as exc:
+                self._refund_rate(backend, model, charged)
+                self._observe_rate_limit_error(backend, model, exc)
+                delay = self._after_failure(backend, attempt, exc)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._breaker_record(backend, success=True)
+            return result
+
+    async def _aresilient_call(
+        self,
+        backend: str,
+        call: Callable[[], Awaitable[Any]],
+        tokens: int = 0,
+        model: str = "",
+        acquire_slot: bool = True,
+    ) -> Any:
+        attempt = 0
+        while True:
+            self._before_attempt(backend)
+            charged = await self._atake_tokens(backend, model, tokens)
+            try:
+                async with self._aprovider_slot(backend) if acquire_slot else nullcontext():
+                    result = await call()
+            except Exception as exc:
+                self._refund_rate(backend, model, charged)
+                self._observe_rate_limit_error(backend, model, exc)
+                delay = self._after_failure(backend, attempt, exc)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._breaker_record(backend, success=True)
+            return result
+
+    def _request_tokens(self, request: Dict[str, Any]) -> int:
+        # Оценка стоимости запроса до отправки: входные токены плюс лимит ответа,
+        # который провайдер резервирует в счёт токенов в минуту
+        prompt = json.dumps(request, ensure_ascii=False, default=str)
+        reserved = request.get("max_output_tokens") or request.get("max_tokens") or 0
+        return self._estimate_tokens(prompt) + int(reserved)
+
+    def _configured_limit(self, limits: Dict[str, int], backend: str, model: str) -> float:
+        return float(limits.get(f"{backend}/{model}") or limits.get(backend) or 0)
+
+    def _rate_bucket(self, backend: str, model: str, now: float) -> Dict[str, Any]:
+        # Вызывается под _rate_lock
+        return _rate_buckets.setdefault(
+            (backend, model),
+            {
+                "requests": None,
+                "tokens": None,
+                "requests_limit": 0.0,
+                "tokens_limit": 0.0,
+                "blocked_until": 0.0,
+                "updated": now,
+            },
+        )
+
+    def _bucket_limit(self, bucket: Dict[str, Any], backend: str, model: str, name: str) -> float:
+        # Вызывается под _rate_lock. Настройка важнее лимита из заголовков провайдера
+        configured = self._configured_limit(
+            getattr(self, f"provider_{name}_per_minute"), backend, model
+        )
+        return configured or bucket[f"{name}_limit"]
+
+    def _refill_bucket(self, bucket: Dict[str, Any], backend: str, model: str, now: float) -> None:
+        # Вызывается под _rate_lock: пополнение обеих корзин до момента now
+        elapsed = now - bucket["updated"]
+        for name in ("requests", "tokens"):
+            limit = self._bucket_limit(bucket, backend, model, name)
+            if limit > 0 and bucket[name] is not None:
+                bucket[name] = min(limit, bucket[name] + elapsed * limit / 60.0)
+        bucket["updated"] = now
+
+    def _reserve_rate(
+        self, backend: str, model: str, tokens: int
+    ) -> Tuple[float, Dict[str, float]]:
+        # Резервирование с отложенной оплатой: стоимость списывается сразу, корзина
+        # может уйти в минус, а вызов ждёт, пока долг не покроется пополнением.
+        # Очередь тем самым строго в порядке обращения (FIFO) для всех запусков
+        # процесса, а запросы идут равномерно на уровне квоты без всплесков.
+        # Возвращает паузу и фактически списанное — для возврата при неудаче.
+        costs = {"requests": 1.0, "tokens": float(tokens)}
+        now = time.monotonic()
+        with _rate_lock:
+            bucket = self._rate_bucket(backend, model, now)
+            self._refill_bucket(bucket, backend, model, now)
+            levels: Dict[str, float] = {}
+            charged: Dict[str, float] = {}
+            wait = max(0.0, bucket["blocked_until"] - now)
+            for name, cost in costs.items():
+                limit = self._bucket_limit(bucket, backend, model, name)
+                if limit <= 0 or cost <= 0:
+                    continue
+                rate = limit / 60.0
+                level = limit if bucket[name] is None else bucket[name]
+                charged[name] = min(cost, limit)
+                levels[name] = min(limit, level) - charged[name]
+                if levels[name] < 0:
+                    wait = max(wait, -levels[name] / rate)
+            remaining = self._deadline_remaining()
+            if wait > 0 and remaining is not None and wait >= remaining:
+                # Не резервируем то, чего не дождёмся: место в очереди остаётся другим
+                raise TimeoutError("Исчерпан общий бюджет времени на анализ повестки")
+            bucket.update(levels)
+        return wait, charged
+
+    def _refund_rate(self, backend: str, model: str, charged: Dict[str, float]) -> None:
+        # Неудачная попытка квоту не израсходовала (429 провайдер не засчитывает),
+        # а повтор резервирует её заново — иначе серия 429 копит лишний долг
+        now = time.monotonic()
+        with _rate_lock:
+            bucket = self._rate_bucket(backend, model, now)
+            self._refill_bucket(bucket, backend, model, now)
+            for name, cost in charged.items():
+                limit = self._bucket_limit(bucket, backend, model, name)
+                if bucket[name] is not None and limit > 0:
+                    bucket[name] = min(limit, bucket[name] + cost)
+
+    def _take_tokens(self, backend: str, model: str, tokens: int) -> Dict[str, float]:
+        wait, charged = self._reserve_rate(backend, model, tokens)
+        if wait > 0:
+            with self._timed("call", f"{backend}_rate_wait"):
+                time.sleep(wait)
+        return charged
+
+    async def _atake_tokens(self, backend: str, model: str, tokens: int) -> Dict[str, float]:
+        wait, charged = self._reserve_rate(backend, model, tokens)
+        if wait > 0:
+            with self._timed("call", f"{backend}_rate_wait"):
+                await asyncio.sleep(wait)
+        return charged
+
+    def _reset_seconds(self, value: Any) -> Optional[float]:
+        if not value:
+            return None
+        parts = _RESET_PART_RE.findall(str(value))
+        if not parts:
+            try:
+                return float(value)
+            except ValueError:
+                return None
+        return sum(float(number) * _RESET_UNIT_SECONDS[unit] for number, unit in parts)
+
+    def _observe_rate_limits(
+        self, backend: str, model: str, headers: Any, throttled_for: Optional[float] = None
+    ) -> None:
+        # Заголовки x-ratelimit-* отражают квоту с учётом всех клиентов ключа:
+        # лимит уточняет скорость пополнения, остаток — текущий уровень корзины
+        now = time.monotonic()
+        with _rate_lock:
+            bucket = self._rate_bucket(backend, model, now)
+            # Остаток из заголовков — уровень на текущий момент: пополнение до now
+            # учитывается здесь, чтобы _reserve_rate не прибавил его поверх остатка
+            self._refill_bucket(bucket, backend, model, now)
+            for name in ("requests", "tokens"):
+                limit = self._header_number(headers, f"x-ratelimit-limit-{name}")
+                if limit:
+                    bucket[f"{name}_limit"] = limit
+                remaining = self._header_number(headers, f"x-ratelimit-remaining-{name}")
+                if remaining is None:
+                    continue
+                if bucket[name] is None:
+                    bucket[name] = remaining
+                else:
+                    # Локально уже списаны запросы «в полёте», сервер их ещё не видел
+                    bucket[name] = min(bucket[name], remaining)
+                if remaining <= 0 and throttled_for is None:
+                    throttled_for = self._reset_seconds(headers.get(f"x-ratelimit-reset-{name}"))
+            if throttled_for:
+                bucket["blocked_until"] = max(bucket["blocked_until"], now + throttled_for)
+
+    def _observe_rate_limit_error(self, backend: str, model: str, exc: Exception) -> None:
+        if self._error_status(exc) != 429:
+            return
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+        # 429: все новые запросы к этой модели ждут сброса лимита, а не бьются в него
+        throttled_for = self._retry_after(exc)
+        if throttled_for is None and headers:
+            throttled_for = max(
+                (
+                    self._reset_seconds(headers.get(f"x-ratelimit-reset-{name}")) or 0.0
+                    for name in ("requests", "tokens")
+                ),
+                default=0.0,
+            )
+        self._observe_rate_limits(
+            backend, model, headers or {}, throttled_for or self.retry_base_delay
+        )
+
+    def _header_number(self, headers: Any, name: str) -> Optional[float]:
+        value = headers.get(name) if headers else None
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    @contextmanager
+    def _provider_slot(self, backend: str) -> Iterator[None]:
+        limit = int(self.provider_concurrency.get(backend) or 0)
+        if limit <= 0:
+            yield
+            return
+        with self._provider_lock:
+            slot = self._provider_slots.get(backend)
+            if slot is None:
+                slot = self._provider_slots[backend] = threading.BoundedSemaphore(limit)
+        with slot:
+            yield
+
+    def _aprovider_slot(self, backend: str) -> Any:
+        # Семафор asyncio привязан к циклу событий — свой на каждый цикл
+        limit = int(self.provider_concurrency.get(backend) or 0)
+        if limit <= 0:
+            return nullcontext()
+        key = (backend, id(asyncio.get_running_loop()))
+        with self._provider_lock:
+            slot = self._provider_slots.get(key)
+            if slot is None:
+                slot = self._provider_slots[key] = asyncio.Semaphore(limit)
+        return slot
+
+    def _openai_create(
+        self, stage: str, request: Dict[str, Any], acquire_slot: bool = True, **options: Any
+    ) -> Any:
+        model = str(request.get("model", ""))
+
+        def call() -> Any:
+            # Сырой ответ нужен ради заголовков x-ratelimit-*
+            raw = self._openai().responses.with_raw_response.create(
+                **request, **options, timeout=self._call_timeout(self.openai_timeout)
+            )
+            self._observe_rate_limits("openai", model, raw.headers)
+            return raw.parse()
+
+        with self._timed("call", stage):
+            response = self._resilient_call(
+                "openai", call, self._request_tokens(request), model, acquire_slot
+            )
+        self._record_usage(stage, getattr(response, "usage", None))
+        return response
+
+    async def _aopenai_create(
+        self, stage: str, request: Dict[str, Any], acquire_slot: bool = True, **options: Any
+    ) -> Any:
+        model = str(request.get("model", ""))
+
+        async def call() -> Any:
+            raw = await self._async_openai().responses.with_raw_response.create(
+                **request, **options, timeout=self._call_timeout(self.openai_timeout)
+            )
+            self._observe_rate_limits("openai", model, raw.headers)
+            return raw.parse()
+
+        with self._timed("call", stage):
+            response = await self._aresilient_call(
+                "openai", call, self._request_tokens(request), model, acquire_slot
+            )
+        self._record_usage(stage, getattr(response, "usage", None))
+        return response
+
+    @contextmanager
+    def _timed(self, kind: str, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self._record_timing(kind, name, time.perf_counter() - started, status)
+
+    def _record_timing(self, kind: str, name: str, seconds: float, status: str = "ok") -> None:
+        state = _run_state.get()
+        with self._metrics_lock:
+            series = self._metrics[kind].setdefault(
+                name, {"count": 0, "errors": 0, "sum": 0.0, "max": 0.0}
+            )
+            series["count"] += 1
+            series["errors"] += status == "error"
+            series["sum"] += seconds
+            series["max"] = max(series["max"], seconds)
+            if state is not None:
+                run_series = state["metrics"][kind].setdefault(name, {"count": 0, "seconds": 0.0})
+                run_series["count"] += 1
+                run_series["seconds"] += seconds
+        self._emit_metric(
+            {"type": "timing", "kind": kind, "name": name, "seconds": seconds, "status": status}
+        )
+
+    def _record_usage(self, stage: str, usage: Any) -> None:
+        # Токены из response.usage; cached_tokens — попадания в кэш промптов OpenAI.
+        # Perplexity отдаёт usage в формате Chat Completions (prompt/completion_tokens)
+        if usage is None:
+            return
+        if isinstance(usage, dict):
+            tokens = {
+                "input": int(usage.get("prompt_tokens") or 0),
+                "output": int(usage.get("completion_tokens") or 0),
+            }
+        else:
+            details = getattr(usage, "input_tokens_details", None)
+            tokens = {
+                "input": int(getattr(usage, "input_tokens", 0) or 0),
+                "output": int(getattr(usage, "output_tokens", 0) or 0),
+                "cached": int(getattr(details, "cached_tokens", 0) or 0),
+            }
+        state = _run_state.get()
+        with self._metrics_lock:
+            totals = [self._metrics["tokens"].setdefault(stage, {})]
+            if state is not None:
+                totals.append(state["metrics"]["tokens"].setdefault(stage, {}))
+            for total in totals:
+                for token_kind, value in tokens.items():
+                    total[token_kind] = total.get(token_kind, 0) + value
+        self._emit_metric({"type": "usage", "name": stage, **tokens})
+
+    def _emit_metric(self, event: Dict[str, Any]) -> None:
+        for sink in list(self.metrics_sinks):
+            try:
+                sink(event)
+            except Exception as exc:
+                if self.debug:
+                    print(f"[WARN] Приёмник метрик завершился с ошибкой: {exc}")
+
+    def _run_metrics_snapshot(self) -> Dict[str, Any]:
+        # Разбивка времени и токенов по текущему запуску для analysis_result
+        state = _run_state.get()
+        if state is None:
+            return {}
+        with self._metrics_lock:
+            snapshot = json.loads(json.dumps(state["metrics"]))
+        snapshot["elapsed_seconds"] = time.monotonic() - state["started_at"]
+        return snapshot
+
+    def export_metrics(self, fmt: str = "prometheus") -> str:
+        with self._metrics_lock:
+            metrics = json.loads(json.dumps(self._metrics))
+        cache = self.cache_stats()
+        http = self.http_pool_stats()
+        with self._flights_lock:
+            flights = dict(self._flight_stats)
+        if fmt == "json":
+            return json.dumps(
+                {**metrics, "cache": cache, "http": http, "flights": flights},
+                ensure_ascii=False,
+                indent=2,
+            )
+        if fmt != "prometheus":
+            raise ValueError(f"Неизвестный формат метрик: {fmt}")
+        lines: List[str] = []
+        names = {
+            "stage": ("skai_stage_seconds", "стадий конвейера"),
+            "agent": ("skai_agent_seconds", "агентов"),
+            "call": ("skai_backend_call_seconds", "вызовов бэкендов"),
+        }
+        for kind, (metric, subject) in names.items():
+            series_items = sorted(metrics[kind].items())
+            # В summary допустимы только _count и _sum: максимум и ошибки —
+            # отдельные семейства со своими HELP/TYPE
+            lines.append(f"# HELP {metric} Длительность {subject}, с")
+            lines.append(f"# TYPE {metric} summary")
+            for name, series in series_items:
+                labels = f'{kind}="{name}"'
+                lines.append(f"{metric}_count{{{labels}}} {series['count']}")
+                lines.append(f"{metric}_sum{{{labels}}} {series['sum']:.6f}")
+            lines.append(f"# HELP {metric}_max Максимальная длительность {subject}, с")
+            lines.append(f"# TYPE {metric}_max gauge")
+            for name, series in series_items:
+                lines.append(f'{metric}_max{{{kind}="{name}"}} {series["max"]:.6f}')
+            lines.append(f"# HELP {metric}_errors_total Число ошибок {subject}")
+            lines.append(f"# TYPE {metric}_errors_total counter")
+            for name, series in series_items:
+                lines.append(f'{metric}_errors_total{{{kind}="{name}"}} {series["errors"]}')
+        lines.append("# TYPE skai_tokens_total counter")
+        for stage, tokens in sorted(metrics["tokens"].items()):
+            for token_kind, value in sorted(tokens.items()):
+                lines.append(f'skai_tokens_total{{stage="{stage}",kind="{token_kind}"}} {value}')
+        # Доля входных токенов из кэша промптов OpenAI — проверка, что префиксы стабильны
+        lines.append("# TYPE skai_prompt_cache_hit_ratio gauge")
+        for stage, tokens in sorted(metrics["tokens"].items()):
+            # Кэш промптов есть только у OpenAI — у стадий без cached доли нет
+            if tokens.get("input") and "cached" in tokens:
+                ratio = tokens.get("cached", 0) / tokens["input"]
+                lines.append(f'skai_prompt_cache_hit_ratio{{stage="{stage}"}} {ratio:.4f}')
+        lines.append("# TYPE skai_prompt_tokens_total counter")
+        for section, tokens in sorted(metrics["prompt"].items()):
+            for token_kind in ("original", "sent"):
+                lines.append(
+                    f'skai_prompt_tokens_total{{section="{section}",kind="{token_kind}"}} '
+                    f"{tokens[token_kind]}"
+                )
+        lines.append("# TYPE skai_coalesced_requests_total counter")
+        for role, value in sorted(flights.items()):
+            lines.append(f'skai_coalesced_requests_total{{role="{role}"}} {value}')
+        lines.append("# TYPE skai_cache_lookups_total counter")
+        for counter, value in sorted(cache["totals"].items()):
+            lines.append(f'skai_cache_lookups_total{{result="{counter}"}} {value}')
+        lines.append("# TYPE skai_http_requests_total counter")
+        lines.append(f"skai_http_requests_total {http['requests']}")
+        lines.append("# TYPE skai_http_connections_opened_total counter")
+        lines.append(f"skai_http_connections_opened_total {http['connections_opened']}")
+        return "\n".join(lines) + "\n"
+
+    def _cache_key(self, source: str, request: Dict[str, Any]) -> str:
+        # Ключ — хэш всех параметров запроса: модель, instructions, input, tools
+        # (включая vector_store_ids) и т. п.
+        raw = json.dumps(
+            {"source": source, "request": request},
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _cache_connection(self) -> Optional[sqlite3.Connection]:
+        # Вызывается под self._cache_lock. При недоступном диске работаем только в памяти.
+        if self._cache_db is not None or self._cache_disk_failed or not self.cache_path:
+            return self._cache_db
+        try:
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            connection = sqlite3.connect(self.cache_path, check_same_thread=False)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, source TEXT NOT NULL, "
+                "value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "DELETE FROM responses WHERE expires_at < ?", (time.time(),)
+            )
+            connection.commit()
+            self._cache_db = connection
+        except Exception as exc:
+            print(f"[WARN] Дисковый кэш недоступен ({self.cache_path}): {exc}")
+            self._cache_disk_failed = True
+        return self._cache_db
+
+    def _cache_count(self, source: str, counter: str) -> None:
+        stats = self._cache_stats.setdefault(
+            source,
+            {"memory_hits": 0, "disk_hits": 0, "semantic_hits": 0, "misses": 0, "writes": 0},
+        )
+        stats[counter] += 1
+
+    def _cache_get(self, source: str, key: str) -> Optional[str]:
+        if not self.cache_enabled:
+            return None
+        now = time.time()
+        with self._cache_lock:
+            entry = self._cache_memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at >= now:
+                    self._cache_memory.move_to_end(key)
+                    self._cache_count(source, "memory_hits")
+                    return value
+                del self._cache_memory[key]
+            connection = self._cache_connection()
+            if connection is not None:
+                try:
+                    row = connection.execute(
+                        "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error:
+                    row = None
+                if row is not None and row[1] >= now:
+                    self._cache_remember(key, row[1], row[0])
+                    self._cache_count(source, "disk_hits")
+                    return row[0]
+            self._cache_count(source, "misses")
+            return None
+
+    def _cache_put(self, source: str, key: str, value: str) -> None:
+        if not self.cache_enabled or not value:
+            return
+        expires_at = time.time() + self.cache_ttl.get(source, 3600)
+        with self._cache_lock:
+            self._cache_remember(key, expires_at, value)
+            self._cache_count(source, "writes")
+            connection = self._cache_connection()
+            if connection is not None:
+                try:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO responses (key, source, value, expires_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (key, source, value, expires_at),
+                    )
+                    connection.commit()
+                except sqlite3.Error as exc:
+                    print(f"[WARN] Не удалось записать в дисковый кэш: {exc}")
+
+    def _cache_remember(self, key: str, expires_at: float, value: str) -> None:
+        self._cache_memory[key] = (expires_at, value)
+        self._cache_memory.move_to_end(key)
+        while len(self._cache_memory) > max(1, self.cache_max_entries):
+            self._cache_memory.popitem(last=False)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        with self._cache_lock:
+            by_source = {source: dict(stats) for source, stats in self._cache_stats.items()}
+            memory_entries = len(self._cache_memory)
+        totals = {"memory_hits": 0, "disk_hits": 0, "semantic_hits": 0, "misses": 0, "writes": 0}
+        for stats in by_source.values():
+            for counter, value in stats.items():
+                totals[counter] += value
+        hits = totals["memory_hits"] + totals["disk_hits"] + totals["semantic_hits"]
+        lookups = hits + totals["misses"]
+        return {
+            "totals": totals,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": memory_entries,
+            "by_source": by_source,
+        }
+
+    def _semantic_response_text(
+        self, source: str, store_id: str, query: str, max_results: int, subject: str
+    ) -> str:
+        self._check_vector_store(store_id)
+        vector, signature = self._semantic_key(subject, max_results)
+        cached = self._semantic_lookup(source, store_id, vector, signature)
+        if cached is not None:
+            return cached
+        request = self._file_search_request(query, store_id, max_results)
+        response_text = self._cached_response_text(source, request)
+        self._semantic_remember(source, store_id, subject, vector, signature, response_text)
+        return response_text
+
+    async def _asemantic_response_text(
+        self, source: str, store_id: str, query: str, max_results: int, subject: str
+    ) -> str:
+        await self._acheck_vector_store(store_id)
+        vector, signature = self._semantic_key(subject, max_results)
+        cached = self._semantic_lookup(source, store_id, vector, signature)
+        if cached is not None:
+            return cached
+        request = self._file_search_request(query, store_id, max_results)
+        response_text = await self._acached_response_text(source, request)
+        self._semantic_remember(source, store_id, subject, vector, signature, response_text)
+        return response_text
+
+    def _embed_text(self, text: str) -> Dict[int, float]:
+        # Локальный «эмбеддинг» без модели: слова и символьные триграммы,
+        # захэшированные в 2^18 измерений, с L2-нормировкой
+        words = re.findall(r"\w+", text.lower())
+        counts: Dict[int, float] = {}
+        for word in words:
+            features = [word] + [word[i:i + 3] for i in range(max(1, len(word) - 2))]
+            for feature in features:
+                bucket = zlib.crc32(feature.encode("utf-8")) & 0x3FFFF
+                counts[bucket] = counts.get(bucket, 0.0) + 1.0
+        norm = sum(value * value for value in counts.values()) ** 0.5 or 1.0
+        return {bucket: value / norm for bucket, value in counts.items()}
+
+    def _semantic_key(self, subject: str, max_results: int) -> Tuple[Dict[int, float], str]:
+        # Общий запрос агента одинаков для всех пунктов и заглушил бы различия
+        # между ними: сравниваем только текст пункта, а запрос — точно, по хэшу
+        scope, _, item = subject.rpartition(_PAYLOAD_CONTEXT_SEP)
+        return self._embed_text(item), self._semantic_signature(item, max_results, scope)
+
+    def _semantic_signature(self, text: str, max_results: int, scope: str = "") -> str:
+        names = {name.strip().lower() for name in _COMPANY_RE.findall(text)}
+        numbers = set(re.findall(r"\d+(?:[.,]\d+)?", text))
+        scope_hash = hashlib.sha256(scope.encode("utf-8")).hexdigest()[:16] if scope else ""
+        return json.dumps(
+            [max_results, scope_hash, sorted(names), sorted(numbers)], ensure_ascii=False
+        )
+
+    def _semantic_lookup(
+        self, source: str, store_id: str, vector: Dict[int, float], signature: str
+    ) -> Optional[str]:
+        if not (self.cache_enabled and self.semantic_cache_enabled) or not vector:
+            return None
+        now = time.time()
+        best_key, best_score = None, 0.0
+        with self._semantic_lock:
+            index = self._semantic_index.get(store_id)
+            if not index:
+                return None
+            for key, entry in list(index.items()):
+                if entry["expires_at"] < now:
+                    del index[key]
+                    continue
+                if entry["signature"] != signature:
+                    continue
+                small, large = sorted((vector, entry["vector"]), key=len)
+                score = sum(value * large.get(bucket, 0.0) for bucket, value in small.items())
+                if score > best_score:
+                    best_key, best_score = key, score
+            if best_key is None or best_score < self.semantic_cache_threshold:
+                return None
+            index.move_to_end(best_key)
+            value = index[best_key]["response"]
+        with self._cache_lock:
+            self._cache_count(source, "semantic_hits")
+        return value
+
+    def _semantic_remember(
+        self,
+        source: str,
+        store_id: str,
+        subject: str,
+        vector: Dict[int, float],
+        signature: str,
+        response_text: str,
+    ) -> None:
+        if not (self.cache_enabled and self.semantic_cache_enabled) or not response_text:
+            return
+        key = hashlib.sha256(f"{signature}\n{subject}".encode("utf-8")).hexdigest()
+        with self._semantic_lock:
+            index = self._semantic_index.setdefault(store_id, OrderedDict())
+            index[key] = {
+                "vector": vector,
+                "signature": signature,
+                "response": response_text,
+                "expires_at": time.time() + self.cache_ttl.get(source, 3600),
+            }
+            index.move_to_end(key)
+            while len(index) > max(1, self.semantic_cache_max_entries):
+                index.popitem(last=False)
+
+    def invalidate_vector_store(self, store_id: str) -> None:
+        # Хранилище обновлено: локальные ответы по нему больше не годятся.
+        # Точный кэш не трогаем — его ключи включают vector_store_ids и живут по TTL
+        with self._semantic_lock:
+            self._semantic_index.pop(store_id, None)
+
+    def _vector_store_fingerprint(self, store: Any) -> str:
+        file_counts = getattr(store, "file_counts", None)
+        return json.dumps(
+            {
+                "files": getattr(file_counts, "completed", None),
+                "total": getattr(file_counts, "total", None),
+                "bytes": getattr(store, "usage_bytes", None),
+            },
+            sort_keys=True,
+        )
+
+    def _vector_store_check_due(self, store_id: str) -> bool:
+        if self.vector_store_check_seconds <= 0:
+            return False
+        now = time.monotonic()
+        with self._semantic_lock:
+            state = self._vector_store_state.setdefault(store_id, {"checked_at": None})
+            if state["checked_at"] is not None and (
+                now - state["checked_at"] < self.vector_store_check_seconds
+            ):
+                return False
+            state["checked_at"] = now
+            return True
+
+    def _vector_store_seen(self, store_id: str, store: Any) -> None:
+        fingerprint = self._vector_store_fingerprint(store)
+        with self._semantic_lock:
+            state = self._vector_store_state[store_id]
+            changed = state.get("fingerprint") not in (None, fingerprint)
+            state["fingerprint"] = fingerprint
+        if changed:
+            self.invalidate_vector_store(store_id)
+
+    def _check_vector_store(self, store_id: str) -> None:
+        if not self._vector_store_check_due(store_id):
+            return
+        try:
+            store = self._openai().vector_stores.retrieve(
+                store_id, timeout=self._call_timeout(self.http_read_timeout)
+            )
+        except Exception as exc:
+            if self.debug:
+                print(f"[WARN] Не удалось проверить хранилище {store_id}: {exc}")
+            return
+        self._vector_store_seen(store_id, store)
+
+    async def _acheck_vector_store(self, store_id: str) -> None:
+        if not self._vector_store_check_due(store_id):
+            return
+        try:
+            store = await self._async_openai().vector_stores.retrieve(
+                store_id, timeout=self._call_timeout(self.http_read_timeout)
+            )
+        except Exception as exc:
+            if self.debug:
+                print(f"[WARN] Не удалось проверить хранилище {store_id}: {exc}")
+            return
+        self._vector_store_seen(store_id, store)
+
+    def _cached_response_text(self, source: str, request: Dict[str, Any]) -> str:
+        # Общая обёртка над responses.create: успешный (непустой) ответ кэшируется
+        cache_key = self._cache_key(source, request)
+        cached = self._cache_get(source, cache_key)
+        if cached is not None:
+            return cached
+        response = self._openai_create(source, request)
+        output_text = response.output_text
+        self._cache_put(source, cache_key, output_text)
+        return output_text
+
+    def _agent_success(
+        self,
+        query: str,
+        response_text: str,
+        source: str,
+        agent: str,
+    ) -> Dict[str, Any]:
+        return {
+            "status": "success",
+            "query": query,
+            "response": response_text,
+            "source": source,
+            "agent": agent,
+        }
+
+    def _agent_error(self, query: str, exc: Exception, source: str, agent: str) -> Dict[str, Any]:
+        return {
+            "status": "error",
+            "query": query,
+            "error": str(exc),
+            "source": source,
+            "agent": agent,
+        }
+
+    def _file_search_request(
+        self,
+        query: str,
+        vector_store_id: str,
+        max_results: int,
+    ) -> Dict[str, Any]:
+        return {
+            "model": "gpt-4o",
+            "input": query,
+            "tools": [{
+                "type": "file_search",
+                "vector_store_ids": [vector_store_id],
+                "max_num_results": max_results,
+            }],
+            "prompt_cache_key": "skai-file_search",
+        }
+
+    def _search_internal_documents(
+        self,
+        query: str,
+        max_results: int = 5,
+        subject: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        try:
+            # Для семантического кэша сравнивается сам вопрос (subject), без шаблона промпта
+            response_text = self._semantic_response_text(
+                "internal_documents",
+                self._vnd_vector_store_id,
+                query,
+                max_results,
+                subject or query,
+            )
+            return self._agent_success(query, response_text, "internal_documents", "VND")
+        except Exception as exc:
+            return self._agent_error(query, exc, "internal_documents", "VND")
+
+    def _internal_compliance_query(self, agenda_item: str) -> str:
+        return f"{_PROMPTS['internal_compliance']}\n{agenda_item}"
+
+    def _analyze_internal_compliance(self, agenda_item: str) -> Dict[str, Any]:
+        return self._search_internal_documents(
+            self._internal_compliance_query(agenda_item), max_results=8, subject=agenda_item
+        )
+
+    def _search_legal_documents(
+        self,
+        query: str,
+        max_results: int = 5,
+        subject: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        try:
+            response_text = self._semantic_response_text(
+                "legal_documents",
+                self._legal_vector_store_id,
+                query,
+                max_results,
+                subject or query,
+            )
+            return self._agent_success(query, response_text, "legal_documents", "Legal")
+        except Exception as exc:
+            return self._agent_error(query, exc, "legal_documents", "Legal")
+
+    def _legal_compliance_query(self, agenda_item: str) -> str:
+        return f"{_PROMPTS['legal_compliance']}\n{agenda_item}"
+
+    def _analyze_legal_compliance(self, agenda_item: str) -> Dict[str, Any]:
+        return self._search_legal_documents(
+            self._legal_compliance_query(agenda_item), max_results=8, subject=agenda_item
+        )
+
+    def _perplexity_headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self._perplexity_api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _perplexity_payload(self, query: str) -> Dict[str, Any]:
+        return {
+            "model": "sonar-pro",
+            "messages": [{"role": "user", "content": f"{_PROMPTS['web_search']}\n{query}"}],
+            "search_domain_filter": self._kz_sites,
+        }
+
+    def _search_with_perplexity(self, query: str) -> Dict[str, Any]:
+        try:
+            data = self._perplexity_payload(query)
+            cache_key = self._cache_key("web_search", data)
+            cached = self._cache_get("web_search", cache_key)
+            if cached is not None:
+                return self._agent_success(query, cached, "web_search_perplexity", "WebSearch")
+            with self._timed("call", "perplexity"):
+                content = self._resilient_call(
+                    "perplexity",
+                    lambda: self._perplexity_post(data),
+                    self._request_tokens(data),
+                    data["model"],
+                )
+            self._cache_put("web_search", cache_key, content)
+            return self._agent_success(query, content, "web_search_perplexity", "WebSearch")
+        except Exception:
+            # Включая разомкнутую цепь: сразу уходим в резервный поиск без ожидания таймаута
+            return self._web_fallback_search(query)
 
-            # 3. Глобальный контекст и запросы
-            yield self._status_event("Извлекаем глобальный контекст...")
-            global_context = self._extract_global_context(summary_text)
-            time.sleep(1)
+    def _perplexity_post(self, data: Dict[str, Any]) -> str:
+        response = self._http().post(
+            self._perplexity_url,
+            headers=self._perplexity_headers(),
+            json=data,
+            timeout=(self.http_connect_timeout, self._call_timeout(self.http_read_timeout)),
+        )
+        self._observe_rate_limits("perplexity", data["model"], response.headers)
+        response.raise_for_status()
+        payload = response.json()
+        self._record_usage("perplexity", payload.get("usage"))
+        return payload["choices"][0]["message"]["content"]
 
-            yield self._status_event("Формируем запросы для агентов...")
-            global_queries = self._generate_global_agent_queries(summary_text, global_context)
-            time.sleep(1)
-
-            analyses: Dict[str, Any] = {}
-
-            # 4. Анализ внутренних документов
-            yield self._status_event("Анализ внутренних документов (ВНД)...")
-            vnd_payload = f"{global_queries['vnd_query']}\n\nКонтекст:\n{summary_text}"
-            analyses["internal_docs"] = self._analyze_internal_compliance(vnd_payload)
-            time.sleep(1)
-
-            # 5. Правовой анализ
-            yield self._status_event("Правовой анализ (законодательство РК)...")
-            legal_payload = f"{global_queries['legal_query']}\n\nКонтекст:\n{summary_text}"
-            analyses["legal"] = self._analyze_legal_compliance(legal_payload)
-            time.sleep(1)
-
-            # 6. Веб-поиск и репутационный анализ
-            yield self._status_event("Веб-поиск и репутационный анализ...")
-            web_payload = f"{global_queries['web_query']} {summary_text[:500]}"
-            analyses["web_search"] = self._analyze_public_reaction(web_payload)
-            time.sleep(1)
-
-            # 7. Синтез решения
-            yield self._status_event("Синтезируем решение виртуального директора...")
-            overall_item = {
-                "number": "-",
-                "title": "Итоговый анализ повестки",
-                "full_text": summary_text,
-            }
-            decision_result = self._synthesize_decision(overall_item, analyses)
-            time.sleep(1)
-
-            result_entry = {
-                "item": overall_item,
-                "analyses": analyses,
-                "decision": decision_result["decision"],
-                "reasoning": decision_result["reasoning"],
-                "risks": decision_result["risks"],
-                "recommendations": decision_result["recommendations"],
-            }
+    def _web_fallback_request(self, query: str) -> Dict[str, Any]:
+        return {
+            "model": "gpt-4o",
+            # Список сайтов задан настройкой и от запроса к запросу не меняется
+            "input": f"{_PROMPTS['web_fallback']} {', '.join(self._kz_sites)}\n\nЗапрос:\n{query}",
+            "tools": [{"type": "web_search_preview"}],
+            "prompt_cache_key": "skai-web_fallback",
+        }
 
-            analysis_result = {
-                "timestamp": datetime.now().isoformat(),
-                "agenda_items_count": 1,
-                "results": [result_entry],
-                "summary": self._generate_summary([result_entry]),
-                "global_analyses": analyses,
-                "summary_text": summary_text,
-                "global_queries": global_queries,
-            }
+    def _web_fallback_search(self, query: str) -> Dict[str, Any]:
+        try:
+            response_text = self._cached_response_text(
+                "web_search", self._web_fallback_request(query)
+            )
+            return self._agent_success(
+                query, response_text, "web_search_responses_api", "WebSearch"
+            )
+        except Exception as exc:
+            return self._agent_error(query, exc, "web_search_fallback", "WebSearch")
 
-            # 8. Формирование отчета
-            yield self._status_event("Анализ завершен. Формируем отчет...")
-            time.sleep(1)
-            report = self._generate_readable_report(analysis_result)
+    def _public_reaction_query(self, agenda_item: str) -> str:
+        return f"{_PROMPTS['public_reaction']}\n{agenda_item}"
 
-            yield self._status_event("Отчет сформирован успешно.")
-            time.sleep(1)
-            yield report
-        except Exception as exc:
-            error_message = f"Ошибка анализа повестки: {exc}"
-            yield self._status_event(error_message)
-            time.sleep(1)
-            yield error_message
-        finally:
-            yield self._status_event("")
+    def _analyze_public_reaction(self, agenda_item: str) -> Dict[str, Any]:
+        return self._search_with_perplexity(self._public_reaction_query(agenda_item))
 
-    def _status_event(self, description: str) -> Dict[str, Any]:
-        return {
-            "event": {
-                "type": "status",
-                "data": {
-                    "description": description,
-                    "done": True,
-                },
-            }
-        }
+    async def _acached_response_text(self, source: str, request: Dict[str, Any]) -> str:
+        cache_key = self._cache_key(source, request)
+        cached = self._cache_get(source, cache_key)
+        if cached is not None:
+            return cached
+        response = await self._aopenai_create(source, request)
+        output_text = response.output_text
+        self._cache_put(source, cache_key, output_text)
+        return output_text
 
-    def _search_internal_documents(self, query: str, max_results: int = 5) -> Dict[str, Any]:
+    async def _asearch_internal_documents(
+        self,
+        query: str,
+        max_results: int = 5,
+        subject: Optional[str] = None,
+    ) -> Dict[str, Any]:
         try:
-            response = self._openai_client.responses.create(
-                model="gpt-4o",
-                input=query,
-                tools=[{
-                    "type": "file_search",
-                    "vector_store_ids": [self._vnd_vector_store_id],
-                    "max_num_results": max_results,
-                }],
+            response_text = await self._asemantic_response_text(
+                "internal_documents",
+                self._vnd_vector_store_id,
+                query,
+                max_results,
+                subject or query,
             )
-            return {
-                "status": "success",
-                "query": query,
-                "response": response.output_text,
-                "source": "internal_documents",
-                "agent": "VND",
-            }
+            return self._agent_success(query, response_text, "internal_documents", "VND")
         except Exception as exc:
-            return {
-                "status": "error",
-                "query": query,
-                "error": str(exc),
-                "source": "internal_documents",
-                "agent": "VND",
-            }
+            return self._agent_error(query, exc, "internal_documents", "VND")
 
-    def _analyze_internal_compliance(self, agenda_item: str) -> Dict[str, Any]:
-        query = f"""
-        Проанализируйте следующий пункт повестки дня на соответствие внутренним \n        документам компании:\n\n        {agenda_item}\n\n        Необходимо проверить:\n        - Соответствие внутренним политикам и процедурам\n        - Требования к процессу принятия решений\n        - Полномочия органов управления\n        - Возможные ограничения или требования\n        """
-        return self._search_internal_documents(query, max_results=8)
+    async def _aanalyze_internal_compliance(self, agenda_item: str) -> Dict[str, Any]:
+        return await self._asearch_internal_documents(
+            self._internal_compliance_query(agenda_item), max_results=8, subject=agenda_item
+        )
 
-    def _search_legal_documents(self, query: str, max_results: int = 5) -> Dict[str, Any]:
+    async def _asearch_legal_documents(
+        self,
+        query: str,
+        max_results: int = 5,
+        subject: Optional[str] = None,
+    ) -> Dict[str, Any]:
         try:
-            response = self._openai_client.responses.create(
-                model="gpt-4o",
-                input=query,
-                tools=[{
-                    "type": "file_search",
-                    "vector_store_ids": [self._legal_vector_store_id],
-                    "max_num_results": max_results,
-                }],
+            response_text = await self._asemantic_response_text(
+                "legal_documents",
+                self._legal_vector_store_id,
+                query,
+                max_results,
+                subject or query,
             )
-            return {
-                "status": "success",
-                "query": query,
-                "response": response.output_text,
-                "source": "legal_documents",
-                "agent": "Legal",
-            }
+            return self._agent_success(query, response_text, "legal_documents", "Legal")
         except Exception as exc:
-            return {
-                "status": "error",
-                "query": query,
-                "error": str(exc),
-                "source": "legal_documents",
-                "agent": "Legal",
-            }
+            return self._agent_error(query, exc, "legal_documents", "Legal")
 
-    def _analyze_legal_compliance(self, agenda_item: str) -> Dict[str, Any]:
-        query = f"""
-        Проведите правовой анализ следующего пункта повестки дня:\n\n        {agenda_item}\n\n        Необходимо проверить:\n        - Соответствие действующему законодательству РК\n        - Требования к процедуре принятия решения\n        - Необходимые согласования и разрешения\n        - Правовые риски и ограничения\n        - Ответственность за нарушения\n        """
-        return self._search_legal_documents(query, max_results=8)
+    async def _aanalyze_legal_compliance(self, agenda_item: str) -> Dict[str, Any]:
+        return await self._asearch_legal_documents(
+            self._legal_compliance_query(agenda_item), max_results=8, subject=agenda_item
+        )
 
-    def _search_with_perplexity(self, query: str) -> Dict[str, Any]:
+    async def _asearch_with_perplexity(self, query: str) -> Dict[str, Any]:
         try:
-            headers = {
-                "Authorization": f"Bearer {self._perplexity_api_key}",
-                "Content-Type": "application/json",
-            }
-            data = {
-                "model": "sonar-pro",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": f"""
-                        Найдите актуальную информацию по запросу: {query}\n\n                        Сосредоточьтесь на:\n                        - Новостях и событиях в Казахстане\n                        - Официальных заявлениях и документах\n                        - Экономических и финансовых данных\n                        - Репутационных аспектах\n                        - Мнениях экспертов и аналитиков\n\n                        Предоставьте структурированный ответ с указанием источников.
-                        """,
-                    }
-                ],
-                "search_domain_filter": self._kz_sites,
-            }
-            response = requests.post(
-                "https://api.perplexity.ai/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=30,
-            )
-            if response.status_code == 200:
-                result = response.json()
-                content = result["choices"][0]["message"]["content"]
-                return {
-                    "status": "success",
-                    "query": query,
-                    "response": content,
-                    "source": "web_search_perplexity",
-                    "agent": "WebSearch",
-                }
-            return self._web_fallback_search(query)
+            data = self._perplexity_payload(query)
+            cache_key = self._cache_key("web_search", data)
+            cached = self._cache_get("web_search", cache_key)
+            if cached is not None:
+                return self._agent_success(query, cached, "web_search_perplexity", "WebSearch")
+            with self._timed("call", "perplexity"):
+                content = await self._aresilient_call(
+                    "perplexity",
+                    lambda: self._aperplexity_post(data),
+                    self._request_tokens(data),
+                    data["model"],
+                )
+            self._cache_put("web_search", cache_key, content)
+            return self._agent_success(query, content, "web_search_perplexity", "WebSearch")
         except Exception:
-            return self._web_fallback_search(query)
+            return await self._aweb_fallback_search(query)
 
-    def _web_fallback_search(self, query: str) -> Dict[str, Any]:
+    async def _aperplexity_post(self, data: Dict[str, Any]) -> str:
+        response = await self._async_http().post(
+            self._perplexity_url,
+            headers=self._perplexity_headers(),
+            json=data,
+            timeout=httpx.Timeout(
+                self._call_timeout(self.http_read_timeout), connect=self.http_connect_timeout
+            ),
+        )
+        self._observe_rate_limits("perplexity", data["model"], response.headers)
+        response.raise_for_status()
+        payload = response.json()
+        self._record_usage("perplexity", payload.get("usage"))
+        return payload["choices"][0]["message"]["content"]
+
+    async def _aweb_fallback_search(self, query: str) -> Dict[str, Any]:
         try:
-            response = self._openai_client.responses.create(
-                model="gpt-4o",
-                input=f"""
-                Найдите актуальную информацию в интернете по запросу: {query}\n\n                Особое внимание уделите:\n                - Казахстанским источникам и контексту\n                - Новостям за последние месяцы\n                - Официальным заявлениям\n                - Репутационным рискам или возможностям\n                - Экспертным оценкам\n\n                Сосредоточьтесь на поиске информации с казахстанских сайтов: {', '.join(self._kz_sites)}
-                """,
-                tools=[{"type": "web_search_preview"}],
+            response_text = await self._acached_response_text(
+                "web_search", self._web_fallback_request(query)
+            )
+            return self._agent_success(
+                query, response_text, "web_search_responses_api", "WebSearch"
             )
-            return {
-                "status": "success",
-                "query": query,
-                "response": response.output_text,
-                "source": "web_search_responses_api",
-                "agent": "WebSearch",
-            }
         except Exception as exc:
-            return {
-                "status": "error",
-                "query": query,
-                "error": str(exc),
-                "source": "web_search_fallback",
-                "agent": "WebSearch",
-            }
+            return self._agent_error(query, exc, "web_search_fallback", "WebSearch")
 
-    def _analyze_public_reaction(self, agenda_item: str) -> Dict[str, Any]:
-        query = f"""
-        Проанализируйте возможную общественную и медийную реакцию на следующее решение:\n\n        {agenda_item}\n\n        Найдите:\n        - Похожие случаи и реакцию на них\n        - Мнения экспертов по подобным вопросам\n        - Потенциальные репутационные риски\n        - Общественное мнение по теме\n        - Рекомендации по коммуникации\n        """
-        return self._search_with_perplexity(query)
+    async def _aanalyze_public_reaction(self, agenda_item: str) -> Dict[str, Any]:
+        return await self._asearch_with_perplexity(self._public_reaction_query(agenda_item))
 
     def _parse_agenda(self, agenda_text: str) -> List[Dict[str, str]]:
         agenda_items: List[Dict[str, str]] = []
-        pattern = r"(\d+)\.\s*([^\n]+(?:\n(?!\d+\.)[^\n]*)*)"
-        matches = re.findall(pattern, agenda_text, re.MULTILINE)
-        for number, raw_text in matches:
+        for number, raw_text in _AGENDA_ITEM_RE.findall(agenda_text):
             item_text = raw_text.strip()
             agenda_items.append(
                 {
@@ -343,261 +3357,661 @@ class Pipeline:
                 )
         return agenda_items
 
-    def _preprocess_agenda_text(self, raw_text: str) -> str:
-        system_prompt = (
-            "Вы — редактор повесток дня. Преобразуйте входной документ в чистый список пунктов. "
-            "Верните ТОЛЬКО текст без пояснений и без кодовых блоков. Формат: каждый пункт начинается с 'N. ' (1., 2., 3., ...), "
-            "первая строка — краткий заголовок, затем (при наличии) последующие строки с деталями до следующего номера. "
-            "Удалите нерелевантные блоки (шапки, подписи, приложения, служебные таблицы). Сохраните существенные формулировки."
-        )
+    def _preprocess_request(self, raw_text: str, with_queries: bool = True) -> Dict[str, Any]:
+        # Один вызов вместо двух: очищенные пункты и запросы подагентов по схеме JSON.
+        # Для фрагмента большой повестки запрашиваются только пункты.
+        system_prompt = _PROMPTS["preprocess"]
+        if with_queries:
+            system_prompt += _PROMPTS["preprocess_queries"]
         base_text = raw_text.replace("\r\n", "\n").replace("\r", "\n")
+        # Число пунктов в промпт не входит — сырой текст не разбираем
+        gc = self._extract_global_context(base_text, items=[])
         user_prompt = (
-            "Исходный текст повестки ниже. Преобразуйте его согласно требованиям.\n\n" + base_text
+            f"{_PROMPTS['preprocess_input']}\n\n"
+            f"Глобальный контекст — Компании: {', '.join(gc.get('companies', [])[:15]) or '-'}; "
+            f"Темы: {', '.join(gc.get('topics', [])[:15]) or '-'}.\n\n"
+            "ТЕКСТ ПОВЕСТКИ:\n" + base_text
         )
-        last_error: Optional[Exception] = None
-        for _ in range(3):
-            try:
-                resp = self._openai_client.responses.create(
-                    model="gpt-4o",
-                    input=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt},
-                    ],
-                )
-                out_text = (resp.output_text or "").strip()
-                if out_text.startswith("```") and out_text.endswith("```"):
-                    out_text = out_text.strip("`").strip()
-                if not re.search(r"^\d+\.\s+", out_text, flags=re.MULTILINE):
-                    last_error = ValueError("Результат не содержит нумерованных пунктов 'N.'")
-                    continue
-                numbers = [
-                    int(match.group(1))
-                    for match in re.finditer(r"^(\d+)\.\s+", out_text, flags=re.MULTILINE)
-                ]
-                if numbers and numbers[0] != 1:
-                    last_error = ValueError("Нумерация не начинается с 1.")
-                    continue
-                return out_text
-            except Exception as exc:
-                last_error = exc
-        raise RuntimeError(f"Не удалось препроцессировать повестку через gpt-4o: {last_error}")
+        return {
+            "model": "gpt-4o",
+            "input": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            "text": {"format": _PREPROCESS_FORMAT if with_queries else _PREPROCESS_CHUNK_FORMAT},
+            "prompt_cache_key": "skai-preprocess",
+        }
 
-    def _generate_global_agent_queries(
+    def _parse_preprocessed(
+        self, output_text: Optional[str], with_queries: bool = True
+    ) -> Tuple[List[Dict[str, str]], Optional[Dict[str, str]]]:
+        try:
+            parsed = json.loads(output_text or "")
+        except ValueError:
+            raise ValueError("Ответ препроцессинга не JSON")
+        queries = self._validate_queries(parsed) if with_queries else None
+        items: List[Dict[str, str]] = []
+        for item in parsed.get("items") or []:
+            title = str(item.get("title") or "").strip()
+            if title:
+                items.append({"title": title, "details": str(item.get("details") or "").strip()})
+        # Фрагмент большой повестки может целиком состоять из приложений и подписей —
+        # пункты обязательны только для повестки в целом (см. _merge_chunk_items)
+        if not items and with_queries:
+            raise ValueError("Результат не содержит пунктов повестки")
+        return items, queries
+
+    def _merge_chunk_items(self, parts: List[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+        items = [item for part in parts for item in part]
+        if not items:
+            raise RuntimeError(
+                "Не удалось препроцессировать повестку через gpt-4o: "
+                "результат не содержит пунктов повестки"
+            )
+        return items
+
+    def _render_preprocessed(self, items: List[Dict[str, str]]) -> str:
+        # Нумерация проставляется заново — сквозная по всем фрагментам, с 1 без пропусков
+        lines: List[str] = []
+        for number, item in enumerate(items, 1):
+            lines.append(f"{number}. {item['title']}")
+            if item["details"]:
+                lines.append(item["details"])
+        return self._validate_preprocessed("\n".join(lines))
+
+    def _validate_preprocessed(self, output_text: Optional[str]) -> str:
+        out_text = (output_text or "").strip()
+        if out_text.startswith("```") and out_text.endswith("```"):
+            out_text = out_text.strip("`").strip()
+        numbers = [int(match.group(1)) for match in _NUMBERED_LINE_RE.finditer(out_text)]
+        if not numbers:
+            raise ValueError("Результат не содержит нумерованных пунктов 'N.'")
+        if numbers[0] != 1:
+            raise ValueError("Нумерация не начинается с 1.")
+        return out_text
+
+    def _local_preprocess(self, raw_text: str) -> Optional[str]:
+        # Быстрый путь: текст уже состоит из пунктов «N. заголовок» с нумерацией 1..N
+        # и строк деталей под ними. Иначе (шапки, подписи, приложения) — None.
+        if not self.local_preprocess:
+            return None
+        base_text = raw_text.replace("\r\n", "\n").replace("\r", "\n")
+        lines = [line.strip() for line in base_text.split("\n") if line.strip()]
+        numbers: List[int] = []
+        for line in lines:
+            match = _NUMBERED_LINE_RE.match(line)
+            if match:
+                numbers.append(int(match.group(1)))
+            elif not numbers or _SERVICE_LINE_RE.match(line):
+                return None
+        if not numbers or numbers != list(range(1, len(numbers) + 1)):
+            return None
+        out_text = "\n".join(lines)
+        # Разбор пунктов должен совпасть с разметкой строк, иначе доверяем модели
+        if len(self._parse_agenda(out_text)) != len(numbers):
+            return None
+        return out_text
+
+    def _preprocess_agenda_text(
+        self, raw_text: str
+    ) -> Tuple[str, Optional[Dict[str, str]]]:
+        local_text = self._local_preprocess(raw_text)
+        if local_text is not None:
+            return local_text, None
+        chunks = self._split_agenda_chunks(raw_text)
+        if len(chunks) == 1:
+            items, queries = self._preprocess_chunk(chunks[0], with_queries=True)
+            return self._render_preprocessed(items), queries
+        # Map: фрагменты параллельно; reduce: сквозная нумерация, а запросы агентов
+        # строятся отдельным вызовом по уже очищенному (много меньшему) тексту
+        with ThreadPoolExecutor(max_workers=max(1, self.max_preprocess_workers)) as executor:
+            futures = [
+                self._submit(executor, self._preprocess_chunk, chunk, False) for chunk in chunks
+            ]
+            parts = [future.result()[0] for future in futures]
+        return self._render_preprocessed(self._merge_chunk_items(parts)), None
+
+    async def _apreprocess_agenda_text(
+        self, raw_text: str
+    ) -> Tuple[str, Optional[Dict[str, str]]]:
+        local_text = self._local_preprocess(raw_text)
+        if local_text is not None:
+            return local_text, None
+        chunks = self._split_agenda_chunks(raw_text)
+        if len(chunks) == 1:
+            items, queries = await self._apreprocess_chunk(chunks[0], with_queries=True)
+            return self._render_preprocessed(items), queries
+        semaphore = asyncio.Semaphore(max(1, self.max_preprocess_workers))
+
+        async def run_chunk(chunk: str) -> List[Dict[str, str]]:
+            async with semaphore:
+                items, _ = await self._apreprocess_chunk(chunk, False)
+                return items
+
+        parts = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+        return self._render_preprocessed(self._merge_chunk_items(parts)), None
+
+    def _preprocess_chunk(
+        self, chunk: str, with_queries: bool
+    ) -> Tuple[List[Dict[str, str]], Optional[Dict[str, str]]]:
+        request = self._preprocess_request(chunk, with_queries)
+        cache_key = self._cache_key("preprocess", request)
+        cached = self._cache_get("preprocess", cache_key)
+        if cached is not None:
+            entry = json.loads(cached)
+            return entry["items"], entry["queries"]
+        try:
+            resp = self._openai_create("preprocess", request)
+            items, queries = self._parse_preprocessed(resp.output_text, with_queries)
+        except Exception as exc:
+            # Схема исключает «битый» JSON, сетевые ошибки уже повторены в _resilient_call
+            raise RuntimeError(f"Не удалось препроцессировать повестку через gpt-4o: {exc}")
+        self._cache_put(
+            "preprocess",
+            cache_key,
+            json.dumps({"items": items, "queries": queries}, ensure_ascii=False),
+        )
+        return items, queries
+
+    async def _apreprocess_chunk(
+        self, chunk: str, with_queries: bool
+    ) -> Tuple[List[Dict[str, str]], Optional[Dict[str, str]]]:
+        request = self._preprocess_request(chunk, with_queries)
+        cache_key = self._cache_key("preprocess", request)
+        cached = self._cache_get("preprocess", cache_key)
+        if cached is not None:
+            entry = json.loads(cached)
+            return entry["items"], entry["queries"]
+        try:
+            resp = await self._aopenai_create("preprocess", request)
+            items, queries = self._parse_preprocessed(resp.output_text, with_queries)
+        except Exception as exc:
+            # Схема исключает «битый» JSON, сетевые ошибки уже повторены в _resilient_call
+            raise RuntimeError(f"Не удалось препроцессировать повестку через gpt-4o: {exc}")
+        self._cache_put(
+            "preprocess",
+            cache_key,
+            json.dumps({"items": items, "queries": queries}, ensure_ascii=False),
+        )
+        return items, queries
+
+    def _estimate_tokens(self, text: str) -> int:
+        encoding = self._shared_client(("tiktoken", "o200k_base"), self._load_token_encoding)
+        if encoding:
+            return len(encoding.encode(text, disallowed_special=()))
+        return len(text) // _CHARS_PER_TOKEN + 1
+
+    def _load_token_encoding(self) -> Any:
+        # False — токенизатора нет: оценка по длине текста
+        if tiktoken is None:
+            return False
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # Нет словаря локально и нет сети — остаёмся на оценке по длине
+            return False
+
+    def _split_agenda_chunks(self, raw_text: str) -> List[str]:
+        # Фрагменты не больше preprocess_chunk_tokens, разрезы — по границам пунктов;
+        # пункт длиннее предела режется по строкам, строка — по символам
+        base_text = raw_text.replace("\r\n", "\n").replace("\r", "\n")
+        budget = max(1, self.preprocess_chunk_tokens)
+        if self._estimate_tokens(base_text) <= budget:
+            return [base_text]
+        chunks: List[str] = []
+        current: List[str] = []
+        current_tokens = 0
+        for unit in self._agenda_units(base_text, budget):
+            tokens = self._estimate_tokens(unit)
+            if current and current_tokens + tokens > budget:
+                chunks.append("".join(current))
+                current, current_tokens = [], 0
+            current.append(unit)
+            current_tokens += tokens
+        if current:
+            chunks.append("".join(current))
+        return chunks
+
+    def _agenda_units(self, text: str, budget: int) -> Iterator[str]:
+        bounds = [match.start() for match in _ITEM_BOUNDARY_RE.finditer(text) if match.start()]
+        bounds = [0, *bounds, len(text)]
+        for start, end in zip(bounds, bounds[1:]):
+            unit = text[start:end]
+            if self._estimate_tokens(unit) <= budget:
+                yield unit
+                continue
+            for line in unit.splitlines(keepends=True):
+                step = budget * _CHARS_PER_TOKEN
+                for offset in range(0, len(line), step):
+                    yield line[offset:offset + step]
+
+    def _queries_request(
         self,
         agenda_text: str,
         global_context: Optional[Dict[str, Any]] = None,
-    ) -> Dict[str, str]:
+    ) -> Dict[str, Any]:
         gc = global_context or {
             "companies": [],
             "amounts": [],
             "topics": [],
             "total_items": 0,
         }
-        system_prompt = (
-            "Вы — помощник виртуального директора. На основе ПОЛНОГО текста повестки дня сформируйте три "
-            "самодостаточных запроса для подагентов: vnd_query, legal_query, web_query. Ответ СТРОГО JSON."
-        )
         user_prompt = (
+            f"{_PROMPTS['queries_input']}\n\n"
             f"Глобальный контекст — Компании: {', '.join(gc.get('companies', [])[:15]) or '-'}; "
             f"Темы: {', '.join(gc.get('topics', [])[:15]) or '-'}; Всего пунктов: {gc.get('total_items', 0)}.\n\n"
-            "Полный текст повестки ниже. Используйте его целиком для формирования ТРЁХ запросов:\n\n"
-            + agenda_text
-        )
-        last_error: Optional[Exception] = None
-        for _ in range(3):
-            try:
-                resp = self._openai_client.responses.create(
-                    model="gpt-4o",
-                    input=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt},
-                    ],
-                )
-                raw = (resp.output_text or "").strip()
-                parsed: Optional[Dict[str, Any]] = None
-                try:
-                    parsed = json.loads(raw)
-                except Exception:
-                    match = re.search(r"\{[\s\S]*\}", raw)
-                    if match:
-                        try:
-                            parsed = json.loads(match.group(0))
-                        except Exception:
-                            parsed = None
-                if not isinstance(parsed, dict):
-                    last_error = ValueError("Ответ не JSON")
-                    continue
-                vnd_query = str(parsed.get("vnd_query") or "").strip()
-                legal_query = str(parsed.get("legal_query") or "").strip()
-                web_query = str(parsed.get("web_query") or "").strip()
-                if not (vnd_query and legal_query and web_query):
-                    last_error = ValueError(
-                        "Отсутствуют обязательные ключи vnd_query/legal_query/web_query"
-                    )
-                    continue
-                return {
-                    "vnd_query": vnd_query,
-                    "legal_query": legal_query,
-                    "web_query": web_query,
-                }
-            except Exception as exc:
-                last_error = exc
-        raise RuntimeError(
-            f"Не удалось сгенерировать глобальные запросы gpt-4o: {last_error}"
+            "ТЕКСТ ПОВЕСТКИ:\n" + agenda_text
         )
+        return {
+            "model": "gpt-4o",
+            "input": [
+                {"role": "system", "content": _PROMPTS["queries"]},
+                {"role": "user", "content": user_prompt},
+            ],
+            "text": {"format": _QUERIES_FORMAT},
+            "prompt_cache_key": "skai-queries",
+        }
+
+    def _parse_global_queries(self, output_text: Optional[str]) -> Dict[str, str]:
+        try:
+            parsed = json.loads(output_text or "")
+        except ValueError:
+            raise ValueError("Ответ не JSON")
+        return self._validate_queries(parsed)
+
+    def _validate_queries(self, parsed: Any) -> Dict[str, str]:
+        if not isinstance(parsed, dict):
+            raise ValueError("Ответ не JSON-объект")
+        vnd_query = str(parsed.get("vnd_query") or "").strip()
+        legal_query = str(parsed.get("legal_query") or "").strip()
+        web_query = str(parsed.get("web_query") or "").strip()
+        if not (vnd_query and legal_query and web_query):
+            raise ValueError("Отсутствуют обязательные ключи vnd_query/legal_query/web_query")
+        return {
+            "vnd_query": vnd_query,
+            "legal_query": legal_query,
+            "web_query": web_query,
+        }
+
+    def _generate_global_agent_queries(
+        self,
+        agenda_text: str,
+        global_context: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, str]:
+        request = self._queries_request(agenda_text, global_context)
+        cache_key = self._cache_key("queries", request)
+        cached = self._cache_get("queries", cache_key)
+        if cached is not None:
+            return json.loads(cached)
+        try:
+            resp = self._openai_create("queries", request)
+            queries = self._parse_global_queries(resp.output_text)
+        except Exception as exc:
+            raise RuntimeError(f"Не удалось сгенерировать глобальные запросы gpt-4o: {exc}")
+        self._cache_put("queries", cache_key, json.dumps(queries, ensure_ascii=False))
+        return queries
+
+    async def _agenerate_global_agent_queries(
+        self,
+        agenda_text: str,
+        global_context: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, str]:
+        request = self._queries_request(agenda_text, global_context)
+        cache_key = self._cache_key("queries", request)
+        cached = self._cache_get("queries", cache_key)
+        if cached is not None:
+            return json.loads(cached)
+        try:
+            resp = await self._aopenai_create("queries", request)
+            queries = self._parse_global_queries(resp.output_text)
+        except Exception as exc:
+            raise RuntimeError(f"Не удалось сгенерировать глобальные запросы gpt-4o: {exc}")
+        self._cache_put("queries", cache_key, json.dumps(queries, ensure_ascii=False))
+        return queries
 
     def _format_analysis_result(self, result: Dict[str, Any]) -> str:
         if result.get("status") == "error":
             return f"ОШИБКА: {result.get('error', 'Неизвестная ошибка')}"
         if result.get("status") == "success":
             return result.get("response", "Нет данных")
+        if result.get("status") == "pending":
+            return "НЕТ ДАННЫХ: агент не уложился в бюджет времени, решение принимается без них"
         return "Анализ не выполнен"
 
-    def _extract_global_context(self, agenda_text: str) -> Dict[str, Any]:
-        try:
-            companies_quoted = re.findall(r'[«"]([^"»]{3,})[»"]', agenda_text)
-            amounts = re.findall(
-                r"(\d{1,3}(?:[\s,]\d{3})*(?:[.,]\d+)?\s*(?:млрд|млн|тыс)?\s*тенге)",
-                agenda_text,
-                flags=re.IGNORECASE,
-            )
-            topics: List[str] = []
-            topic_keywords = [
-                "бюджет",
-                "крупная сделка",
-                "приобретение",
-                "назначение",
-                "дивиденды",
-                "займ",
-                "кредит",
-                "облигации",
-                "капзатраты",
-                "закуп",
-                "реорганизация",
-                "аудит",
-                "стратегия",
-            ]
-            lower_text = agenda_text.lower()
-            for keyword in topic_keywords:
-                if keyword in lower_text:
-                    topics.append(keyword)
+    def _extract_global_context(
+        self,
+        agenda_text: Union[str, Iterable[str]],
+        items: Optional[List[Dict[str, str]]] = None,
+    ) -> Dict[str, Any]:
+        # Принимает весь текст или итератор фрагментов (большие пакеты повестки)
+        try:
+            scan = self._new_context_scan()
+            if isinstance(agenda_text, str):
+                if items is None:
+                    items = self._parse_agenda(agenda_text)
+                # Пункты уже известны — строки «N.» считать не нужно
+                scan["numbered_lines"] = None
+                self._scan_context_chunk(scan, agenda_text, final=True)
+            else:
+                for chunk in agenda_text:
+                    self._scan_context_chunk(scan, chunk)
+                self._scan_context_chunk(scan, "", final=True)
+            total_items = len(items) if items is not None else scan["numbered_lines"]
             return {
-                "companies": sorted(
-                    {
-                        company.strip()
-                        for company in companies_quoted
-                        if 2 <= len(company.strip().split()) <= 6
-                    }
-                )[:20],
-                "amounts": amounts[:10],
-                "topics": topics[:10],
-                "total_items": len(self._parse_agenda(agenda_text)),
+                "companies": sorted(scan["companies"])[:20],
+                "amounts": scan["amounts"][:10],
+                "topics": [keyword for keyword in _TOPIC_KEYWORDS if keyword in scan["topics"]][:10],
+                "total_items": total_items,
             }
         except Exception:
             return {"companies": [], "amounts": [], "topics": [], "total_items": 0}
 
+    def _new_context_scan(self) -> Dict[str, Any]:
+        return {
+            "companies": set(),
+            "amounts": [],
+            "topics": set(),
+            "numbered_lines": 0,
+            # Непросмотренные хвосты предыдущего фрагмента (совпадение может продолжиться)
+            "company_tail": "",
+            "amount_tail": "",
+            "topic_tail": "",
+            "line_tail": "",
+        }
+
+    def _scan_context_chunk(self, scan: Dict[str, Any], chunk: str, final: bool = False) -> None:
+        # Один проход по фрагменту: ключевые слова ищутся только среди ещё не найденных,
+        # суммы — только пока их меньше 10, компании — по всему тексту
+        lowered = scan["topic_tail"] + chunk.lower()
+        for keyword in _TOPIC_KEYWORDS:
+            if keyword not in scan["topics"] and keyword in lowered:
+                scan["topics"].add(keyword)
+        scan["topic_tail"] = lowered[-_TOPIC_OVERLAP:]
+
+        companies, scan["company_tail"] = self._scan_pattern(
+            _COMPANY_RE, scan["company_tail"] + chunk, final
+        )
+        for company in set(companies):
+            company = company.strip()
+            if 2 <= len(company.split()) <= 6:
+                scan["companies"].add(company)
+
+        if len(scan["amounts"]) < 10:
+            buffer = scan["amount_tail"] + chunk
+            # Отложенное с прошлого фрагмента совпадение лежит в хвосте
+            if "тенге" in lowered or "тенге" in scan["amount_tail"].lower():
+                amounts, scan["amount_tail"] = self._scan_pattern(
+                    _AMOUNT_RE, buffer, final, 10 - len(scan["amounts"])
+                )
+                scan["amounts"].extend(amounts)
+            else:
+                # Без слова «тенге» сумма здесь закончиться не может
+                scan["amount_tail"] = "" if final else buffer[-_CONTEXT_SCAN_GUARD:]
+
+        if scan["numbered_lines"] is not None:
+            lines = scan["line_tail"] + chunk
+            cut = len(lines) if final else lines.rfind("\n") + 1
+            scan["numbered_lines"] += len(_NUMBERED_LINE_RE.findall(lines, 0, cut))
+            scan["line_tail"] = lines[cut:]
+
+    def _scan_pattern(
+        self,
+        pattern: "re.Pattern[str]",
+        buffer: str,
+        final: bool,
+        max_matches: Optional[int] = None,
+    ) -> Tuple[List[str], str]:
+        # Совпадения у конца буфера может продолжить следующий фрагмент —
+        # они и всё после них возвращаются хвостом для повторного просмотра
+        if final and max_matches is None:
+            return pattern.findall(buffer), ""
+        limit = len(buffer) if final else max(0, len(buffer) - _CONTEXT_SCAN_GUARD)
+        found: List[str] = []
+        for match in pattern.finditer(buffer):
+            if match.end() > limit:
+                return found, buffer[match.start():]
+            found.append(match.group(1))
+            if max_matches is not None and len(found) >= max_matches:
+                return found, ""
+        return found, buffer[limit:]
+
+    def _synthesis_request(
+        self,
+        item: Dict[str, str],
+        analyses: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        sections = [("item", "ПУНКТ ПОВЕСТКИ ДНЯ", item["full_text"])]
+        for key, title in (
+            ("internal_docs", "АНАЛИЗ ВНУТРЕННИХ ДОКУМЕНТОВ"),
+            ("legal", "ПРАВОВОЙ АНАЛИЗ"),
+            ("web_search", "ВЕБ-ПОИСК И РЕПУТАЦИОННЫЙ АНАЛИЗ"),
+        ):
+            sections.append((key, title, self._format_analysis_result(analyses.get(key, {}))))
+        for key, title in (
+            ("global_internal_docs", "ГЛОБАЛЬНЫЙ АНАЛИЗ ВНД (по всей повестке)"),
+            ("global_legal", "ГЛОБАЛЬНЫЙ ПРАВОВОЙ АНАЛИЗ (по всей повестке)"),
+            ("global_web_search", "ГЛОБАЛЬНЫЙ ВЕБ-АНАЛИЗ (по всей повестке)"),
+        ):
+            if analyses.get(key):
+                sections.append((key, title, self._format_analysis_result(analyses[key])))
+        texts = self._fit_sections(
+            {key: text for key, _, text in sections}, self.synthesis_context_tokens
+        )
+        context = "\n\n".join(f"{title}:\n{texts[key]}" for key, title, _ in sections)
+        return {
+            "model": "gpt-4o",
+            "instructions": _PROMPTS["synthesis"],
+            "input": f"{_PROMPTS['synthesis_input']}\n\n{context}",
+            "prompt_cache_key": "skai-synthesis",
+        }
+
+    def _fit_sections(self, texts: Dict[str, str], budget: int) -> Dict[str, str]:
+        # Распределение бюджета «по уровню воды»: разделы короче справедливой доли
+        # остаются целиком, остаток делится поровну между более длинными
+        counts = {key: self._estimate_tokens(text) for key, text in texts.items()}
+        fitted = dict(texts)
+        if budget > 0 and sum(counts.values()) > budget:
+            remaining = budget
+            ordered = sorted(counts, key=counts.get)
+            for index, key in enumerate(ordered):
+                share = min(counts[key], remaining // (len(ordered) - index))
+                remaining -= share
+                if share < counts[key]:
+                    fitted[key] = self._compress_text(texts[key], share)
+        self._record_prompt_sections(
+            {
+                key: (
+                    counts[key],
+                    counts[key] if fitted[key] is texts[key] else self._estimate_tokens(fitted[key]),
+                )
+                for key in texts
+            }
+        )
+        return fitted
+
+    def _compress_text(self, text: str, max_tokens: int) -> str:
+        # Экстрактивное сжатие: оставляем предложения с числами, названиями, нормами
+        # и рисками (и начало текста) в исходном порядке; пропуски помечаются «[…]»
+        sentences = [part for part in _SENTENCE_SPLIT_RE.split(text) if part and part.strip()]
+        ranked = sorted(
+            range(len(sentences)),
+            key=lambda index: (
+                -(len(_SALIENT_RE.findall(sentences[index])) + (2 if index < 3 else 0)),
+                index,
+            ),
+        )
+        chosen: List[int] = []
+        used = 0
+        for index in ranked:
+            cost = self._estimate_tokens(sentences[index]) + 1
+            if used + cost <= max_tokens:
+                chosen.append(index)
+                used += cost
+        if not chosen:
+            # Даже одно предложение не влезает — обрезаем по символам
+            return text[: max(0, max_tokens) * _CHARS_PER_TOKEN].rstrip() + " […]"
+        parts: List[str] = []
+        previous = -1
+        for index in sorted(chosen):
+            if index != previous + 1:
+                parts.append("[…]")
+            parts.append(sentences[index].strip())
+            previous = index
+        if previous != len(sentences) - 1:
+            parts.append("[…]")
+        return " ".join(parts)
+
+    def _record_prompt_sections(self, sections: Dict[str, Tuple[int, int]]) -> None:
+        # Размер разделов промпта синтеза до и после подгонки под бюджет
+        state = _run_state.get()
+        with self._metrics_lock:
+            for name, (original, sent) in sections.items():
+                totals = [self._metrics["prompt"].setdefault(name, {})]
+                if state is not None:
+                    totals.append(state["metrics"]["prompt"].setdefault(name, {}))
+                for total in totals:
+                    total["count"] = total.get("count", 0) + 1
+                    total["original"] = total.get("original", 0) + original
+                    total["sent"] = total.get("sent", 0) + sent
+        for name, (original, sent) in sections.items():
+            self._emit_metric({"type": "prompt", "name": name, "original": original, "sent": sent})
+
+    def _parse_decision(self, response_text: str) -> Dict[str, Any]:
+        decision_match = re.search(r"Решение:\s*(ЗА|ПРОТИВ)", response_text, re.IGNORECASE)
+        decision = decision_match.group(1) if decision_match else "ВОЗДЕРЖАЛСЯ"
+        reasoning_match = re.search(
+            r"Обоснование:\s*(.*?)(?=Риски:|$)", response_text, re.DOTALL | re.IGNORECASE
+        )
+        reasoning = reasoning_match.group(1).strip() if reasoning_match else response_text
+        risks_match = re.search(
+            r"Риски:\s*(.*?)(?=Рекомендации:|$)", response_text, re.DOTALL | re.IGNORECASE
+        )
+        risks = risks_match.group(1).strip() if risks_match else "Не выявлены"
+        recommendations_match = re.search(
+            r"Рекомендации:\s*(.*?)$",
+            response_text,
+            re.DOTALL | re.IGNORECASE,
+        )
+        recommendations = (
+            recommendations_match.group(1).strip()
+            if recommendations_match
+            else "Нет дополнительных рекомендаций"
+        )
+        return {
+            "decision": decision,
+            "reasoning": reasoning,
+            "risks": risks,
+            "recommendations": recommendations,
+            "full_response": response_text,
+        }
+
     def _synthesize_decision(
         self,
         item: Dict[str, str],
         analyses: Dict[str, Any],
     ) -> Dict[str, Any]:
-        context = f"""
-        ПУНКТ ПОВЕСТКИ ДНЯ:
-        {item['full_text']}
-
-        АНАЛИЗ ВНУТРЕННИХ ДОКУМЕНТОВ:
-        {self._format_analysis_result(analyses.get('internal_docs', {}))}
-
-        ПРАВОВОЙ АНАЛИЗ:
-        {self._format_analysis_result(analyses.get('legal', {}))}
-
-        ВЕБ-ПОИСК И РЕПУТАЦИОННЫЙ АНАЛИЗ:
-        {self._format_analysis_result(analyses.get('web_search', {}))}
-        """
-        if analyses.get("global_internal_docs"):
-            context += (
-                "\nГЛОБАЛЬНЫЙ АНАЛИЗ ВНД (по всей повестке):\n"
-                f"{self._format_analysis_result(analyses['global_internal_docs'])}\n"
-            )
-        if analyses.get("global_legal"):
-            context += (
-                "\nГЛОБАЛЬНЫЙ ПРАВОВОЙ АНАЛИЗ (по всей повестке):\n"
-                f"{self._format_analysis_result(analyses['global_legal'])}\n"
-            )
-        if analyses.get("global_web_search"):
-            context += (
-                "\nГЛОБАЛЬНЫЙ ВЕБ-АНАЛИЗ (по всей повестке):\n"
-                f"{self._format_analysis_result(analyses['global_web_search'])}\n"
-            )
-        try:
-            response = self._openai_client.responses.create(
-                model="gpt-4o",
-                instructions="""
-                        Вы — виртуальный директор, член Совета директоров АО «Самрук-Казына».
-                        Ваша задача — принять взвешенное решение по пункту повестки дня на основе
-                        предоставленных анализов.
-
-                        ПРИНЦИПЫ ПРИНЯТИЯ РЕШЕНИЙ:
-                        1. Соблюдение законодательства — приоритет №1
-                        2. Соответствие внутренним политикам компании
-                        3. Минимизация репутационных рисков
-                        4. Экономическая целесообразность
-                        5. Прозрачность и подотчетность
-
-                        ФОРМАТ ОТВЕТА:
-                        Решение: ЗА/ПРОТИВ
-                        Обоснование: [детальное обоснование с ссылками на источники]
-                        Риски: [выявленные риски]
-                        Рекомендации: [рекомендации по реализации или доработке]
-
-                        Будьте объективны, консервативны в оценке рисков, и всегда ссылайтесь
-                        на конкретные источники информации.
-                        """,
-                input=f"""
-                        Проанализируйте следующую информацию и примите решение:
-
-                        {context}
-
-                        Примите решение ЗА или ПРОТИВ данного пункта повестки и дайте
-                        подробное обоснование.
-                        """
-            )
-            response_text = response.output_text
-            decision_match = re.search(r"Решение:\s*(ЗА|ПРОТИВ)", response_text, re.IGNORECASE)
-            decision = decision_match.group(1) if decision_match else "ВОЗДЕРЖАЛСЯ"
-            reasoning_match = re.search(
-                r"Обоснование:\s*(.*?)(?=Риски:|$)", response_text, re.DOTALL | re.IGNORECASE
-            )
-            reasoning = reasoning_match.group(1).strip() if reasoning_match else response_text
-            risks_match = re.search(
-                r"Риски:\s*(.*?)(?=Рекомендации:|$)", response_text, re.DOTALL | re.IGNORECASE
-            )
-            risks = risks_match.group(1).strip() if risks_match else "Не выявлены"
-            recommendations_match = re.search(
-                r"Рекомендации:\s*(.*?)$",
-                response_text,
-                re.DOTALL | re.IGNORECASE,
-            )
-            recommendations = (
-                recommendations_match.group(1).strip()
-                if recommendations_match
-                else "Нет дополнительных рекомендаций"
+        try:
+            response_text = self._cached_response_text(
+                "synthesis", self._synthesis_request(item, analyses)
             )
-            return {
-                "decision": decision,
-                "reasoning": reasoning,
-                "risks": risks,
-                "recommendations": recommendations,
-                "full_response": response_text,
-            }
+            return self._parse_decision(response_text)
         except Exception as exc:
-            return {
-                "decision": "ВОЗДЕРЖАЛСЯ",
-                "reasoning": f"Не удалось принять решение из-за технической ошибки: {exc}",
-                "risks": "Технические риски при анализе",
-                "recommendations": "Требуется повторный анализ",
-                "full_response": "",
-            }
+            return self._failed_decision(exc)
+
+    def _synthesize_decision_stream(
+        self,
+        item: Dict[str, str],
+        analyses: Dict[str, Any],
+    ) -> Generator[str, None, Dict[str, Any]]:
+        # Потоковый вариант синтеза: текст отдаётся по мере генерации (Responses API
+        # streaming), разделы Решение/Обоснование/Риски/Рекомендации разбираются в конце.
+        parts: List[str] = []
+        try:
+            request = self._synthesis_request(item, analyses)
+            cache_key = self._cache_key("synthesis", request)
+            cached = self._cache_get("synthesis", cache_key)
+            if cached is not None:
+                yield cached
+                return self._parse_decision(cached)
+            # Генерация идёт, пока читается поток: слот провайдера держим до его конца
+            # (или до закрытия генератора), а не только до ответа на create
+            with self._provider_slot("openai"):
+                stream = self._openai_create(
+                    "synthesis", request, acquire_slot=False, stream=True
+                )
+                for event in stream:
+                    event_type = getattr(event, "type", "")
+                    if event_type == "response.output_text.delta":
+                        parts.append(event.delta)
+                        yield event.delta
+                    elif event_type == "response.completed":
+                        self._record_usage("synthesis", getattr(event.response, "usage", None))
+            response_text = "".join(parts)
+            self._cache_put("synthesis", cache_key, response_text)
+            return self._parse_decision(response_text)
+        except Exception as exc:
+            if parts:
+                yield f"\n\nОШИБКА: синтез прерван ({exc})\n"
+            return self._failed_decision(exc)
+
+    async def _asynthesize_decision(
+        self,
+        item: Dict[str, str],
+        analyses: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        try:
+            response_text = await self._acached_response_text(
+                "synthesis", self._synthesis_request(item, analyses)
+            )
+            return self._parse_decision(response_text)
+        except Exception as exc:
+            return self._failed_decision(exc)
+
+    async def _asynthesize_decision_stream(
+        self,
+        item: Dict[str, str],
+        analyses: Dict[str, Any],
+        outcome: Dict[str, Any],
+    ) -> AsyncGenerator[str, None]:
+        # Асинхронный аналог _synthesize_decision_stream; разобранное решение
+        # кладётся в outcome["decision_result"].
+        parts: List[str] = []
+        try:
+            request = self._synthesis_request(item, analyses)
+            cache_key = self._cache_key("synthesis", request)
+            cached = self._cache_get("synthesis", cache_key)
+            if cached is not None:
+                yield cached
+                outcome["decision_result"] = self._parse_decision(cached)
+                return
+            async with self._aprovider_slot("openai"):
+                stream = await self._aopenai_create(
+                    "synthesis", request, acquire_slot=False, stream=True
+                )
+                async for event in stream:
+                    event_type = getattr(event, "type", "")
+                    if event_type == "response.output_text.delta":
+                        parts.append(event.delta)
+                        yield event.delta
+                    elif event_type == "response.completed":
+                        self._record_usage("synthesis", getattr(event.response, "usage", None))
+            response_text = "".join(parts)
+            self._cache_put("synthesis", cache_key, response_text)
+            outcome["decision_result"] = self._parse_decision(response_text)
+        except Exception as exc:
+            if parts:
+                yield f"\n\nОШИБКА: синтез прерван ({exc})\n"
+            outcome["decision_result"] = self._failed_decision(exc)
+
+    def _failed_decision(self, exc: Exception) -> Dict[str, Any]:
+        return {
+            "decision": "ВОЗДЕРЖАЛСЯ",
+            "reasoning": f"Не удалось принять решение из-за технической ошибки: {exc}",
+            "risks": "Технические риски при анализе",
+            "recommendations": "Требуется повторный анализ",
+            "full_response": "",
+            "error": str(exc),
+        }
 
     def _generate_summary(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
         total_items = len(results)
@@ -621,45 +4035,102 @@ class Pipeline:
             ],
         }
 
-    def _generate_readable_report(self, analysis_result: Dict[str, Any]) -> str:
-        report_lines = [
+    def _report_chunk(self, lines: List[str]) -> str:
+        return "\n".join(lines) + "\n"
+
+    def _report_title_lines(self, timestamp: str, items_count: int) -> List[str]:
+        return [
             "=" * 80,
             "SKAI — независимый (цифровой) член СД",
             "Анализ повестки дня Совета директоров АО «Самрук-Казына»",
             "=" * 80,
-            f"Дата анализа: {analysis_result['timestamp']}",
-            f"Количество пунктов: {analysis_result['agenda_items_count']}",
+            f"Дата анализа: {timestamp}",
+            f"Количество пунктов: {items_count}",
             "",
+        ]
+
+    def _report_summary_lines(self, analysis_result: Dict[str, Any]) -> List[str]:
+        return [
             "СВОДКА РЕШЕНИЙ:",
             f"• ЗА: {analysis_result['summary']['decisions_summary']['ЗА']}",
             f"• ПРОТИВ: {analysis_result['summary']['decisions_summary']['ПРОТИВ']}",
             f"• ВОЗДЕРЖАЛСЯ: {analysis_result['summary']['decisions_summary']['ВОЗДЕРЖАЛСЯ']}",
             f"• Процент одобрения: {analysis_result['summary']['approval_rate']:.1%}",
             "",
-            "=" * 80,
-            "ДЕТАЛЬНЫЙ АНАЛИЗ ПО ПУНКТАМ",
-            "=" * 80,
-            "",
         ]
-        for result in analysis_result["results"]:
-            item = result["item"]
-            report_lines.extend(
-                [
-                    f"ПУНКТ {item['number']}: {item['title']}",
-                    "-" * 60,
-                    f"РЕШЕНИЕ: {result['decision']}",
-                    "",
-                    f"ОБОСНОВАНИЕ (по вопросу №{item['number']} повестки — {item['title']}):",
-                    result["reasoning"],
-                    "",
-                    "ВЫЯВЛЕННЫЕ РИСКИ:",
-                    result["risks"],
-                    "",
-                    "РЕКОМЕНДАЦИИ:",
-                    result["recommendations"],
-                    "",
-                    "=" * 80,
-                    "",
-                ]
+
+    def _report_item_heading_lines(self, item: Dict[str, str]) -> List[str]:
+        return [
+            f"ПУНКТ {item['number']}: {item['title']}",
+            "-" * 60,
+        ]
+
+    def _report_item_lines(self, result: Dict[str, Any]) -> List[str]:
+        item = result["item"]
+        lines = self._report_item_heading_lines(item)
+        if result.get("reused"):
+            lines.append(
+                "СТАТУС: без изменений с предыдущего запуска "
+                f"(анализ от {result.get('analyzed_at') or 'н/д'})"
+            )
+        lines.extend(
+            [
+                f"РЕШЕНИЕ: {result['decision']}",
+                "",
+                f"ОБОСНОВАНИЕ (по вопросу №{item['number']} повестки — {item['title']}):",
+                result["reasoning"],
+                "",
+                "ВЫЯВЛЕННЫЕ РИСКИ:",
+                result["risks"],
+                "",
+                "РЕКОМЕНДАЦИИ:",
+                result["recommendations"],
+                "",
+            ]
+        )
+        lines.extend(self._report_late_lines(result))
+        lines.extend(["=" * 80, ""])
+        return lines
+
+    def _report_late_lines(self, result: Dict[str, Any]) -> List[str]:
+        lines: List[str] = []
+        labels = self._agent_specs()
+        if result.get("revised"):
+            late = ", ".join(labels[key]["label"] for key in result["late_inputs"])
+            lines.extend([f"РЕШЕНИЕ ПЕРЕСМОТРЕНО с учётом поздних данных: {late}", ""])
+        if result.get("partial_inputs"):
+            missing = ", ".join(labels[key]["label"] for key in result["partial_inputs"])
+            lines.extend([f"НЕПОЛНЫЕ ДАННЫЕ: решение принято без результатов — {missing}", ""])
+        if result.get("addendum"):
+            lines.extend(
+                ["ДОПОЛНЕНИЕ (данные, поступившие после решения):", result["addendum"], ""]
+            )
+        return lines
+
+    def _streamed_late_lines(self, decision_result: Dict[str, Any]) -> List[str]:
+        # Уже выведен текст предварительного решения — пересмотренный дописываем целиком
+        lines = self._report_late_lines(decision_result)
+        if decision_result.get("revised"):
+            lines = ["", "", "ПЕРЕСМОТРЕННОЕ РЕШЕНИЕ:", decision_result["full_response"], ""] + lines
+        return lines
+
+    def _readable_report_sections(
+        self,
+        analysis_result: Dict[str, Any],
+    ) -> Generator[List[str], None, None]:
+        yield (
+            self._report_title_lines(
+                analysis_result["timestamp"], analysis_result["agenda_items_count"]
             )
-        return "\n".join(report_lines)
+            + self._report_summary_lines(analysis_result)
+            + ["=" * 80, "ДЕТАЛЬНЫЙ АНАЛИЗ ПО ПУНКТАМ", "=" * 80, ""]
+        )
+        for result in analysis_result["results"]:
+            yield self._report_item_lines(result)
+
+    def _generate_readable_report(self, analysis_result: Dict[str, Any]) -> str:
+        return "\n".join(
+            line
+            for section in self._readable_report_sections(analysis_result)
+            for line in section
+        )
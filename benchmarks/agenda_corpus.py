@@ -0,0 +1,39 @@
+"""Синтетический корпус повесток Совета директоров для бенчмарков (от 1 до 100 пунктов)."""
+
+import random
+from typing import Any, Dict, List
+
+CORPUS_SIZES = (1, 5, 10, 25, 50, 100)
+
+_SUBJECTS = [
+    "Об утверждении бюджета {org} на {year} год в размере {amount} млн тенге",
+    "Об одобрении крупной сделки {org} по приобретению оборудования",
+    "О назначении Председателя Правления {org}",
+    "Об утверждении отчёта об исполнении плана развития {org} за {year} год",
+    "Об одобрении сделки с заинтересованностью между {org} и АО «Самрук-Энерго»",
+    "О предоставлении займа {org} сроком на {term} лет",
+    "Об утверждении Политики управления рисками {org}",
+    "О созыве внеочередного общего собрания акционеров {org}",
+]
+_ORGS = ["ТОО «Альфа»", "АО «КазТрансГаз»", "АО «Бета Логистик»", "ТОО «Гамма Ресурс»", "АО «Дельта»"]
+
+
+def make_agenda(items: int, seed: int = 0) -> str:
+    # Повестка в «хорошем» формате: нумерованные пункты с короткими пояснениями
+    rng = random.Random(seed * 1000 + items)
+    lines: List[str] = []
+    for number in range(1, items + 1):
+        subject = rng.choice(_SUBJECTS).format(
+            org=rng.choice(_ORGS),
+            year=rng.randint(2023, 2026),
+            amount=rng.randint(10, 900),
+            term=rng.randint(2, 10),
+        )
+        lines.append(f"{number}. {subject}")
+        lines.append(f"Докладчик: член Правления. Материалы: пакет №{rng.randint(100, 999)} в системе СД.")
+    return "\n".join(lines)
+
+
+def make_body(items: int, seed: int = 0) -> Dict[str, Any]:
+    agenda = make_agenda(items, seed)
+    return {"messages": [{"role": "user", "content": f"<context>{agenda}</context>"}]}
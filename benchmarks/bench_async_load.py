@@ -0,0 +1,146 @@
+"""Нагрузочное сравнение синхронного pipe и асинхронного apipe на локальных заглушках.
+
+Пример: python benchmarks/bench_async_load.py --agendas 200 --sync-threads 16 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_servers import start_openai_stub, start_perplexity_stub  # noqa: E402
+
+
+def make_body(index: int) -> Dict[str, Any]:
+    agenda = (
+        f"1. Утверждение бюджета ДЗО №{index} на 2025 год\n"
+        "2. Одобрение крупной сделки по приобретению оборудования\n"
+    )
+    return {"messages": [{"role": "user", "content": f"<context>{agenda}</context>"}]}
+
+
+def make_pipeline(args: argparse.Namespace):
+    from SKAI import Pipeline
+
+    pipeline = Pipeline()
+    pipeline.cache_enabled = False
+    pipeline.analysis_mode = args.mode
+    pipeline.http_pool_size = args.pool_size
+    return pipeline
+
+
+def pipeline_threads() -> int:
+    # Потоки обработчиков заглушек живут в том же процессе — их не считаем
+    return sum(1 for thread in threading.enumerate() if "process_request" not in thread.name)
+
+
+class _ThreadSampler:
+    # Фоновый замер пикового числа потоков пайплайна
+    def __init__(self) -> None:
+        self.peak = pipeline_threads()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(0.01):
+            self.peak = max(self.peak, pipeline_threads())
+
+    def __enter__(self) -> "_ThreadSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def run_sync(args: argparse.Namespace) -> Dict[str, Any]:
+    pipeline = make_pipeline(args)
+
+    def consume(index: int) -> bool:
+        body = make_body(index)
+        events: List[Any] = list(pipeline.pipe("", "skai", body["messages"], body))
+        return any(isinstance(event, str) and "СВОДКА РЕШЕНИЙ" in event for event in events)
+
+    with _ThreadSampler() as sampler:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.sync_threads) as executor:
+            ok = list(executor.map(consume, range(args.agendas)))
+        elapsed = time.perf_counter() - started
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "throughput_agendas_per_s": round(args.agendas / elapsed, 2),
+        "completed": sum(ok),
+        "peak_threads": sampler.peak,
+    }
+
+
+def run_async(args: argparse.Namespace) -> Dict[str, Any]:
+    pipeline = make_pipeline(args)
+
+    async def consume(index: int) -> bool:
+        body = make_body(index)
+        completed = False
+        async for event in pipeline.apipe("", "skai", body["messages"], body):
+            if isinstance(event, str) and "СВОДКА РЕШЕНИЙ" in event:
+                completed = True
+        return completed
+
+    async def main() -> List[bool]:
+        try:
+            return await asyncio.gather(*(consume(index) for index in range(args.agendas)))
+        finally:
+            await pipeline.on_shutdown()
+
+    with _ThreadSampler() as sampler:
+        started = time.perf_counter()
+        ok = asyncio.run(main())
+        elapsed = time.perf_counter() - started
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "throughput_agendas_per_s": round(args.agendas / elapsed, 2),
+        "completed": sum(ok),
+        "peak_threads": sampler.peak,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--agendas", type=int, default=100)
+    parser.add_argument("--sync-threads", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--pool-size", type=int, default=64)
+    parser.add_argument("--mode", choices=["global", "per_item"], default="global")
+    args = parser.parse_args()
+
+    openai_server, openai_url = start_openai_stub(latency=args.latency)
+    perplexity_server, perplexity_url = start_perplexity_stub(latency=args.latency)
+    os.environ["OPENAI_BASE_URL"] = openai_url
+    os.environ["OPENAI_API_KEY"] = "sk-local-benchmark"
+    os.environ["PERPLEXITY_API_URL"] = perplexity_url
+
+    report = {
+        "agendas": args.agendas,
+        "mode": args.mode,
+        "backend_latency_s": args.latency,
+        "sync": run_sync(args),
+        "async": run_async(args),
+    }
+    report["speedup"] = round(
+        report["async"]["throughput_agendas_per_s"] / report["sync"]["throughput_agendas_per_s"], 2
+    )
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    openai_server.shutdown()
+    perplexity_server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
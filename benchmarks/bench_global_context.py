@@ -0,0 +1,112 @@
+"""Микробенчмарк извлечения глобального контекста на большой повестке (по умолчанию 5 МБ).
+
+Сравнивает прежнюю реализацию (повторные проходы, некомпилированные регулярки,
+повторный разбор пунктов) с однопроходной и с потоковой обработкой по фрагментам.
+
+Пример: python benchmarks/bench_global_context.py --size-mb 5 --chunk-kb 64
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-local-benchmark")
+
+from agenda_corpus import make_agenda  # noqa: E402
+from SKAI import Pipeline  # noqa: E402
+
+_APPENDIX = (
+    "Приложение: смета расходов ТОО «Гамма Ресурс» на капзатраты — 1 250 000 тенге, "
+    "аудит отчётности и закуп оборудования по договору с АО «Дельта Сервис».\n"
+)
+
+
+def legacy_extract(pipeline: Pipeline, agenda_text: str) -> Dict[str, Any]:
+    # Прежняя реализация _extract_global_context — эталон для сравнения
+    companies_quoted = re.findall(r'[«"]([^"»]{3,})[»"]', agenda_text)
+    amounts = re.findall(
+        r"(\d{1,3}(?:[\s,]\d{3})*(?:[.,]\d+)?\s*(?:млрд|млн|тыс)?\s*тенге)",
+        agenda_text,
+        flags=re.IGNORECASE,
+    )
+    topic_keywords = [
+        "бюджет", "крупная сделка", "приобретение", "назначение", "дивиденды", "займ",
+        "кредит", "облигации", "капзатраты", "закуп", "реорганизация", "аудит", "стратегия",
+    ]
+    lower_text = agenda_text.lower()
+    topics = [keyword for keyword in topic_keywords if keyword in lower_text]
+    return {
+        "companies": sorted(
+            {
+                company.strip()
+                for company in companies_quoted
+                if 2 <= len(company.strip().split()) <= 6
+            }
+        )[:20],
+        "amounts": amounts[:10],
+        "topics": topics[:10],
+        "total_items": len(pipeline._parse_agenda(agenda_text)),
+    }
+
+
+def make_text(size_bytes: int) -> str:
+    # Размер задаётся в байтах UTF-8 (кириллица — два байта на символ)
+    block = make_agenda(100) + "\n" + _APPENDIX * 40
+    block_bytes = len(block.encode("utf-8"))
+    text = block * (size_bytes // block_bytes + 1)
+    return text[: len(text) * size_bytes // len(text.encode("utf-8"))]
+
+
+def best_of(repeats: int, func: Callable[[], Dict[str, Any]]) -> List[Any]:
+    timings = []
+    result: Dict[str, Any] = {}
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return [min(timings), result]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=float, default=5.0)
+    parser.add_argument("--chunk-kb", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    pipeline = Pipeline()
+    text = make_text(int(args.size_mb * 1024 * 1024))
+    chunk = args.chunk_kb * 1024
+    items = pipeline._parse_agenda(text)
+
+    legacy_s, expected = best_of(args.repeats, lambda: legacy_extract(pipeline, text))
+    # В пайплайне пункты уже разобраны и передаются в извлечение контекста
+    single_s, single = best_of(args.repeats, lambda: pipeline._extract_global_context(text, items))
+    chunked_s, chunked = best_of(
+        args.repeats,
+        lambda: pipeline._extract_global_context(
+            text[start:start + chunk] for start in range(0, len(text), chunk)
+        ),
+    )
+    report = {
+        "size_bytes": len(text.encode("utf-8")),
+        "legacy_s": round(legacy_s, 4),
+        "single_pass_s": round(single_s, 4),
+        "chunked_s": round(chunked_s, 4),
+        "speedup": round(legacy_s / single_s, 2),
+        "single_pass_matches_legacy": single == expected,
+        "chunked_matches_legacy": {
+            key: chunked[key] == expected[key] for key in ("companies", "amounts", "topics")
+        },
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report["single_pass_matches_legacy"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
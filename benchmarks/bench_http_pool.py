@@ -0,0 +1,60 @@
+"""Проверка переиспользования соединений Perplexity-клиента на локальной заглушке.
+
+Пример: python benchmarks/bench_http_pool.py --requests 200 --concurrency 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-local-benchmark")
+
+from SKAI import Pipeline  # noqa: E402
+from stub_servers import start_perplexity_stub  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--min-reuse", type=float, default=0.9)
+    args = parser.parse_args()
+
+    server, url = start_perplexity_stub(latency=args.latency)
+    pipeline = Pipeline()
+    pipeline.cache_enabled = False
+    pipeline._perplexity_url = url
+    pipeline.http_pool_size = args.concurrency
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(
+            executor.map(
+                lambda index: pipeline._search_with_perplexity(f"запрос {index}"),
+                range(args.requests),
+            )
+        )
+    elapsed = time.perf_counter() - started
+
+    stats = pipeline.http_pool_stats()
+    report = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 1),
+        "errors": sum(1 for result in results if result.get("status") != "success"),
+        "client": stats,
+        "server": dict(server.stats),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    server.shutdown()
+    return 0 if stats["reuse_ratio"] >= args.min_reuse else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
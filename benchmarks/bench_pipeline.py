@@ -0,0 +1,182 @@
+"""Офлайн-бенчмарк всего пайплайна на записанных ответах (без ключей OpenAI и Perplexity).
+
+Для каждого режима и размера повестки из синтетического корпуса считает
+p50/p95/p99 латентности, пропускную способность и пиковую память.
+
+Пример: python benchmarks/bench_pipeline.py --sizes 1 10 100 --repeats 5 --latency 0.05
+Регрессии: --output base.json, затем --baseline base.json --max-regression 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agenda_corpus import CORPUS_SIZES, make_body  # noqa: E402
+from stub_servers import load_recording, start_openai_stub, start_perplexity_stub  # noqa: E402
+
+RECORDING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recorded_responses.json")
+
+# Режим: (analysis_mode, max_item_workers, max_agent_workers)
+MODES = {
+    "global-sequential": ("global", 1, 1),
+    "global-concurrent": ("global", 4, 3),
+    "per_item-sequential": ("per_item", 1, 1),
+    "per_item-concurrent": ("per_item", 4, 3),
+}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    # Метод ближайшего ранга
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def make_pipeline(mode: str, args: argparse.Namespace):
+    from SKAI import Pipeline
+
+    analysis_mode, item_workers, agent_workers = MODES[mode]
+    pipeline = Pipeline()
+    pipeline.debug = False
+    pipeline.cache_enabled = False
+    pipeline.analysis_mode = analysis_mode
+    pipeline.max_item_workers = item_workers
+    pipeline.max_agent_workers = agent_workers
+    pipeline.stream_output = args.stream
+    return pipeline
+
+
+def run_once(pipeline, body: Dict[str, Any], use_async: bool) -> bool:
+    if use_async:
+        async def consume() -> List[Any]:
+            return [event async for event in pipeline.apipe("", "skai", body["messages"], body)]
+
+        events = asyncio.run(consume())
+    else:
+        events = list(pipeline.pipe("", "skai", body["messages"], body))
+    return any(isinstance(event, str) and "СВОДКА РЕШЕНИЙ" in event for event in events)
+
+
+def bench_case(mode: str, size: int, args: argparse.Namespace) -> Dict[str, Any]:
+    pipeline = make_pipeline(mode, args)
+    # Прогрев: ленивый импорт SDK и первые соединения не попадают в замеры
+    for _ in range(args.warmup):
+        run_once(pipeline, make_body(size), args.async_runner)
+    pipeline._metrics = {kind: {} for kind in pipeline._metrics}
+    latencies: List[float] = []
+    completed = 0
+    tracemalloc.start()
+    started = time.perf_counter()
+    for repeat in range(args.repeats):
+        run_started = time.perf_counter()
+        completed += run_once(pipeline, make_body(size, seed=repeat), args.async_runner)
+        latencies.append(time.perf_counter() - run_started)
+    elapsed = time.perf_counter() - started
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stages = json.loads(pipeline.export_metrics("json"))["stage"]
+    return {
+        "mode": mode,
+        "items": size,
+        "runs": args.repeats,
+        "completed": completed,
+        "p50_s": round(percentile(latencies, 50), 4),
+        "p95_s": round(percentile(latencies, 95), 4),
+        "p99_s": round(percentile(latencies, 99), 4),
+        "throughput_agendas_per_s": round(args.repeats / elapsed, 3),
+        "throughput_items_per_s": round(args.repeats * size / elapsed, 3),
+        "peak_memory_mb": round(peak_bytes / 1024 / 1024, 2),
+        "stage_mean_s": {
+            name: round(series["sum"] / series["count"], 4)
+            for name, series in stages.items()
+            if series["count"]
+        },
+    }
+
+
+def find_regressions(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], max_regression: float
+) -> List[str]:
+    previous = {(case["mode"], case["items"]): case for case in baseline}
+    regressions = []
+    for case in results:
+        base = previous.get((case["mode"], case["items"]))
+        if base is None:
+            continue
+        for metric in ("p95_s", "peak_memory_mb"):
+            if base[metric] and case[metric] > base[metric] * (1 + max_regression):
+                regressions.append(
+                    f"{case['mode']} / {case['items']} п.: {metric} "
+                    f"{base[metric]} -> {case[metric]}"
+                )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(CORPUS_SIZES))
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=list(MODES))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--recording", default=RECORDING_PATH)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--async", dest="async_runner", action="store_true")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    recording = load_recording(args.recording)
+    openai_server, openai_url = start_openai_stub(args.latency, args.error_rate, recording)
+    perplexity_server, perplexity_url = start_perplexity_stub(
+        args.latency, args.error_rate, recording
+    )
+    os.environ["OPENAI_BASE_URL"] = openai_url
+    os.environ["OPENAI_API_KEY"] = "sk-local-benchmark"
+    os.environ["PERPLEXITY_API_KEY"] = "pplx-local-benchmark"
+    os.environ["PERPLEXITY_API_URL"] = perplexity_url
+
+    results = []
+    for mode in args.modes:
+        for size in args.sizes:
+            case = bench_case(mode, size, args)
+            print(json.dumps(case, ensure_ascii=False), file=sys.stderr)
+            results.append(case)
+    report = {
+        "backend_latency_s": args.latency,
+        "error_rate": args.error_rate,
+        "runner": "async" if args.async_runner else "sync",
+        "results": results,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    openai_server.shutdown()
+    perplexity_server.shutdown()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            baseline = json.load(handle)["results"]
+        regressions = find_regressions(results, baseline, args.max_regression)
+        for line in regressions:
+            print(f"[REGRESSION] {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Бенчмарк холодного старта: импорт SKAI, создание Pipeline и первая повестка.
+
+Каждый замер выполняется в отдельном процессе, как после деплоя или рестарта
+сервиса. Первая повестка сравнивается без прогрева и после Pipeline.on_startup.
+
+Пример: python benchmarks/bench_startup.py --repeats 5 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from agenda_corpus import make_body  # noqa: E402
+from stub_servers import load_recording, start_openai_stub, start_perplexity_stub  # noqa: E402
+
+RECORDING_PATH = os.path.join(BENCH_DIR, "recorded_responses.json")
+SCENARIOS = ("cold", "warm")
+
+
+def child(scenario: str, size: int) -> Dict[str, Any]:
+    # Выполняется в дочернем процессе: SKAI ещё не импортирован
+    started = time.perf_counter()
+    from SKAI import Pipeline
+
+    imported = time.perf_counter()
+    pipeline = Pipeline()
+    constructed = time.perf_counter()
+    second = Pipeline()
+    second_constructed = time.perf_counter()
+    pipeline.debug = False
+    pipeline.cache_enabled = False
+    if scenario == "warm":
+        asyncio.run(pipeline.on_startup())
+    warmed = time.perf_counter()
+    body = make_body(size)
+    events = list(pipeline.pipe("", "skai", body["messages"], body))
+    finished = time.perf_counter()
+    del second
+    return {
+        "import_s": imported - started,
+        "construct_s": constructed - imported,
+        "construct_next_s": second_constructed - constructed,
+        "startup_s": warmed - second_constructed,
+        "first_agenda_s": finished - warmed,
+        "completed": any(isinstance(event, str) and "СВОДКА РЕШЕНИЙ" in event for event in events),
+    }
+
+
+def run_child(scenario: str, size: int) -> Dict[str, Any]:
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", scenario, "--sizes", str(size)],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=os.environ.copy(),
+    ).stdout
+    # on_startup печатает в stdout — результат в последней строке
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        metric: round(statistics.median(sample[metric] for sample in samples), 4)
+        for metric in ("import_s", "construct_s", "construct_next_s", "startup_s", "first_agenda_s")
+    } | {"completed": sum(sample["completed"] for sample in samples)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--recording", default=RECORDING_PATH)
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args.child, args.sizes[0])))
+        return 0
+
+    recording = load_recording(args.recording)
+    openai_server, openai_url = start_openai_stub(args.latency, 0.0, recording)
+    perplexity_server, perplexity_url = start_perplexity_stub(args.latency, 0.0, recording)
+    os.environ["OPENAI_BASE_URL"] = openai_url
+    os.environ["OPENAI_API_KEY"] = "sk-local-benchmark"
+    os.environ["PERPLEXITY_API_KEY"] = "pplx-local-benchmark"
+    os.environ["PERPLEXITY_API_URL"] = perplexity_url
+
+    results = []
+    for size in args.sizes:
+        for scenario in SCENARIOS:
+            samples = [run_child(scenario, size) for _ in range(args.repeats)]
+            case = {"scenario": scenario, "items": size, "runs": args.repeats, **summarize(samples)}
+            print(json.dumps(case, ensure_ascii=False), file=sys.stderr)
+            results.append(case)
+    print(
+        json.dumps(
+            {"backend_latency_s": args.latency, "results": results}, ensure_ascii=False, indent=2
+        )
+    )
+    openai_server.shutdown()
+    perplexity_server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""Локальные заглушки внешних API для бенчмарков SKAI (без сети и ключей)."""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+STUB_DECISION = (
+    "Решение: ЗА\n"
+    "Обоснование: Заглушка — нарушений ВНД и законодательства не выявлено.\n"
+    "Риски: Низкие.\n"
+    "Рекомендации: Нет дополнительных рекомендаций."
+)
+
+
+# Записанные ответы бэкендов: {вид запроса: [варианты текста]}
+Recording = Dict[str, List[str]]
+
+
+def load_recording(path: str) -> Recording:
+    with open(path, encoding="utf-8") as handle:
+        recording = json.load(handle)
+    return {kind: list(texts) for kind, texts in recording.items() if texts}
+
+
+def _replay(recording: Optional[Recording], kind: str, payload: Dict[str, Any]) -> Optional[str]:
+    # Вариант выбирается по хэшу запроса: одинаковый запрос — одинаковый ответ
+    texts = (recording or {}).get(kind)
+    if not texts:
+        return None
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return texts[int(digest.hexdigest(), 16) % len(texts)]
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Большая очередь accept, чтобы нагрузочные тесты не упирались в backlog
+    request_queue_size = 1024
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1, чтобы клиент мог держать keep-alive соединения
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.stats_lock:
+            self.server.stats["connections"] += 1
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_HEAD(self) -> None:
+        # Прогрев соединений (Pipeline.warm_up) — ответ без тела
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        # Прогрев соединений OpenAI SDK (models.list)
+        self._send(200, {"object": "list", "data": []})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        with self.server.stats_lock:
+            self.server.stats["requests"] += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if random.random() < self.server.error_rate:
+            self._send(429, {"error": {"message": "rate limited"}}, {"Retry-After": "1"})
+            return
+        self._send(200, self.server.reply(self.path, payload, self.server.recording))
+
+    def _send(
+        self,
+        status: int,
+        body: Union[Dict[str, Any], str],
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        if isinstance(body, str):
+            raw = body.encode("utf-8")
+            content_type = "text/event-stream"
+        else:
+            raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(raw)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+def _perplexity_reply(
+    path: str, payload: Dict[str, Any], recording: Optional[Recording] = None
+) -> Dict[str, Any]:
+    content = _replay(recording, "perplexity", payload)
+    return {
+        "choices": [
+            {
+                "message": {
+                    "role": "assistant",
+                    "content": content or "Заглушка Perplexity: новостей не найдено.",
+                }
+            }
+        ],
+        # Оценка по длине, как у OpenAI-заглушки
+        "usage": {
+            "prompt_tokens": len(json.dumps(payload, ensure_ascii=False)) // 4,
+            "completion_tokens": len(content or "Заглушка Perplexity: новостей не найдено.") // 4,
+        },
+    }
+
+
+def request_kind(payload: Dict[str, Any]) -> str:
+    # Тип запроса пайплайна: препроцессинг, запросы агентов, синтез решения
+    # или поиск по документам / в интернете.
+    if payload.get("instructions"):
+        return "synthesis"
+    messages = payload.get("input")
+    if isinstance(messages, list):
+        system = str(messages[0].get("content", ""))
+        if "редактор повесток" in system:
+            return "preprocess"
+        if "vnd_query" in system:
+            return "queries"
+    tool_types = {tool.get("type") for tool in payload.get("tools", [])}
+    if "web_search_preview" in tool_types:
+        return "web_search"
+    return "file_search"
+
+
+def _stub_queries(recording: Optional[Recording], payload: Dict[str, Any]) -> Dict[str, str]:
+    recorded = _replay(recording, "queries", payload)
+    if recorded is not None:
+        return json.loads(recorded)
+    return {
+        "vnd_query": "Проверка полномочий и процедур по ВНД",
+        "legal_query": "Требования законодательства РК",
+        "web_query": "Реакция СМИ и экспертов",
+    }
+
+
+def _stub_items(agenda: str, whole_agenda: bool = True) -> List[Dict[str, str]]:
+    # Пункты повестки: строки «N. ...» начинают пункт, остальные — его детали.
+    # Фрагмент без пунктов (приложения, подписи) даёт пустой список, как у модели
+    items: List[Dict[str, str]] = []
+    for line in agenda.splitlines():
+        line = line.strip()
+        match = re.match(r"^\d+[.)]\s*(.+)", line)
+        if match:
+            items.append({"title": match.group(1), "details": ""})
+        elif line and items:
+            items[-1]["details"] = (items[-1]["details"] + "\n" + line).strip()
+    if items or not whole_agenda:
+        return items
+    return [{"title": agenda.strip()[:100] or "Пункт повестки", "details": ""}]
+
+
+def responses_text(payload: Dict[str, Any], recording: Optional[Recording] = None) -> str:
+    kind = request_kind(payload)
+    if kind == "preprocess":
+        # Препроцессинг возвращает пункты самой повестки — записанный ответ тут не подходит
+        messages = payload["input"]
+        agenda = str(messages[-1].get("content", "")).split("ТЕКСТ ПОВЕСТКИ:\n", 1)[-1]
+        # Фрагмент большой повестки запрашивается по схеме без запросов агентов
+        whole_agenda = "vnd_query" in json.dumps(payload.get("text", {}))
+        return json.dumps(
+            {"items": _stub_items(agenda, whole_agenda), **_stub_queries(recording, payload)},
+            ensure_ascii=False,
+        )
+    if kind == "queries":
+        return json.dumps(_stub_queries(recording, payload), ensure_ascii=False)
+    recorded = _replay(recording, kind, payload)
+    if recorded is not None:
+        return recorded
+    if kind == "synthesis":
+        return STUB_DECISION
+    return "Заглушка: релевантные положения документов не найдены."
+
+
+def _responses_body(payload: Dict[str, Any], text: str) -> Dict[str, Any]:
+    return {
+        "id": "resp_stub",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": payload.get("model", "gpt-4o"),
+        "status": "completed",
+        "output": [
+            {
+                "type": "message",
+                "id": "msg_stub",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }
+        ],
+        "usage": {
+            "input_tokens": len(json.dumps(payload, ensure_ascii=False)) // 4,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": len(text) // 4,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": 0,
+        },
+    }
+
+
+def _responses_reply(
+    path: str, payload: Dict[str, Any], recording: Optional[Recording] = None
+) -> Union[Dict[str, Any], str]:
+    text = responses_text(payload, recording)
+    body = _responses_body(payload, text)
+    if not payload.get("stream"):
+        return body
+    events = [
+        {"type": "response.output_text.delta", "delta": text[start:start + 16]}
+        for start in range(0, len(text), 16)
+    ]
+    events.append({"type": "response.completed", "response": body})
+    return "".join(
+        f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        for event in events
+    )
+
+
+def start_stub_server(
+    reply=_perplexity_reply,
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    recording: Optional[Recording] = None,
+) -> Tuple[_StubServer, str]:
+    server = _StubServer(("127.0.0.1", 0), _StubHandler)
+    server.reply = reply
+    server.recording = recording
+    server.latency = latency
+    server.error_rate = error_rate
+    server.stats = {"connections": 0, "requests": 0}
+    server.stats_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def start_perplexity_stub(
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    recording: Optional[Recording] = None,
+) -> Tuple[_StubServer, str]:
+    server, base_url = start_stub_server(_perplexity_reply, latency, error_rate, recording)
+    return server, f"{base_url}/chat/completions"
+
+
+def start_openai_stub(
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    recording: Optional[Recording] = None,
+) -> Tuple[_StubServer, str]:
+    # Возвращает base_url для OpenAI SDK (OPENAI_BASE_URL)
+    server, base_url = start_stub_server(_responses_reply, latency, error_rate, recording)
+    return server, f"{base_url}/v1"
@@ -0,0 +1,280 @@
+"""Пакетный анализ повесток ДЗО: каталог файлов или JSONL -> отчёт по каждой повестке и сводка.
+
+Примеры:
+    python skai_batch.py agendas/ --out reports/ --concurrency 4
+    python skai_batch.py agendas.jsonl --openai-concurrency 8 --openai-tpm 30000
+
+Каталог: каждый *.txt / *.md — отдельная повестка (идентификатор — имя файла).
+JSONL: строки вида {"id": "...", "agenda": "..."} (или поле "text").
+Прогресс пишется в <out>/checkpoint.jsonl: при повторном запуске уже готовые
+повестки (с тем же текстом) не анализируются заново.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+from SKAI import Pipeline
+
+AGENDA_SUFFIXES = (".txt", ".md")
+
+
+def load_agendas(source: str) -> List[Dict[str, str]]:
+    agendas: List[Dict[str, str]] = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if os.path.isfile(path) and name.lower().endswith(AGENDA_SUFFIXES):
+                with open(path, encoding="utf-8") as handle:
+                    agendas.append({"id": os.path.splitext(name)[0], "text": handle.read()})
+        return agendas
+    with open(source, encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            text = record.get("agenda") or record.get("text") or ""
+            agendas.append({"id": str(record.get("id") or line_number), "text": str(text)})
+    return agendas
+
+
+def safe_name(agenda_id: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", agenda_id).strip("._") or "agenda"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def write_atomic(path: str, content: str) -> None:
+    # Файл либо записан целиком, либо не изменился — прерывание не оставит обрывков
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        handle.write(content)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str) -> Dict[str, Dict[str, Any]]:
+    done: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Последняя строка могла оборваться при аварийной остановке
+                continue
+            done[entry["id"]] = entry
+    return done
+
+
+class _Checkpoint:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.done = load_checkpoint(path)
+        self._lock = threading.Lock()
+
+    def is_done(self, agenda: Dict[str, str], out_dir: str) -> bool:
+        entry = self.done.get(agenda["id"])
+        return (
+            entry is not None
+            and entry["sha256"] == text_hash(agenda["text"])
+            and os.path.exists(os.path.join(out_dir, entry["result"]))
+        )
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as handle:
+                handle.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                handle.flush()
+                os.fsync(handle.fileno())
+            self.done[entry["id"]] = entry
+
+
+def analyze_agenda(pipeline: Pipeline, agenda: Dict[str, str], out_dir: str) -> Dict[str, Any]:
+    if not agenda["text"].strip():
+        raise ValueError("пустая повестка")
+    body = {
+        "messages": [{"role": "user", "content": f"<context>{agenda['text']}</context>"}],
+        # Правленая повестка с тем же id повторно использует неизменные пункты
+        "agenda_id": agenda["id"],
+    }
+    outcome: Dict[str, Any] = {}
+    report_parts = [
+        event
+        for event in pipeline._in_run_context(pipeline._run_pipe(body, outcome))
+        if isinstance(event, str)
+    ]
+    if "analysis_result" not in outcome:
+        raise RuntimeError(outcome.get("error") or "анализ не завершён")
+    name = safe_name(agenda["id"])
+    write_atomic(os.path.join(out_dir, f"{name}.md"), "".join(report_parts))
+    write_atomic(
+        os.path.join(out_dir, f"{name}.json"),
+        json.dumps(outcome["analysis_result"], ensure_ascii=False, indent=2, default=str),
+    )
+    # Отчёт с ошибками агентов или решением без части данных оставляем для просмотра,
+    # но в checkpoint не пишем — повторный запуск проанализирует повестку заново
+    incomplete = [
+        str(result["item"]["number"])
+        for result in outcome["analysis_result"]["results"]
+        if not pipeline._result_complete(result)
+    ]
+    if incomplete:
+        raise RuntimeError(f"анализ неполный (пункты: {', '.join(incomplete)})")
+    return {
+        "id": agenda["id"],
+        "sha256": text_hash(agenda["text"]),
+        "report": f"{name}.md",
+        "result": f"{name}.json",
+    }
+
+
+def combined_summary(
+    pipeline: Pipeline,
+    agendas: List[Dict[str, str]],
+    checkpoint: _Checkpoint,
+    failures: Dict[str, str],
+    out_dir: str,
+) -> Dict[str, Any]:
+    rows: List[Dict[str, Any]] = []
+    all_results: List[Dict[str, Any]] = []
+    for agenda in agendas:
+        entry = checkpoint.done.get(agenda["id"])
+        if agenda["id"] in failures or entry is None:
+            rows.append(
+                {"id": agenda["id"], "status": "error", "error": failures.get(agenda["id"], "")}
+            )
+            continue
+        with open(os.path.join(out_dir, entry["result"]), encoding="utf-8") as handle:
+            analysis_result = json.load(handle)
+        for result in analysis_result["results"]:
+            # Номера пунктов уникальны только внутри повестки — добавляем идентификатор
+            item = dict(result["item"], number=f"{agenda['id']}/{result['item']['number']}")
+            all_results.append(dict(result, item=item))
+        rows.append(
+            {
+                "id": agenda["id"],
+                "status": "done",
+                "report": entry["report"],
+                **analysis_result["summary"],
+            }
+        )
+    return {"agendas": rows, "overall": pipeline._generate_summary(all_results)}
+
+
+def summary_markdown(summary: Dict[str, Any]) -> str:
+    overall = summary["overall"]
+    lines = [
+        "СВОДКА ПАКЕТНОГО АНАЛИЗА ПОВЕСТОК",
+        "=" * 80,
+        f"Повесток: {len(summary['agendas'])}; пунктов: {overall['total_items']}",
+        f"• ЗА: {overall['decisions_summary']['ЗА']}",
+        f"• ПРОТИВ: {overall['decisions_summary']['ПРОТИВ']}",
+        f"• ВОЗДЕРЖАЛСЯ: {overall['decisions_summary']['ВОЗДЕРЖАЛСЯ']}",
+        f"• Процент одобрения: {overall['approval_rate']:.1%}",
+        f"• Пункты высокого риска: {', '.join(overall['high_risk_items']) or 'нет'}",
+        "",
+        "| Повестка | Статус | Пунктов | ЗА | ПРОТИВ | ВОЗДЕРЖАЛСЯ | Отчёт |",
+        "|---|---|---|---|---|---|---|",
+    ]
+    for row in summary["agendas"]:
+        if row["status"] != "done":
+            lines.append(f"| {row['id']} | ошибка: {row['error']} | | | | | |")
+            continue
+        decisions = row["decisions_summary"]
+        lines.append(
+            f"| {row['id']} | готово | {row['total_items']} | {decisions['ЗА']} | "
+            f"{decisions['ПРОТИВ']} | {decisions['ВОЗДЕРЖАЛСЯ']} | {row['report']} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("source", help="каталог с повестками или файл JSONL")
+    parser.add_argument("--out", default="skai_reports")
+    parser.add_argument("--concurrency", type=int, default=4, help="повесток одновременно")
+    parser.add_argument("--openai-concurrency", type=int, default=0)
+    parser.add_argument("--perplexity-concurrency", type=int, default=0)
+    parser.add_argument("--openai-rpm", type=int, default=0, help="запросов в минуту для OpenAI")
+    parser.add_argument("--perplexity-rpm", type=int, default=0)
+    parser.add_argument("--openai-tpm", type=int, default=0, help="токенов в минуту для OpenAI")
+    parser.add_argument("--perplexity-tpm", type=int, default=0)
+    parser.add_argument("--mode", choices=["global", "per_item"], default="per_item")
+    parser.add_argument("--restart", action="store_true", help="игнорировать checkpoint")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    os.makedirs(args.out, exist_ok=True)
+    agendas = load_agendas(args.source)
+    if len({agenda["id"] for agenda in agendas}) != len(agendas):
+        print("[ERROR] Идентификаторы повесток повторяются", file=sys.stderr)
+        return 2
+    # Разные идентификаторы («a/b» и «a_b») могут дать одно имя файла отчёта
+    if len({safe_name(agenda["id"]) for agenda in agendas}) != len(agendas):
+        print("[ERROR] Имена файлов отчётов совпадают у разных повесток", file=sys.stderr)
+        return 2
+
+    pipeline = Pipeline()
+    pipeline.analysis_mode = args.mode
+    for provider in ("openai", "perplexity"):
+        concurrency = getattr(args, f"{provider}_concurrency")
+        requests_per_minute = getattr(args, f"{provider}_rpm")
+        tokens_per_minute = getattr(args, f"{provider}_tpm")
+        if concurrency > 0:
+            pipeline.provider_concurrency[provider] = concurrency
+        if requests_per_minute > 0:
+            pipeline.provider_requests_per_minute[provider] = requests_per_minute
+        if tokens_per_minute > 0:
+            pipeline.provider_tokens_per_minute[provider] = tokens_per_minute
+
+    checkpoint_path = os.path.join(args.out, "checkpoint.jsonl")
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = _Checkpoint(checkpoint_path)
+    pending = [agenda for agenda in agendas if not checkpoint.is_done(agenda, args.out)]
+    print(
+        f"Повесток: {len(agendas)}, уже готово: {len(agendas) - len(pending)}, "
+        f"к анализу: {len(pending)}",
+        file=sys.stderr,
+    )
+
+    failures: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        futures = {
+            executor.submit(analyze_agenda, pipeline, agenda, args.out): agenda
+            for agenda in pending
+        }
+        for finished, future in enumerate(as_completed(futures), 1):
+            agenda = futures[future]
+            try:
+                checkpoint.record(future.result())
+                status = "готово"
+            except Exception as exc:
+                failures[agenda["id"]] = str(exc)
+                status = f"ошибка: {exc}"
+            print(f"[{finished}/{len(pending)}] {agenda['id']}: {status}", file=sys.stderr)
+
+    summary = combined_summary(pipeline, agendas, checkpoint, failures, args.out)
+    write_atomic(
+        os.path.join(args.out, "summary.json"), json.dumps(summary, ensure_ascii=False, indent=2)
+    )
+    write_atomic(os.path.join(args.out, "summary.md"), summary_markdown(summary))
+    print(f"Сводка: {os.path.join(args.out, 'summary.md')}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
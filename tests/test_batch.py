@@ -0,0 +1,77 @@
+"""Пакетный режим: неполный анализ не попадает в checkpoint, имена отчётов уникальны.
+
+Запуск: python -m pytest -q tests (или python -m unittest discover tests)
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import skai_batch  # noqa: E402
+from SKAI import Pipeline  # noqa: E402
+
+AGENDA = {"id": "board-7", "text": "1. Об утверждении бюджета\n2. О назначении Председателя Правления"}
+
+
+def make_pipeline(legal_fails: bool = False) -> Pipeline:
+    pipeline = Pipeline()
+    pipeline.debug = False
+    pipeline.cache_enabled = False
+    pipeline.coalesce_identical_requests = False
+    pipeline.analysis_mode = "per_item"
+    pipeline.agent_soft_deadline_seconds = 0.0
+    pipeline._generate_global_agent_queries = lambda *args: {
+        "vnd_query": "ВНД",
+        "legal_query": "Право",
+        "web_query": "СМИ",
+    }
+    for key, method, agent in (
+        ("internal_docs", "_analyze_internal_compliance", "VND"),
+        ("legal", "_analyze_legal_compliance", "Legal"),
+        ("web_search", "_analyze_public_reaction", "WebSearch"),
+    ):
+        if legal_fails and key == "legal":
+            handler = lambda query, key=key, agent=agent: pipeline._agent_error(
+                query, RuntimeError("503"), key, agent
+            )
+        else:
+            handler = lambda query, key=key, agent=agent: pipeline._agent_success(
+                query, "Нарушений не выявлено.", key, agent
+            )
+        setattr(pipeline, method, handler)
+    pipeline._synthesize_decision = lambda *args: pipeline._parse_decision(
+        "Решение: ЗА\nОбоснование: Нарушений нет.\nРиски: Низкие.\nРекомендации: Нет."
+    )
+    return pipeline
+
+
+class BatchTest(unittest.TestCase):
+    def test_complete_agenda_is_recorded(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            entry = skai_batch.analyze_agenda(make_pipeline(), AGENDA, out_dir)
+            self.assertEqual(entry["id"], "board-7")
+            self.assertTrue(os.path.exists(os.path.join(out_dir, entry["result"])))
+
+    def test_agent_error_is_not_checkpointed(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            with self.assertRaises(RuntimeError):
+                skai_batch.analyze_agenda(make_pipeline(legal_fails=True), AGENDA, out_dir)
+            checkpoint = skai_batch._Checkpoint(os.path.join(out_dir, "checkpoint.jsonl"))
+            self.assertFalse(checkpoint.is_done(AGENDA, out_dir))
+
+    def test_colliding_report_names_are_rejected(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            source = os.path.join(out_dir, "agendas.jsonl")
+            with open(source, "w", encoding="utf-8") as handle:
+                for agenda_id in ("a/b", "a_b"):
+                    handle.write(json.dumps({"id": agenda_id, "agenda": AGENDA["text"]}) + "\n")
+            self.assertEqual(skai_batch.main([source, "--out", out_dir]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
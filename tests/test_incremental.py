@@ -0,0 +1,104 @@
+"""Инкрементальный анализ: правка одного пункта не сбрасывает остальные.
+
+Запуск: python -m pytest -q tests (или python -m unittest discover tests)
+"""
+
+import itertools
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from SKAI import Pipeline  # noqa: E402
+
+ITEMS = [
+    "Об утверждении бюджета ТОО «Альфа Бета» на 2025 год",
+    "О назначении Председателя Правления",
+    "Об утверждении Политики управления рисками",
+]
+
+
+def make_pipeline() -> Pipeline:
+    pipeline = Pipeline()
+    pipeline.debug = False
+    pipeline.cache_enabled = True
+    pipeline.cache_path = ""
+    pipeline.coalesce_identical_requests = False
+    pipeline.analysis_mode = "per_item"
+    pipeline.incremental_analysis = True
+    pipeline.agent_soft_deadline_seconds = 0.0
+    pipeline.analyzed = []
+    # LLM формулирует запросы по всей повестке заново при каждом запуске
+    counter = itertools.count()
+
+    def queries(*args):
+        run = next(counter)
+        return {
+            "vnd_query": f"ВНД, редакция {run}",
+            "legal_query": f"Право, редакция {run}",
+            "web_query": f"СМИ, редакция {run}",
+        }
+
+    pipeline._generate_global_agent_queries = queries
+    for key, method, agent in (
+        ("internal_docs", "_analyze_internal_compliance", "VND"),
+        ("legal", "_analyze_legal_compliance", "Legal"),
+        ("web_search", "_analyze_public_reaction", "WebSearch"),
+    ):
+        setattr(
+            pipeline,
+            method,
+            lambda query, key=key, agent=agent: pipeline._agent_success(
+                query, "Нарушений не выявлено.", key, agent
+            ),
+        )
+
+    def synthesize(item, analyses):
+        pipeline.analyzed.append(item["title"])
+        return pipeline._parse_decision(
+            "Решение: ЗА\nОбоснование: Нарушений нет.\nРиски: Низкие.\nРекомендации: Нет."
+        )
+
+    pipeline._synthesize_decision = synthesize
+    return pipeline
+
+
+def run_pipe(pipeline: Pipeline, items, agenda_id=None):
+    agenda = "\n".join(f"{number}. {text}" for number, text in enumerate(items, 1))
+    body = {"messages": [{"role": "user", "content": f"<context>{agenda}</context>"}]}
+    if agenda_id:
+        body["agenda_id"] = agenda_id
+    pipeline.analyzed.clear()
+    list(pipeline.pipe("", "skai", body["messages"], body))
+    return list(pipeline.analyzed)
+
+
+class IncrementalAnalysisTest(unittest.TestCase):
+    def test_edited_item_is_the_only_one_reanalyzed(self):
+        pipeline = make_pipeline()
+        self.assertEqual(len(run_pipe(pipeline, ITEMS)), 3)
+        edited = ITEMS[:1] + ["О досрочном прекращении полномочий Председателя Правления"] + ITEMS[2:]
+        analyzed = run_pipe(pipeline, edited)
+        self.assertEqual(len(analyzed), 1)
+        self.assertIn("прекращении", analyzed[0])
+
+    def test_added_item_keeps_previous_results_for_agenda_id(self):
+        pipeline = make_pipeline()
+        run_pipe(pipeline, ITEMS, agenda_id="board-7")
+        analyzed = run_pipe(
+            pipeline, ITEMS + ["Об одобрении сделки с ТОО «Гамма Дельта»"], agenda_id="board-7"
+        )
+        self.assertEqual(len(analyzed), 1)
+        self.assertIn("Гамма", analyzed[0])
+
+    def test_other_agenda_does_not_reuse_common_item(self):
+        pipeline = make_pipeline()
+        run_pipe(pipeline, ITEMS)
+        other = ["Об утверждении бюджета ТОО «Омега Сигма» на 2025 год", ITEMS[1]]
+        self.assertEqual(len(run_pipe(pipeline, other)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Экспорт метрик: каждая строка Prometheus принадлежит объявленному семейству своего типа.
+
+Запуск: python -m pytest -q tests (или python -m unittest discover tests)
+"""
+
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from SKAI import Pipeline  # noqa: E402
+
+# Суффиксы, допустимые у строк семейства данного типа
+SAMPLE_SUFFIXES = {"summary": ("_count", "_sum", ""), "counter": ("",), "gauge": ("",)}
+
+
+def parse_families(text: str):
+    families, helps, samples = {}, set(), []
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, metric_type = line.split(" ")
+            families[name] = metric_type
+        elif line.startswith("# HELP "):
+            helps.add(line.split(" ")[2])
+        elif line:
+            samples.append(re.match(r"[a-zA-Z_:][a-zA-Z0-9_:]*", line).group(0))
+    return families, helps, samples
+
+
+def family_of(sample: str, families):
+    for name, metric_type in families.items():
+        for suffix in SAMPLE_SUFFIXES[metric_type]:
+            if sample == name + suffix:
+                return name
+    return None
+
+
+class MetricsExportTest(unittest.TestCase):
+    def test_every_sample_belongs_to_its_family(self):
+        pipeline = Pipeline()
+        pipeline.debug = False
+        pipeline._record_timing("stage", "agents", 0.2)
+        pipeline._record_timing("agent", "VND", 0.1, "error")
+        pipeline._record_timing("call", "synthesis", 0.3)
+        families, _, samples = parse_families(pipeline.export_metrics())
+        self.assertTrue(samples)
+        for sample in samples:
+            self.assertIsNotNone(family_of(sample, families), sample)
+
+    def test_max_and_errors_are_separate_families(self):
+        pipeline = Pipeline()
+        pipeline.debug = False
+        pipeline._record_timing("agent", "VND", 0.1, "error")
+        text = pipeline.export_metrics()
+        families, helps, _ = parse_families(text)
+        self.assertEqual(families["skai_agent_seconds"], "summary")
+        self.assertEqual(families["skai_agent_seconds_max"], "gauge")
+        self.assertEqual(families["skai_agent_seconds_errors_total"], "counter")
+        for name in ("skai_agent_seconds", "skai_agent_seconds_max", "skai_agent_seconds_errors_total"):
+            self.assertIn(name, helps)
+        self.assertIn('skai_agent_seconds_errors_total{agent="VND"} 1', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+"""Время pipe — сумма реальных вызовов бэкендов, без искусственных пауз.
+
+Запуск: python -m pytest -q tests (или python -m unittest discover tests)
+"""
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from SKAI import Pipeline  # noqa: E402
+
+# Задержки подставных бэкендов (сек)
+QUERIES_LATENCY = 0.05
+AGENT_LATENCY = {"internal_docs": 0.1, "legal": 0.15, "web_search": 0.2}
+SYNTHESIS_LATENCY = 0.1
+BACKEND_TOTAL = QUERIES_LATENCY + sum(AGENT_LATENCY.values()) + SYNTHESIS_LATENCY
+# Допуск на разбор повестки, отчёт и планирование потоков
+TOLERANCE = 0.25
+
+AGENDA = "1. Об утверждении бюджета на 2025 год\n2. Об одобрении сделки с ТОО «Альфа»"
+
+
+def make_pipeline() -> Pipeline:
+    pipeline = Pipeline()
+    pipeline.debug = False
+    pipeline.cache_enabled = False
+    pipeline.coalesce_identical_requests = False
+    pipeline.analysis_mode = "global"
+    # Агенты по одному: время конвейера — ровно сумма вызовов, а не максимум
+    pipeline.max_agent_workers = 1
+    pipeline.agent_soft_deadline_seconds = 0.0
+
+    def backend(latency: float, result):
+        def call(*args, **kwargs):
+            time.sleep(latency)
+            return result(*args)
+
+        return call
+
+    pipeline._generate_global_agent_queries = backend(
+        QUERIES_LATENCY,
+        lambda *args: {"vnd_query": "ВНД", "legal_query": "Право", "web_query": "СМИ"},
+    )
+    for key, method, agent in (
+        ("internal_docs", "_analyze_internal_compliance", "VND"),
+        ("legal", "_analyze_legal_compliance", "Legal"),
+        ("web_search", "_analyze_public_reaction", "WebSearch"),
+    ):
+        setattr(
+            pipeline,
+            method,
+            backend(
+                AGENT_LATENCY[key],
+                lambda query, key=key, agent=agent: pipeline._agent_success(
+                    query, "Нарушений не выявлено.", key, agent
+                ),
+            ),
+        )
+    pipeline._synthesize_decision = backend(
+        SYNTHESIS_LATENCY,
+        lambda *args: pipeline._parse_decision(
+            "Решение: ЗА\nОбоснование: Нарушений нет.\nРиски: Низкие.\nРекомендации: Нет."
+        ),
+    )
+    return pipeline
+
+
+def run_pipe(pipeline: Pipeline):
+    body = {"messages": [{"role": "user", "content": f"<context>{AGENDA}</context>"}]}
+    started = time.perf_counter()
+    events = list(pipeline.pipe("", "skai", body["messages"], body))
+    return time.perf_counter() - started, events
+
+
+class PacingTest(unittest.TestCase):
+    def test_pipe_time_is_sum_of_backend_calls(self):
+        pipeline = make_pipeline()
+        pipeline.status_pacing_seconds = 0.0
+        elapsed, events = run_pipe(pipeline)
+        self.assertTrue(any(isinstance(event, str) and "СВОДКА РЕШЕНИЙ" in event for event in events))
+        self.assertGreaterEqual(elapsed, BACKEND_TOTAL)
+        self.assertLess(elapsed, BACKEND_TOTAL + TOLERANCE)
+
+    def test_pacing_only_tops_up_fast_events(self):
+        # Интервал меньше любой задержки бэкенда почти ничего не добавляет:
+        # досыпается только остаток после быстрых событий статуса
+        pipeline = make_pipeline()
+        pipeline.status_pacing_seconds = 0.01
+        elapsed, events = run_pipe(pipeline)
+        self.assertLess(elapsed, BACKEND_TOTAL + len(events) * 0.01 + TOLERANCE)
+
+
+if __name__ == "__main__":
+    unittest.main()
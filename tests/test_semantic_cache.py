@@ -0,0 +1,76 @@
+"""Семантический кэш file_search: разные пункты под общим запросом не совпадают.
+
+Запуск: python -m pytest -q tests (или python -m unittest discover tests)
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from SKAI import Pipeline  # noqa: E402
+
+# Длинный общий запрос, как его генерирует LLM для всей повестки
+GLOBAL_QUERIES = {
+    "vnd_query": (
+        "Проверьте соответствие вопроса повестки внутренним нормативным документам "
+        "общества: уставу, положению о совете директоров, положению о правлении, "
+        "политикам корпоративного управления, порядку одобрения решений и полномочиям органов"
+    ),
+    "legal_query": "Проверьте соответствие законодательству Республики Казахстан",
+    "web_query": "Репутационные риски",
+}
+
+
+def make_pipeline() -> Pipeline:
+    pipeline = Pipeline()
+    pipeline.debug = False
+    pipeline.cache_enabled = True
+    pipeline.semantic_cache_enabled = True
+    pipeline.vector_store_check_seconds = 0
+    pipeline.requests = []
+
+    def backend(source, request):
+        pipeline.requests.append(request["input"])
+        return f"Ответ {len(pipeline.requests)}"
+
+    pipeline._cached_response_text = backend
+    return pipeline
+
+
+def analyze(pipeline: Pipeline, item: str):
+    payload = pipeline._agent_payloads(GLOBAL_QUERIES, item)["internal_docs"]
+    return pipeline._analyze_internal_compliance(payload)
+
+
+class SemanticCacheTest(unittest.TestCase):
+    def test_distinct_items_under_same_query_miss(self):
+        pipeline = make_pipeline()
+        first = analyze(pipeline, "Об утверждении Политики управления рисками")
+        second = analyze(pipeline, "О назначении Председателя Правления")
+        self.assertEqual(len(pipeline.requests), 2)
+        self.assertNotEqual(first["response"], second["response"])
+        self.assertEqual(pipeline.cache_stats()["totals"]["semantic_hits"], 0)
+
+    def test_rephrased_item_hits(self):
+        pipeline = make_pipeline()
+        first = analyze(pipeline, "Об утверждении Политики управления рисками")
+        second = analyze(pipeline, "Об утверждении политики управления рисками.")
+        self.assertEqual(len(pipeline.requests), 1)
+        self.assertEqual(first["response"], second["response"])
+
+    def test_same_item_under_other_query_misses(self):
+        pipeline = make_pipeline()
+        item = "Об утверждении Политики управления рисками"
+        analyze(pipeline, item)
+        payload = pipeline._agent_payloads(
+            dict(GLOBAL_QUERIES, vnd_query="Проверьте полномочия органов"), item
+        )["internal_docs"]
+        pipeline._analyze_internal_compliance(payload)
+        self.assertEqual(len(pipeline.requests), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""Потоковый синтез: слот провайдера занят, пока читается поток, и освобождается после.
+
+Запуск: python -m pytest -q tests (или python -m unittest discover tests)
+"""
+
+import asyncio
+import os
+import sys
+import types
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from SKAI import Pipeline  # noqa: E402
+
+DELTAS = ["Решение: ЗА\n", "Обоснование: Нарушений нет.\n", "Риски: Низкие.\nРекомендации: Нет."]
+
+
+def stream_events():
+    for delta in DELTAS:
+        yield types.SimpleNamespace(type="response.output_text.delta", delta=delta)
+
+
+async def astream_events():
+    for event in stream_events():
+        yield event
+
+
+def fake_client(events):
+    def create(**kwargs):
+        return types.SimpleNamespace(headers={}, parse=lambda: events())
+
+    async def acreate(**kwargs):
+        return create(**kwargs)
+
+    raw = types.SimpleNamespace(create=acreate if events is astream_events else create)
+    return types.SimpleNamespace(responses=types.SimpleNamespace(with_raw_response=raw))
+
+
+def make_pipeline() -> Pipeline:
+    pipeline = Pipeline()
+    pipeline.debug = False
+    pipeline.cache_enabled = False
+    pipeline.provider_concurrency["openai"] = 1
+    pipeline._openai = lambda: fake_client(stream_events)
+    pipeline._async_openai = lambda: fake_client(astream_events)
+    return pipeline
+
+
+class StreamingSlotTest(unittest.TestCase):
+    def test_slot_is_held_until_stream_is_exhausted(self):
+        pipeline = make_pipeline()
+        item = pipeline._overall_item("1. Об утверждении бюджета")
+        stream = pipeline._synthesize_decision_stream(item, {})
+        held = []
+        try:
+            while True:
+                next(stream)
+                slot = pipeline._provider_slots["openai"]
+                free = slot.acquire(blocking=False)
+                if free:
+                    slot.release()
+                held.append(not free)
+        except StopIteration as stop:
+            decision = stop.value
+        self.assertEqual(decision["decision"], "ЗА")
+        self.assertEqual(held, [True] * len(DELTAS))
+        self.assertTrue(pipeline._provider_slots["openai"].acquire(blocking=False))
+
+    def test_closing_stream_early_releases_slot(self):
+        pipeline = make_pipeline()
+        stream = pipeline._synthesize_decision_stream(pipeline._overall_item("1. Пункт"), {})
+        next(stream)
+        stream.close()
+        self.assertTrue(pipeline._provider_slots["openai"].acquire(blocking=False))
+
+    def test_async_slot_is_held_until_stream_is_exhausted(self):
+        pipeline = make_pipeline()
+
+        async def run():
+            item = pipeline._overall_item("1. Об утверждении бюджета")
+            outcome, held = {}, []
+            async for _ in pipeline._asynthesize_decision_stream(item, {}, outcome):
+                held.append(pipeline._aprovider_slot("openai").locked())
+            return outcome, held, pipeline._aprovider_slot("openai").locked()
+
+        outcome, held, locked_after = asyncio.run(run())
+        self.assertEqual(outcome["decision_result"]["decision"], "ЗА")
+        self.assertEqual(held, [True] * len(DELTAS))
+        self.assertFalse(locked_after)
+
+
+if __name__ == "__main__":
+    unittest.main()